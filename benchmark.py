@@ -0,0 +1,506 @@
+"""
+Benchmarks do banco de dados.
+
+Uso:
+    python benchmark.py [cache] [transaction] [formats] [statistics] [memory] [actor] [loop] [button] [snapshot] [tickets]
+
+Cada benchmark gera um database.json sintético (e o segmento de participantes)
+em um diretório temporário, portanto não toca no banco de dados real do bot.
+"""
+import asyncio
+import itertools
+import json
+import os
+import random
+import re
+import sys
+import tempfile
+import time
+import tracemalloc
+import types
+from typing import Any, Callable, Dict, List, Optional
+
+import database as db
+
+SIZES = (1_000, 10_000, 100_000)
+
+def make_data(n: int) -> Dict[str, Any]:
+    """Gera um banco de dados com n participantes no formato atual."""
+    data = db._default_data()
+    data["hashtag"]["value"] = "#SORTEIO"
+    roles = {
+        str(1430000000000000000 + i): {"quantity": 1, "abbreviation": f"R{i}"}
+        for i in range(5)
+    }
+    data["bonus_roles"] = roles
+    role_ids = list(roles)
+    for i in range(n):
+        uid = str(1000000000000000000 + i)
+        data["participants"][uid] = {
+            "first_name": f"Nome{i}",
+            "last_name": f"Sobrenome{i}",
+            "tickets": {
+                "base": 1,
+                "roles": [int(rid) for rid in role_ids[: i % 4]],
+                "tag": i % 2,
+            },
+            "message_id": 1436000000000000000 + i,
+            "timestamp": "2025-11-06T22:53:09.518276",
+        }
+    return data
+
+def use_temp_database(data: Dict[str, Any]) -> str:
+    """
+    Grava data em arquivos temporários (um por segmento) e aponta o módulo
+    database para eles.
+    """
+    data = dict(data)
+    participants = data.pop("participants")
+    fd, path = tempfile.mkstemp(suffix=".json")
+    with os.fdopen(fd, "w", encoding="utf-8") as f:
+        json.dump(data, f, indent=4, ensure_ascii=False)
+    with open(db.segment_path(path, db.PARTICIPANTS_SEGMENT), "w", encoding="utf-8") as f:
+        json.dump({"schema_version": db.SCHEMA_VERSION, "participants": participants}, f,
+                  indent=4, ensure_ascii=False)
+    db.DATABASE_FILE = path
+    db._partition().invalidate()
+    return path
+
+def remove_database(path: str):
+    """Remove os arquivos de todos os segmentos (snapshot, backup e diário)."""
+    for segment in db.SEGMENTS:
+        base = db.segment_path(path, segment)
+        for suffix in ("", db.BACKUP_SUFFIX, db.JOURNAL_SUFFIX):
+            if os.path.exists(base + suffix):
+                os.remove(base + suffix)
+
+def per_call(fn: Callable[[], Any], min_time: float = 0.2) -> float:
+    """Tempo médio (em segundos) por chamada de fn."""
+    calls = 0
+    start = time.perf_counter()
+    while True:
+        fn()
+        calls += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_time:
+            return elapsed / calls
+
+def fmt(seconds: float) -> str:
+    if seconds >= 1e-3:
+        return f"{seconds * 1e3:9.2f} ms"
+    return f"{seconds * 1e6:9.2f} µs"
+
+def bench_cache():
+    """Custo por chamada de get_participant: parse completo vs estado em memória."""
+    print(f"{'participantes':>14} {'sem cache':>12} {'com cache':>12} {'ganho':>10}")
+    for n in SIZES:
+        path = use_temp_database(make_data(n))
+        uid = 1000000000000000000 + n // 2
+        try:
+            def uncached():
+                db._partition().invalidate()
+                return db.get_participant(uid)
+
+            cold = per_call(uncached)
+            db.load()
+            warm = per_call(lambda: db.get_participant(uid))
+        finally:
+            remove_database(path)
+        print(f"{n:>14} {fmt(cold):>12} {fmt(warm):>12} {cold / warm:>9.0f}x")
+
+def bench_transaction(n: int = 20_000, sample: int = 50):
+    """Custo de CPU do /atualizar: um update_tickets por participante, com e sem transação."""
+    path = use_temp_database(make_data(n))
+    uids = [int(uid) for uid in db.load()["participants"]]
+    new_tickets = {"base": 1, "tag": 1}
+    try:
+        start = time.process_time()
+        for uid in uids[:sample]:
+            db.update_tickets(uid, dict(new_tickets))
+        per_op = (time.process_time() - start) / sample
+
+        start = time.process_time()
+        with db.transaction():
+            for uid in uids:
+                db.update_tickets(uid, dict(new_tickets))
+        batched = time.process_time() - start
+    finally:
+        remove_database(path)
+    print(f"{n} participantes")
+    print(f"  sem transação: {fmt(per_op)} por update_tickets (~{per_op * n:.0f} s de CPU no total, estimado com {sample})")
+    print(f"  com transação: {fmt(batched)} de CPU no total")
+
+def bench_formats(n: int = 50_000):
+    """Tempo de gravação/leitura e tamanho do snapshot em cada formato."""
+    data = make_data(n)
+    formats = [
+        ("json indentado (antigo)", lambda d: json.dumps(d, indent=4, ensure_ascii=False).encode("utf-8")),
+        ("json compacto", lambda d: db.encode_snapshot(d, db.FORMAT_JSON)),
+    ]
+    if db.orjson is not None:
+        formats.append(("orjson", lambda d: db.encode_snapshot(d, db.FORMAT_ORJSON)))
+    else:
+        print("(orjson não instalado — ignorado)")
+    if db.msgpack is not None:
+        formats.append(("msgpack", lambda d: db.encode_snapshot(d, db.FORMAT_MSGPACK)))
+    else:
+        print("(msgpack não instalado — ignorado)")
+
+    print(f"{n} participantes")
+    print(f"{'formato':>24} {'gravação':>12} {'leitura':>12} {'tamanho':>10}")
+    for name, encode in formats:
+        raw = encode(data)
+        dump = per_call(lambda: encode(data), min_time=1.0)
+        parse = per_call(lambda: db.decode_snapshot(raw), min_time=1.0)
+        print(f"{name:>24} {fmt(dump):>12} {fmt(parse):>12} {len(raw) / 1e6:>7.1f} MB")
+
+def bench_statistics():
+    """Custo de get_statistics: recálculo completo vs contadores mantidos."""
+    print(f"{'participantes':>14} {'recálculo':>12} {'contadores':>12} {'ganho':>10}")
+    for n in SIZES:
+        path = use_temp_database(make_data(n))
+        try:
+            participants = db.load()["participants"]
+            full = per_call(lambda: db._compute_statistics(participants))
+            db.get_statistics()
+            counters = per_call(db.get_statistics)
+        finally:
+            remove_database(path)
+        print(f"{n:>14} {fmt(full):>12} {fmt(counters):>12} {full / counters:>9.0f}x")
+
+def traced(build: Callable[[], Any]) -> tuple:
+    """(objeto, bytes retidos) de build(), medidos com tracemalloc."""
+    tracemalloc.start()
+    try:
+        obj = build()
+        size = tracemalloc.get_traced_memory()[0]
+    finally:
+        tracemalloc.stop()
+    return obj, size
+
+def bench_memory():
+    """Memória dos participantes: dicts do JSON vs registros Participant."""
+    print(f"{'participantes':>14} {'dicts':>10} {'Participant':>12} {'redução':>10}")
+    for n in SIZES:
+        raw = json.dumps(make_data(n)["participants"]).encode("utf-8")
+        dicts, dict_size = traced(lambda: json.loads(raw))
+        del dicts
+        records, record_size = traced(lambda: db._participants_from_json(json.loads(raw)))
+        del records
+        print(f"{n:>14} {dict_size / 1e6:>7.1f} MB {record_size / 1e6:>9.1f} MB {dict_size / record_size:>9.1f}x")
+
+def bench_actor(existing: int = 5_000, concurrent: int = 1_000):
+    """Inscrições concorrentes pelo escritor único (submit) vs uma gravação por inscrição."""
+    first_uid = 2000000000000000000
+
+    async def register(i: int):
+        # simula o await inscricao_channel.send(...) antes de gravar
+        await asyncio.sleep(0)
+        await db.submit(db.add_participant, first_uid + i, f"Novo{i}", f"Inscrito{i}", {"base": 1}, i)
+
+    async def burst():
+        await asyncio.gather(*(register(i) for i in range(concurrent)))
+
+    path = use_temp_database(make_data(existing))
+    try:
+        start = time.perf_counter()
+        for i in range(concurrent // 10):
+            db.add_participant(first_uid + i, f"Novo{i}", f"Inscrito{i}", {"base": 1}, i)
+        direct = (time.perf_counter() - start) / (concurrent // 10)
+    finally:
+        remove_database(path)
+
+    path = use_temp_database(make_data(existing))
+    try:
+        batches_before = db._actor.batches
+        start = time.perf_counter()
+        asyncio.run(burst())
+        elapsed = time.perf_counter() - start
+        batches = db._actor.batches - batches_before
+        # relê do disco para contar o que de fato foi gravado
+        db._partition().invalidate()
+        participants = db.load()["participants"]
+        stored = sum(1 for i in range(concurrent) if first_uid + i in participants)
+    finally:
+        remove_database(path)
+    print(f"{existing} participantes existentes, {concurrent} inscrições concorrentes")
+    print(f"  uma gravação por inscrição: {concurrent * direct:.2f} s ({1 / direct:.0f} inscrições/s, estimado com {concurrent // 10})")
+    print(f"  escritor único (submit):    {elapsed:.2f} s ({concurrent / elapsed:.0f} inscrições/s, {batches} gravação(ões))")
+    print(f"  gravadas: {stored}/{concurrent} (perdidas: {concurrent - stored})")
+
+def bench_loop(n: int = 50_000, concurrent: int = 1_000):
+    """Maior tempo que o event loop fica preso no banco durante uma rajada de inscrições."""
+    worst: Dict[str, float] = {}
+
+    def timed(name: str, fn: Callable) -> Callable:
+        def wrapper(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                return fn(*args, **kwargs)
+            finally:
+                worst[name] = max(worst.get(name, 0.0), time.perf_counter() - start)
+        return wrapper
+
+    readers = {
+        "ais_registered": db.is_registered,
+        "ais_name_taken": db.is_name_taken,
+        "aget_participant": db.get_participant,
+    }
+    first_uid = 2000000000000000000
+
+    async def register(i: int):
+        await asyncio.sleep(0)
+        if not await api["ais_registered"](first_uid + i) and not await api["ais_name_taken"](f"Novo{i}", "Inscrito"):
+            await db.aadd_participant(first_uid + i, f"Novo{i}", "Inscrito", {"base": 1}, i)
+        await api["aget_participant"](first_uid + i)
+
+    async def burst():
+        # a primeira leitura carrega o arquivo e monta os índices na thread de E/S
+        await db.aget_hashtag()
+        await asyncio.gather(*(register(i) for i in range(concurrent)))
+
+    api = {name: db._async_reader(timed(name, fn)) for name, fn in readers.items()}
+    apply = db._actor._apply
+    db._actor._apply = timed("grupo do escritor único", apply)
+    path = use_temp_database(make_data(n))
+    try:
+        asyncio.run(burst())
+    finally:
+        db._actor._apply = apply
+        remove_database(path)
+    print(f"{n} participantes, {concurrent} inscrições concorrentes (DB_ACTOR_MAX_BATCH={db._actor.max_batch})")
+    for name, seconds in worst.items():
+        print(f"  {name:>24}: {fmt(seconds)} no pior caso")
+
+def bench_button():
+    """
+    Latência de um clique no botão de inscrição (blacklist, inscrições encerradas e
+    inscrição já feita) com o estado frio e em memória, comparada com a carga
+    completa que o clique exigia antes da separação em segmentos.
+    """
+    uid = 3000000000000000000
+
+    async def click():
+        blacklist = await db.aget_blacklist()
+        blacklist.get(str(uid))
+        await db.aget_inscricoes_closed()
+        await db.apeek_registered(uid)
+
+    loop = asyncio.new_event_loop()
+    print(f"{'participantes':>14} {'carga completa':>15} {'clique frio':>12} {'clique':>12}")
+    try:
+        for n in SIZES:
+            path = use_temp_database(make_data(n))
+            try:
+                def full_load():
+                    db._partition().invalidate()
+                    db.load()
+
+                def cold_click():
+                    db._partition().invalidate()
+                    loop.run_until_complete(click())
+
+                full = per_call(full_load)
+                cold = per_call(cold_click)
+                warm = per_call(lambda: loop.run_until_complete(click()))
+            finally:
+                remove_database(path)
+            print(f"{n:>14} {fmt(full):>15} {fmt(cold):>12} {fmt(warm):>12}")
+    finally:
+        loop.close()
+
+def bench_snapshot():
+    """
+    Visão consistente dos participantes para /lista e /exportar: recarregar o
+    arquivo, copiar o dict e snapshot(); e o custo de uma alteração sem snapshot em
+    uso e de uma alteração com um snapshot vivo (cópia rasa do copy-on-write).
+    """
+    uid = 1000000000000000000
+    toggle = itertools.cycle(({"base": 1}, {"base": 1, "tag": 1}))
+
+    def write():
+        db.update_tickets(uid, next(toggle))
+
+    def write_with_snapshot():
+        snap = db.snapshot()
+        db.update_tickets(uid, next(toggle))
+        return snap
+
+    print(f"{'participantes':>14} {'recarga':>12} {'cópia':>12} {'snapshot':>12} "
+          f"{'alteração':>12} {'alt. c/ snap':>13}")
+    # alterações só em memória: a gravação não entra na medição
+    db.configure_write_behind(True, 3600, 10 ** 9)
+    try:
+        for n in SIZES:
+            path = use_temp_database(make_data(n))
+            try:
+                def reload():
+                    db._partition().invalidate()
+                    db.load()
+
+                reloaded = per_call(reload)
+                participants = db.get_all_participants()
+                copy = per_call(lambda: dict(participants))
+                snap = per_call(db.snapshot)
+                plain = per_call(write)
+                cow = per_call(write_with_snapshot)
+                db.flush()
+            finally:
+                remove_database(path)
+            print(f"{n:>14} {fmt(reloaded):>12} {fmt(copy):>12} {fmt(snap):>12} "
+                  f"{fmt(plain):>12} {fmt(cow):>13}")
+    finally:
+        db.configure_write_behind(False)
+
+# utils._clean_text e utils.calculate_tickets como estavam antes das regras
+# compiladas, copiadas sem alteração (só os nomes mudam): a referência do benchmark
+def _shipped_clean_text(s: Optional[str]) -> str:
+    if not s:
+        return ""
+    # remove emojis/caracteres especiais mantendo letras/números/espacos
+    return re.sub(r'[^\w\s]', '', s).strip().casefold()
+
+def _shipped_calculate_tickets(
+    member,
+    bonus_roles: Dict[str, Any],
+    tag_enabled: bool,
+    tag_text: Optional[str],
+    tag_quantity: int,
+    manual_tag: Optional[int] = None
+) -> Dict[str, Any]:
+    """
+    Calcula o dicionário de 'tickets' para um membro.
+    - bonus_roles: dict do DB com keys = role_id (str) -> {quantity, abbreviation}
+    - tickets['roles'] guarda só os ids (int) dos cargos bônus do membro; quantidade e
+      abreviação são resolvidas na hora de somar/listar (ver db.get_role_lookup()).
+    - Detecta TAGs tanto em nomes (nick/display/global/name) quanto em roles (role.name).
+    - Se manual_tag for fornecido, ele será incluído em tickets['manual_tag'] (útil ao recalcular).
+    """
+    tickets: Dict[str, Any] = {}
+    tickets["base"] = 1
+
+    # roles -> apenas os ids dos cargos bônus
+    role_ids: List[int] = []
+    try:
+        member_roles = getattr(member, "roles", []) or []
+        for r in member_roles:
+            if str(r.id) in bonus_roles:
+                role_ids.append(r.id)
+    except Exception:
+        # membro pode ser discord.User (sem roles) — ignora roles
+        member_roles = []
+
+    if role_ids:
+        tickets["roles"] = role_ids
+
+    # Detecção da TAG automática em vários campos do membro
+    found = False
+    if tag_enabled and tag_text:
+        tag_search = tag_text.strip()
+        tag_clean = _shipped_clean_text(tag_search)
+
+        # 1) checa nomes (display_name, nick, global_name, name)
+        checks = []
+        if hasattr(member, "display_name"):
+            checks.append(getattr(member, "display_name", "") or "")
+        if hasattr(member, "nick"):
+            checks.append(getattr(member, "nick", "") or "")
+        if hasattr(member, "global_name"):
+            checks.append(getattr(member, "global_name", "") or "")
+        checks.append(getattr(member, "name", "") or "")
+
+        for field in checks:
+            if not field:
+                continue
+            f_raw = field.strip().casefold()
+            f_clean = _shipped_clean_text(field)
+            if tag_search.casefold() in f_raw or (tag_clean and tag_clean in f_clean):
+                found = True
+                break
+
+        # 2) se não achou nos nomes, checa roles (role.name)
+        if not found:
+            try:
+                for r in member_roles:
+                    rn = (r.name or "").strip()
+                    if not rn:
+                        continue
+                    # compara exatidão ou substring, case-insensitive
+                    if tag_search.casefold() == rn.casefold() or tag_search.casefold() in rn.casefold():
+                        found = True
+                        break
+            except Exception:
+                pass
+
+        if found:
+            tickets["tag"] = int(tag_quantity or 1)
+
+    # Mescla manual_tag se fornecido (útil ao recalcular mantendo o valor manual do DB)
+    if manual_tag is not None and int(manual_tag) > 0:
+        tickets["manual_tag"] = int(manual_tag)
+
+    return tickets
+
+def make_members(n: int, roles: list, seed: int = 1) -> list:
+    """Membros sintéticos (atributos usados pelo cálculo de fichas), ~5% com a TAG no nome."""
+    rng = random.Random(seed)
+    members = []
+    for i in range(n):
+        nick = rng.choice(("[CLAN] Nome", "C★LAN nome", None)) if rng.random() < 0.05 else rng.choice((None, f"Apelido{i} 🎮"))
+        members.append(types.SimpleNamespace(
+            id=1000000000000000000 + i,
+            name=f"usuario_{i}",
+            global_name=f"Usuário {i}",
+            nick=nick,
+            display_name=nick or f"Usuário {i}",
+            roles=rng.sample(roles, rng.randint(1, 8))
+        ))
+    return members
+
+def bench_tickets(n: int = 50_000):
+    """
+    Cálculo de fichas do /atualizar para n membros: utils.calculate_tickets como era
+    antes das regras compiladas vs regras compiladas uma vez (utils.TicketRules).
+    """
+    import utils  # requer discord.py
+
+    roles = [types.SimpleNamespace(id=1430000000000000000 + i, name=f"Cargo {i}") for i in range(40)]
+    bonus_roles = {str(role.id): {"quantity": 1, "abbreviation": f"R{i}"} for i, role in enumerate(roles[:5])}
+    tag = {"enabled": True, "tags": [{"text": "[CLAN]", "quantity": 2}]}
+    members = make_members(n, roles)
+
+    start = time.perf_counter()
+    before = [_shipped_calculate_tickets(m, bonus_roles, tag["enabled"], "[CLAN]", 2) for m in members]
+    per_member = time.perf_counter() - start
+
+    start = time.perf_counter()
+    rules = utils.get_ticket_rules(((None, None), 0), bonus_roles, tag)
+    after = [rules.calculate(m) for m in members]
+    compiled = time.perf_counter() - start
+
+    # tickets['tags'] (TAGs encontradas) não existia no cálculo anterior
+    assert before == [{k: v for k, v in t.items() if k != "tags"} for t in after], \
+        "regras compiladas divergem do cálculo anterior"
+    print(f"{n} membros ({sum('tag' in t for t in after)} com TAG)")
+    print(f"  cálculo original:     {fmt(per_member)} ({fmt(per_member / n)} por membro)")
+    print(f"  regras compiladas:    {fmt(compiled)} ({fmt(compiled / n)} por membro)")
+    print(f"  ganho: {per_member / compiled:.1f}x")
+
+BENCHMARKS = {
+    "cache": bench_cache,
+    "transaction": bench_transaction,
+    "formats": bench_formats,
+    "statistics": bench_statistics,
+    "memory": bench_memory,
+    "actor": bench_actor,
+    "loop": bench_loop,
+    "button": bench_button,
+    "snapshot": bench_snapshot,
+    "tickets": bench_tickets,
+}
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(BENCHMARKS)
+    for name in names:
+        print(f"== {name} ==")
+        BENCHMARKS[name]()
@@ -1,10 +1,11 @@
+import asyncio
 import database as db
 import discord
 import os
 import logging
 import utils
 import io
-from typing import Literal
+from typing import Dict, Literal
 from datetime import datetime
 from discord import app_commands
 from discord.ext import commands
@@ -33,7 +34,12 @@ def health():
             bot_name = bot_obj.user.name
     except Exception:
         bot_name = "connecting"
-    return jsonify({"status": "healthy", "bot": bot_name}), 200
+    return jsonify({
+        "status": "healthy",
+        "bot": bot_name,
+        "storage": db.get_persistence_stats(),
+        "ticket_refresh": ticket_refresher.stats
+    }), 200
 
 def run_flask():
     port = int(os.getenv("PORT", 5000))
@@ -41,6 +47,15 @@ def run_flask():
 
 load_dotenv()
 
+# ativa os modos de persistência do banco se configurados (DB_BACKEND, DB_WRITE_BEHIND, DB_STORAGE_MODE etc.)
+db.configure_backend()
+db.configure_format()
+db.configure_write_behind()
+db.configure_journal()
+db.configure_statistics()
+db.configure_partitions()
+db.configure_click_filter()
+
 # Adição: imports de typing (se ainda não existirem) e criação da instância do bot
 from typing import Optional, Literal
 
@@ -49,7 +64,70 @@ intents.members = True
 intents.message_content = True
 intents.guilds = True
 
-bot = commands.Bot(command_prefix="!", intents=intents)
+class GuildCommandTree(app_commands.CommandTree):
+    """
+    Seleciona os dados do servidor da interação antes de qualquer comando, no
+    sorteio escolhido com /sorteio usar.
+    """
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        db.use_guild(interaction.guild_id)
+        if interaction.guild_id is not None:
+            db.use_raffle(await db.aget_selected_raffle())
+        return True
+
+class GuildView(discord.ui.View):
+    """
+    View cujos botões usam os dados do servidor da interação, no sorteio que
+    estava selecionado quando a view foi criada.
+    """
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.raffle = db.current_raffle()
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        db.use_guild(interaction.guild_id)
+        db.use_raffle(self.raffle)
+        return True
+
+def raffle_label(raffle: Optional[str], raffles: dict) -> str:
+    """Nome de exibição de um sorteio (o sorteio padrão aparece como db.DEFAULT_RAFFLE)."""
+    if raffle is None:
+        return db.DEFAULT_RAFFLE
+    return (raffles.get(raffle) or {}).get("name") or raffle
+
+def raffle_custom_id(custom_id: str, raffle: Optional[str]) -> str:
+    """custom_id de um botão de inscrição do sorteio (sem sufixo no sorteio padrão)."""
+    return f"{custom_id}:{raffle}" if raffle else custom_id
+
+def raffle_from_custom_id(custom_id: Optional[str]) -> Optional[str]:
+    """Sorteio de um botão de inscrição a partir do custom_id ("inscricao_button:natal" -> "natal")."""
+    _, _, raffle = (custom_id or "").partition(":")
+    return raffle or None
+
+class RaffleView(GuildView):
+    """
+    View persistente dos botões de inscrição. O custom_id de cada botão leva o
+    sorteio, então um único registro por sorteio (bot.add_view) atende todas as
+    mensagens dele e cada clique é direcionado ao sorteio certo.
+    """
+    def __init__(self, raffle: Optional[str] = None):
+        super().__init__(timeout=None)
+        self.raffle = raffle
+        for item in self.children:
+            item.custom_id = raffle_custom_id(item.custom_id, raffle)
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        db.use_guild(interaction.guild_id)
+        db.use_raffle(raffle_from_custom_id((interaction.data or {}).get("custom_id")))
+        if not await db.araffle_exists(db.current_raffle()):
+            await interaction.response.send_message(
+                "❌ Este sorteio não existe neste servidor.",
+                ephemeral=True
+            )
+            return False
+        return True
+
+bot = commands.Bot(command_prefix="!", intents=intents, tree_cls=GuildCommandTree)
 
 logging.basicConfig(
     level=logging.INFO,
@@ -79,17 +157,33 @@ class InscricaoModal(discord.ui.Modal, title="Inscrição no Sorteio"):
         max_length=100
     )
     
+    def __init__(self, raffle: Optional[str] = None):
+        super().__init__()
+        self.raffle = raffle
+    
+    async def interaction_check(self, interaction: discord.Interaction) -> bool:
+        db.use_guild(interaction.guild_id)
+        db.use_raffle(self.raffle)
+        return True
+    
     async def on_submit(self, interaction: discord.Interaction):
         try:
             await interaction.response.defer(ephemeral=True)
             
-            if db.is_blacklisted(interaction.user.id):
+            if await db.ais_blacklisted(interaction.user.id):
                 await interaction.followup.send(
                     "❌ Você está na blacklist e não pode se inscrever.",
                     ephemeral=True
                 )
                 return
             
+            if await db.ais_registered(interaction.user.id):
+                await interaction.followup.send(
+                    "❌ Você já está inscrito no sorteio!",
+                    ephemeral=True
+                )
+                return
+            
             first_name = self.primeiro_nome.value.strip()
             last_name = self.sobrenome.value.strip()
             hashtag_input = self.hashtag.value.strip()
@@ -99,14 +193,14 @@ class InscricaoModal(discord.ui.Modal, title="Inscrição no Sorteio"):
                 await interaction.followup.send(error_msg, ephemeral=True)
                 return
             
-            if db.is_name_taken(first_name, last_name):
+            if await db.ais_name_taken(first_name, last_name):
                 await interaction.followup.send(
                     "❌ Este nome já foi registrado por outro participante.",
                     ephemeral=True
                 )
                 return
             
-            required_hashtag = db.get_hashtag()
+            required_hashtag = await db.aget_hashtag()
             if not required_hashtag:
                 await interaction.followup.send(
                     "⚠️ Nenhuma hashtag foi configurada ainda. Contate um administrador.",
@@ -121,7 +215,7 @@ class InscricaoModal(discord.ui.Modal, title="Inscrição no Sorteio"):
                 )
                 return
             
-            inscricao_channel_id = db.get_inscricao_channel()
+            inscricao_channel_id = await db.aget_inscricao_channel()
             if not inscricao_channel_id:
                 await interaction.followup.send(
                     "⚠️ Canal de inscrições não configurado. Contate um administrador.",
@@ -137,29 +231,26 @@ class InscricaoModal(discord.ui.Modal, title="Inscrição no Sorteio"):
                 )
                 return
             
-            bonus_roles = db.get_bonus_roles()
-            tag_config = db.get_tag()
+            rules = utils.get_ticket_rules(
+                await db.aget_config_version(),
+                await db.aget_bonus_roles(),
+                await db.aget_tag()
+            )
             
             member = interaction.user
             if isinstance(member, discord.User):
                 member = interaction.guild.get_member(interaction.user.id)
             
-            tickets = utils.calculate_tickets(
-                member,
-                bonus_roles,
-                tag_config["enabled"],
-                tag_config["text"],
-                tag_config["quantity"]
-            )
+            tickets = rules.calculate(member)
             
-            total_tickets = utils.get_total_tickets(tickets)
+            total_tickets = utils.get_total_tickets(tickets, await db.aget_role_lookup())
             
             msg_content = f"{member.mention}\n{first_name} {last_name}\n{required_hashtag}"
             
             msg = await inscricao_channel.send(msg_content)
             await msg.add_reaction("✅")  # Adiciona reação de verificado
             
-            db.add_participant(
+            await db.aadd_participant(
                 interaction.user.id,
                 first_name,
                 last_name,
@@ -179,9 +270,9 @@ class InscricaoModal(discord.ui.Modal, title="Inscrição no Sorteio"):
             except:
                 pass
 
-class InscricaoView(discord.ui.View):
-    def __init__(self, show_verify: bool = True):
-        super().__init__(timeout=None)
+class InscricaoView(RaffleView):
+    def __init__(self, show_verify: bool = True, raffle: Optional[str] = None):
+        super().__init__(raffle)
 
         # se show_verify for False, removemos o botão "Verificar minha inscrição"
         if not show_verify:
@@ -189,7 +280,7 @@ class InscricaoView(discord.ui.View):
             for item in list(self.children):
                 label = getattr(item, "label", "")
                 cid = getattr(item, "custom_id", None)
-                if cid == "verificar_button" or label == "Verificar minha inscrição":
+                if cid == raffle_custom_id("verificar_button", raffle) or label == "Verificar minha inscrição":
                     self.remove_item(item)
 
     @discord.ui.button(
@@ -198,15 +289,13 @@ class InscricaoView(discord.ui.View):
         custom_id="inscricao_button"
     )
     async def inscricao_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        # filtro de Bloom: quem com certeza não está inscrito nem na blacklist (a maioria
+        # dos cliques) dispensa as consultas exatas abaixo
+        screen = await db.ascreen_click(interaction.user.id)
+
         # verifica blacklist antes de tudo
         try:
-            entry = None
-            try:
-                bl = db.get_blacklist()
-            except Exception:
-                bl = None
-            if bl:
-                entry = bl.get(str(interaction.user.id)) or bl.get(interaction.user.id)
+            entry = await db.aget_blacklist_entry(interaction.user.id) if screen is not False else None
             if entry:
                 reason = entry.get("reason", "Não especificado")
                 # enviar mensagem simples (sem embed e sem mostrar quem baniu)
@@ -221,7 +310,7 @@ class InscricaoView(discord.ui.View):
 
         # impede inscrições quando encerrado
         try:
-            if db.get_inscricoes_closed():
+            if await db.aget_inscricoes_closed():
                 await interaction.response.send_message(
                     "❌ As inscrições estão encerradas no momento.",
                     ephemeral=True
@@ -231,13 +320,15 @@ class InscricaoView(discord.ui.View):
             # se DB não tiver a função, continua (compatibilidade)
             pass
 
-        if db.is_registered(interaction.user.id):
+        # só a configuração é lida aqui; se os participantes ainda não estiverem em
+        # memória, a inscrição é conferida no envio do formulário
+        if screen is not False and await db.apeek_registered(interaction.user.id):
             await interaction.response.send_message(
                 "❌ Você já está inscrito no sorteio!",
                 ephemeral=True
             )
             return
-        modal = InscricaoModal()
+        modal = InscricaoModal(db.current_raffle())
         await interaction.response.send_modal(modal)
 
     @discord.ui.button(
@@ -247,7 +338,7 @@ class InscricaoView(discord.ui.View):
     )
     async def verificar_button(self, interaction: discord.Interaction, button: discord.ui.Button):
         # reutiliza a mesma lógica do comando /verificar para garantir igualdade
-        participant = db.get_participant(interaction.user.id)
+        participant = await db.aget_participant(interaction.user.id)
         if not participant:
             await interaction.response.send_message(
                 "❌ Você não está inscrito no sorteio.",
@@ -255,10 +346,11 @@ class InscricaoView(discord.ui.View):
             )
             return
 
-        first_name = participant["first_name"]
-        last_name = participant["last_name"]
-        tickets = participant["tickets"]
-        total_tickets = utils.get_total_tickets(tickets)
+        first_name = participant.first_name
+        last_name = participant.last_name
+        tickets = participant.tickets
+        role_lookup = await db.aget_role_lookup()
+        total_tickets = utils.get_total_tickets(tickets, role_lookup)
 
         embed = discord.Embed(
             title="✅ Seu Status de Inscrição",
@@ -268,7 +360,7 @@ class InscricaoView(discord.ui.View):
 
         embed.add_field(name="Total de Fichas", value=f"🎫 {total_tickets}", inline=False)
 
-        tickets_list = utils.format_tickets_list(tickets, interaction.guild)
+        tickets_list = utils.format_tickets_list(tickets, interaction.guild, role_lookup)
         embed.add_field(
             name="Detalhamento",
             value="\n".join(tickets_list),
@@ -277,9 +369,9 @@ class InscricaoView(discord.ui.View):
 
         await interaction.response.send_message(embed=embed, ephemeral=True)
 
-class InscricaoButton(discord.ui.View):
-    def __init__(self):
-        super().__init__(timeout=None)
+class InscricaoButton(RaffleView):
+    def __init__(self, raffle: Optional[str] = None):
+        super().__init__(raffle)
     
     @discord.ui.button(
         label="Inscrever-se no Sorteio",
@@ -287,15 +379,13 @@ class InscricaoButton(discord.ui.View):
         custom_id="inscricao_button"
     )
     async def inscricao_button(self, interaction: discord.Interaction, button: discord.ui.Button):
+        # filtro de Bloom: quem com certeza não está inscrito nem na blacklist (a maioria
+        # dos cliques) dispensa as consultas exatas abaixo
+        screen = await db.ascreen_click(interaction.user.id)
+
         # verifica blacklist antes de tudo (view alternativa)
         try:
-            entry = None
-            try:
-                bl = db.get_blacklist()
-            except Exception:
-                bl = None
-            if bl:
-                entry = bl.get(str(interaction.user.id)) or bl.get(interaction.user.id)
+            entry = await db.aget_blacklist_entry(interaction.user.id) if screen is not False else None
             if entry:
                 reason = entry.get("reason", "Não especificado")
                 # mensagem simples (sem embed e sem exibir quem baniu)
@@ -309,7 +399,7 @@ class InscricaoButton(discord.ui.View):
 
         # impede inscrições quando encerrado
         try:
-            if db.get_inscricoes_closed():
+            if await db.aget_inscricoes_closed():
                 await interaction.response.send_message(
                     "❌ As inscrições estão encerradas no momento.",
                     ephemeral=True
@@ -318,43 +408,53 @@ class InscricaoButton(discord.ui.View):
         except Exception:
             pass
 
-        if db.is_registered(interaction.user.id):
+        # só a configuração é lida aqui; se os participantes ainda não estiverem em
+        # memória, a inscrição é conferida no envio do formulário
+        if screen is not False and await db.apeek_registered(interaction.user.id):
             await interaction.response.send_message(
                 "❌ Você já está inscrito no sorteio!",
                 ephemeral=True
             )
             return
-        modal = InscricaoModal()
+        modal = InscricaoModal(db.current_raffle())
         await interaction.response.send_modal(modal)
 
 @bot.event
 async def on_ready():
     logger.info(f"Bot conectado como {bot.user}")
     
+    # dados da versão de um único servidor: passam para o servidor dono do canal de inscrições
     try:
-        button_msg_id = db.get_button_message_id()
-        # normaliza para lista (aceita int, str, list)
-        button_ids = []
-        if isinstance(button_msg_id, (list, tuple)):
-            button_ids = list(button_msg_id)
-        elif button_msg_id:
-            button_ids = [button_msg_id]
-        if button_ids:
-            for mid in button_ids:
-                try:
-                    bot.add_view(InscricaoView(), message_id=int(mid))
-                except Exception:
-                    # continua mesmo se algum message_id inválido
-                    continue
-            logger.info(f"View do botão re-registrada para message_id(s): {button_ids}")
+        if db.has_legacy_database():
+            channel_id = await db.aget_inscricao_channel()
+            owner = next((g for g in bot.guilds if channel_id and g.get_channel(channel_id)), None)
+            if owner is None and len(bot.guilds) == 1:
+                owner = bot.guilds[0]
+            if owner is not None:
+                db.adopt_legacy_database(owner.id)
+            else:
+                logger.warning(f"Não foi possível identificar o servidor dono de {db.DATABASE_FILE}")
     except Exception as e:
-        logger.error(f"Erro ao re-registrar view: {e}")
+        logger.error(f"Erro ao migrar database para o servidor: {e}")
+    
+    # um registro por sorteio atende todos os botões dele (o custom_id leva o sorteio),
+    # então os sorteios não precisam ser carregados para re-registrar as views
+    raffles = {None}
+    for guild in bot.guilds:
+        try:
+            with db.partition(guild.id):
+                raffles.update(await db.aget_raffles())
+        except Exception as e:
+            logger.error(f"Erro ao listar sorteios de {guild.id}: {e}")
+    for raffle in raffles:
+        bot.add_view(InscricaoView(raffle=raffle))
+    logger.info(f"Views dos botões de inscrição registradas para {len(raffles)} sorteio(s)")
     
     # ---- MOVEI AQUI a tentativa de definir default_member_permissions ANTES do sync ----
     try:
         admin_cmds = [
-            "setup_inscricao","hashtag","tag","fichas","tirar","lista","exportar",
-            "atualizar","estatisticas","limpar","blacklist","chat","anunciar",
+            "sorteio","setup_inscricao","hashtag","tag","fichas","tirar","lista","exportar",
+            "atualizar","estatisticas","limpar","historico","blacklist","chat","anunciar",
             "controle_acesso","tag_manual","sync"
         ]
         for name in admin_cmds:
@@ -383,10 +483,16 @@ async def on_message(message):
     if message.author.bot:
         return
     
-    chat_lock = db.get_chat_lock()
+    if message.guild is None:
+        await bot.process_commands(message)
+        return
+    db.use_guild(message.guild.id)
+    chat_lock = await db.aget_chat_lock()
     if chat_lock["enabled"] and chat_lock["channel_id"]:
         if message.channel.id == chat_lock["channel_id"]:
-            if not message.author.guild_permissions.administrator and not db.is_moderator(message.author.id):
+            author = message.author
+            if (not author.guild_permissions.administrator
+                    and not await db.ais_moderator(author.id, member_role_ids(author))):
                 try:
                     await message.delete()
                 except Exception as e:
@@ -394,6 +500,190 @@ async def on_message(message):
     
     await bot.process_commands(message)
 
+class TicketRefresher:
+    """
+    Mantém as fichas dos participantes em dia quando os cargos ou nomes deles mudam,
+    sem esperar um /atualizar.
+    
+    Os eventos são agrupados por usuário (debounce): cada evento reinicia a espera de
+    TICKET_REFRESH_DELAY segundos e só o último dispara o recálculo, então uma
+    sequência de mudanças de cargo gera uma única gravação. O recálculo só grava nos
+    sorteios em que o usuário está inscrito e se as fichas de fato mudaram.
+    """
+    
+    def __init__(self, delay: float):
+        self.delay = delay
+        # (guild_id, user_id) -> tarefa esperando para recalcular
+        self._pending: Dict[tuple, asyncio.Task] = {}
+        self.stats = {
+            "events": 0,     # eventos de membro/usuário recebidos
+            "ignored": 0,    # eventos sem mudança de cargos/apelido/nome
+            "coalesced": 0,  # eventos absorvidos por um recálculo já agendado
+            "skipped": 0,    # recálculos sem gravação (não inscrito ou fichas iguais)
+            "unloaded": 0,   # sorteios sem participantes em memória (ficam para o /atualizar)
+            "applied": 0,    # fichas regravadas
+            "errors": 0
+        }
+    
+    def schedule(self, guild_id: int, user_id: int) -> None:
+        """Agenda (ou reinicia a espera de) um recálculo do usuário no servidor."""
+        key = (guild_id, user_id)
+        pending = self._pending.pop(key, None)
+        if pending is not None:
+            pending.cancel()
+            self.stats["coalesced"] += 1
+        self._pending[key] = asyncio.create_task(self._run(key))
+    
+    async def _run(self, key: tuple) -> None:
+        await asyncio.sleep(self.delay)
+        # daqui em diante um novo evento agenda outro recálculo em vez de cancelar este
+        self._pending.pop(key, None)
+        try:
+            await self._refresh(*key)
+        except Exception as e:
+            self.stats["errors"] += 1
+            logger.error(f"Erro ao recalcular fichas do usuário {key[1]}: {e}")
+    
+    async def _refresh(self, guild_id: int, user_id: int) -> None:
+        guild = bot.get_guild(guild_id)
+        member = guild.get_member(user_id) if guild else None
+        if member is None:
+            self.stats["skipped"] += 1
+            return
+        # a tarefa tem o próprio contexto: servidor/sorteio selecionados só valem aqui
+        db.use_guild(guild_id)
+        for raffle in [None, *(await db.aget_raffles())]:
+            db.use_raffle(raffle)
+            # consulta O(1) que nunca carrega o segmento de participantes: a maioria
+            # dos membros não está inscrita e não deve forçar a leitura de cada sorteio
+            registered = await db.apeek_registered(user_id)
+            if registered is None:
+                self.stats["unloaded"] += 1
+                continue
+            participant = await db.aget_participant(user_id) if registered else None
+            if participant is None:
+                self.stats["skipped"] += 1
+                continue
+            rules = utils.get_ticket_rules(
+                await db.aget_config_version(),
+                await db.aget_bonus_roles(),
+                await db.aget_tag()
+            )
+            tickets = rules.calculate(member, participant.manual_tag)
+            if utils.same_tickets(participant.tickets, tickets):
+                self.stats["skipped"] += 1
+                continue
+            await db.aupdate_tickets(user_id, tickets)
+            self.stats["applied"] += 1
+            logger.info(f"Fichas de {member} recalculadas no sorteio {raffle or db.DEFAULT_RAFFLE} ({guild_id})")
+
+ticket_refresher = TicketRefresher(float(os.getenv("TICKET_REFRESH_DELAY", "2")))
+
+def write_tickets(changes: Dict[int, dict]) -> tuple:
+    """
+    Grava fichas calculadas fora do escritor único (rodar com db.submit()): uma
+    gravação para todos, com a TAG manual do registro atual (pode ter mudado durante
+    o cálculo). Quem saiu do sorteio nesse meio tempo é ignorado.
+    
+    Returns:
+        (fichas gravadas, participantes que saíram do sorteio)
+    """
+    current = db.get_all_participants()
+    written = removed = 0
+    for user_id, tickets in changes.items():
+        data = current.get(user_id)
+        if data is None:
+            removed += 1
+            continue
+        tickets.pop("manual_tag", None)
+        if data.manual_tag:
+            tickets["manual_tag"] = data.manual_tag
+        if not utils.same_tickets(data.tickets, tickets):
+            db.update_tickets(user_id, tickets)
+            written += 1
+    return written, removed
+
+async def recalculate_tickets(guild: Optional[discord.Guild], select) -> tuple:
+    """
+    Recalcula as fichas de parte dos participantes do sorteio atual depois de uma
+    mudança nas regras, em vez de um /atualizar completo.
+    
+    A seleção e o cálculo leem um snapshot em fatias que devolvem o event loop entre
+    elas; o escritor único só recebe as fichas que mudaram (ver write_tickets()).
+    
+    Args:
+        guild: Servidor (os membros vêm do cache dele)
+        select: select(members, participants, rules) -> membros de uma fatia a recalcular
+        
+    Returns:
+        (participantes recalculados, participantes com fichas alteradas)
+    """
+    if guild is None:
+        return 0, 0
+    
+    snap = await db.asnapshot()
+    participants = snap.participants
+    rules = utils.get_ticket_rules(
+        await db.aget_config_version(),
+        await db.aget_bonus_roles(),
+        await db.aget_tag()
+    )
+    user_ids = list(participants)
+    changes: Dict[int, dict] = {}
+    touched = 0
+    slice_size = 500
+    for start in range(0, len(user_ids), slice_size):
+        # quem saiu do sorteio desde o snapshot não é recalculado
+        current = db.get_all_participants()
+        members = [member for member in map(guild.get_member, user_ids[start:start + slice_size])
+                   if member is not None and member.id in current]
+        for member in select(members, participants, rules):
+            touched += 1
+            data = participants[member.id]
+            tickets = rules.calculate(member, data.manual_tag)
+            if not utils.same_tickets(data.tickets, tickets):
+                changes[member.id] = tickets
+        await asyncio.sleep(0)
+    
+    del snap, participants
+    if not changes:
+        return touched, 0
+    changed, _ = await db.submit(write_tickets, changes)
+    return touched, changed
+
+def role_holders(role: discord.Role):
+    """select de recalculate_tickets(): inscritos que têm o cargo."""
+    return lambda members, participants, rules: [m for m in members if m.get_role(role.id) is not None]
+
+def tag_holders(guild: discord.Guild):
+    """
+    select de recalculate_tickets() para uma mudança nas TAGs: inscritos que tinham
+    fichas de TAG ou cujos nomes/cargos podem conter alguma das TAGs atuais.
+    """
+    def select(members, participants, rules):
+        candidates = rules.tag_candidates(members, guild.roles, db.get_member_names())
+        return [m for m in members if m.id in candidates or participants[m.id].tag]
+    return select
+
+@bot.event
+async def on_member_update(before: discord.Member, after: discord.Member):
+    ticket_refresher.stats["events"] += 1
+    if (before.nick == after.nick
+            and member_role_ids(before) == member_role_ids(after)):
+        ticket_refresher.stats["ignored"] += 1
+        return
+    ticket_refresher.schedule(after.guild.id, after.id)
+
+@bot.event
+async def on_user_update(before: discord.User, after: discord.User):
+    # nome global/de usuário valem em todos os servidores em comum com o bot
+    ticket_refresher.stats["events"] += 1
+    if before.global_name == after.global_name and before.name == after.name:
+        ticket_refresher.stats["ignored"] += 1
+        return
+    for guild in after.mutual_guilds:
+        ticket_refresher.schedule(guild.id, after.id)
+
 @bot.tree.command(name="ajuda", description="Mostra a lista de comandos disponíveis")
 async def ajuda(interaction: discord.Interaction):
     is_admin = interaction.user.guild_permissions.administrator
@@ -417,6 +707,7 @@ async def ajuda(interaction: discord.Interaction):
     
     if is_admin:
         admin_commands = [
+            "/sorteio - Cria/seleciona sorteios simultâneos",
             "/setup_inscricao - Configura o sistema de inscrições",
             "/hashtag - Define a hashtag obrigatória",
             "/tag - Configura a tag do servidor",
@@ -427,7 +718,8 @@ async def ajuda(interaction: discord.Interaction):
             "/exportar - Exporta lista de participantes",
             "/atualizar - Recalcula fichas de todos",
             "/estatisticas - Mostra estatísticas",
-            "/limpar - Limpa dados",
+            "/limpar - Arquiva e limpa dados",
+            "/historico - Sorteios arquivados",
             "/blacklist - Gerencia blacklist",
             "/chat - Bloqueia/desbloqueia chat",
             "/anunciar - Envia anúncio",
@@ -444,7 +736,7 @@ async def ajuda(interaction: discord.Interaction):
 
 @bot.tree.command(name="verificar", description="Verifica seu status de inscrição")
 async def verificar(interaction: discord.Interaction):
-    participant = db.get_participant(interaction.user.id)
+    participant = await db.aget_participant(interaction.user.id)
     
     if not participant:
         await interaction.response.send_message(
@@ -453,10 +745,11 @@ async def verificar(interaction: discord.Interaction):
         )
         return
     
-    first_name = participant["first_name"]
-    last_name = participant["last_name"]
-    tickets = participant["tickets"]
-    total_tickets = utils.get_total_tickets(tickets)
+    first_name = participant.first_name
+    last_name = participant.last_name
+    tickets = participant.tickets
+    role_lookup = await db.aget_role_lookup()
+    total_tickets = utils.get_total_tickets(tickets, role_lookup)
     
     embed = discord.Embed(
         title="✅ Seu Status de Inscrição",
@@ -466,7 +759,7 @@ async def verificar(interaction: discord.Interaction):
     
     embed.add_field(name="Total de Fichas", value=f"🎫 {total_tickets}", inline=False)
     
-    tickets_list = utils.format_tickets_list(tickets, interaction.guild)
+    tickets_list = utils.format_tickets_list(tickets, interaction.guild, role_lookup)
     embed.add_field(
         name="Detalhamento",
         value="\n".join(tickets_list),
@@ -503,7 +796,7 @@ async def setup_inscricao(
     verificar_botao: Optional[bool] = False
 ):
     # checagem de permissão manual (compatível com qualquer versão)
-    if not is_admin_or_moderator(interaction):
+    if not await is_admin_or_moderator(interaction):
         await interaction.response.send_message(
             "❌ Você não tem permissão para usar este comando.",
             ephemeral=True
@@ -513,16 +806,16 @@ async def setup_inscricao(
     try:
         await interaction.response.defer(ephemeral=True)
         
-        db.set_inscricao_channel(canal_inscricoes.id)
+        await db.aset_inscricao_channel(canal_inscricoes.id)
 
         # **IMPORTANTE**: ao criar um novo botão garantimos que as inscrições estarão abertas
         try:
-            db.set_inscricoes_closed(False)
+            await db.aset_inscricoes_closed(False)
         except Exception:
             pass
 
         # passa a flag para a view: se False, o botão "Verificar minha inscrição" é removido
-        view = InscricaoView(show_verify=bool(verificar_botao))
+        view = InscricaoView(show_verify=bool(verificar_botao), raffle=db.current_raffle())
         
         content = mensagem or "**INSCRIÇÕES ABERTAS!**\nClique no botão em baixo para se inscrever!"
         
@@ -536,16 +829,12 @@ async def setup_inscricao(
         else:
             msg = await canal_botao.send(content=content, view=view)
         
-        # tenta usar API de DB que adiciona message_id a uma lista (se disponível)
-        try:
-            db.add_button_message_id(msg.id)
-        except Exception:
-            # fallback retrocompatível (mantém última mensagem)
-            db.set_button_message_id(msg.id)
+        await db.aadd_button_message_id(msg.id)
         bot.add_view(view, message_id=msg.id)
         
         await interaction.followup.send(
             f"✅ Sistema de inscrições configurado!\n"
+            f"**Sorteio**: {raffle_label(db.current_raffle(), await db.aget_raffles())}\n"
             f"**Canal do botão**: {canal_botao.mention}\n"
             f"**Canal de inscrições**: {canal_inscricoes.mention}\n"
             f"**Botão de verificação**: {'Ativado' if verificar_botao else 'Desativado'}",
@@ -561,30 +850,107 @@ async def setup_inscricao(
             ephemeral=True
         )
 
-def is_admin_or_moderator(interaction: discord.Interaction) -> bool:
-    """Verifica se o usuário é admin ou moderador do bot"""
-    return interaction.user.guild_permissions.administrator or db.is_moderator(interaction.user.id)
+def member_role_ids(member) -> frozenset:
+    """IDs dos cargos de um membro (vazio para discord.User), para db.is_moderator()."""
+    return frozenset(role.id for role in getattr(member, "roles", ()))
+
+async def is_admin_or_moderator(interaction: discord.Interaction) -> bool:
+    """Verifica se o usuário é admin ou moderador do bot (diretamente ou por cargo)"""
+    user = interaction.user
+    return user.guild_permissions.administrator or await db.ais_moderator(user.id, member_role_ids(user))
+
+@bot.tree.command(name="sorteio", description="[ADMIN] Gerencia sorteios simultâneos")
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(
+    acao="Ação a realizar",
+    nome=f"Nome do sorteio ('{db.DEFAULT_RAFFLE}' para o sorteio padrão)"
+)
+async def sorteio(
+    interaction: discord.Interaction,
+    acao: Literal["criar", "usar", "lista"],
+    nome: Optional[str] = None
+):
+    if not await is_admin_or_moderator(interaction):
+        await interaction.response.send_message(
+            "❌ Você não tem permissão para usar este comando.",
+            ephemeral=True
+        )
+        return
+    
+    if acao == "lista":
+        raffles = await db.aget_raffles()
+        selected = await db.aget_selected_raffle()
+        lines = ["🎟️ Sorteios:"]
+        for raffle in [None] + sorted(raffles):
+            marker = " ← em uso" if raffle == selected else ""
+            lines.append(f"• {raffle_label(raffle, raffles)}{marker}")
+        await interaction.response.send_message("\n".join(lines), ephemeral=True)
+        return
+    
+    if not nome:
+        await interaction.response.send_message(
+            "❌ Você precisa informar o nome do sorteio!",
+            ephemeral=True
+        )
+        return
+    
+    if acao == "criar":
+        raffle = await db.acreate_raffle(nome)
+        if raffle is None:
+            await interaction.response.send_message(
+                "❌ Nome inválido ou já usado por outro sorteio.",
+                ephemeral=True
+            )
+            return
+        await db.aset_selected_raffle(raffle)
+        bot.add_view(InscricaoView(raffle=raffle))
+        await interaction.response.send_message(
+            f"✅ Sorteio **{nome.strip()}** criado e selecionado!\n"
+            f"Os comandos de administração agora usam este sorteio. "
+            f"Use /setup_inscricao para enviar o botão de inscrição dele.",
+            ephemeral=True
+        )
+        logger.info(f"Sorteio {raffle} criado por {interaction.user}")
+        return
+    
+    # acao == "usar"
+    try:
+        raffle = db.raffle_slug(nome)
+    except ValueError:
+        raffle = None
+        nome = None
+    if nome is None or not await db.aset_selected_raffle(raffle):
+        await interaction.response.send_message(
+            "❌ Sorteio não encontrado. Use /sorteio lista para ver os sorteios.",
+            ephemeral=True
+        )
+        return
+    await interaction.response.send_message(
+        f"✅ Os comandos de administração agora usam o sorteio **{raffle_label(raffle, await db.aget_raffles())}**.",
+        ephemeral=True
+    )
 
 @bot.tree.command(name="hashtag", description="[ADMIN] Define a hashtag obrigatória")
 @app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(hashtag="Hashtag obrigatória para inscrição")
 async def hashtag(interaction: discord.Interaction, hashtag: str):
-    if not is_admin_or_moderator(interaction):
+    if not await is_admin_or_moderator(interaction):
         await interaction.response.send_message(
             "❌ Você não tem permissão para usar este comando.",
             ephemeral=True
         )
         return
     
-    if db.is_hashtag_locked():
+    if await db.ais_hashtag_locked():
         await interaction.response.send_message(
             "🔒 A hashtag está bloqueada e não pode ser alterada.",
             ephemeral=True
         )
         return
     
-    db.set_hashtag(hashtag.strip())
+    await db.aset_hashtag(hashtag.strip())
     
     await interaction.response.send_message(
         f"✅ Hashtag definida como: `{hashtag.strip()}`",
@@ -593,48 +959,53 @@ async def hashtag(interaction: discord.Interaction, hashtag: str):
     
     logger.info(f"Hashtag definida como '{hashtag}' por {interaction.user}")
 
-@bot.tree.command(name="tag", description="[ADMIN] Configura a tag do servidor")
+@bot.tree.command(name="tag", description="[ADMIN] Configura as tags do servidor")
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(
     acao="Ação a realizar",
-    texto="Texto da tag do servidor",
+    texto="Texto da tag (on: adiciona/altera a tag; remover: tag a remover)",
     quantidade="Quantidade de fichas bônus pela tag"
 )
 async def tag(
     interaction: discord.Interaction,
-    acao: Literal["on", "off", "status"],
+    acao: Literal["on", "off", "remover", "status"],
     texto: Optional[str] = None,
     quantidade: Optional[int] = 1
 ):
     if acao == "status":
-        tag_config = db.get_tag()
+        tag_config = await db.aget_tag()
         status = "✅ Ativada" if tag_config["enabled"] else "❌ Desativada"
         
         embed = discord.Embed(
             title="🏷️ Status da TAG",
             color=discord.Color.blue()
         )
-        import re
-        tag_text = tag_config["text"] or "Não configurado"
-        tag_clean = re.sub(r'[^\w\s]', '', tag_text).strip() if tag_config["text"] else ""
         
-        variations_text = f"`{tag_text}`"
-        if tag_clean and tag_clean != tag_text:
-            variations_text += f"\n**Também aceita**: `{tag_clean}` (sem emoji/caracteres especiais)"
+        import re
+        tags_lines = []
+        for entry in tag_config["tags"]:
+            line = f"`{entry['text']}` - {entry['quantity']} ficha(s)"
+            tag_clean = re.sub(r'[^\w\s]', '', entry["text"]).strip()
+            if tag_clean and tag_clean != entry["text"]:
+                line += f"\n  **Também aceita**: `{tag_clean}` (sem emoji/caracteres especiais)"
+            tags_lines.append(line)
         
         embed.add_field(name="Status", value=status, inline=False)
-        embed.add_field(name="Texto da TAG", value=variations_text, inline=False)
-        embed.add_field(name="Fichas Bônus", value=str(tag_config["quantity"]), inline=False)
+        embed.add_field(name="TAGs", value="\n".join(tags_lines) or "Não configurado", inline=False)
         
         # Teste de detecção no usuário que executou o comando
-        if tag_config["enabled"] and tag_config["text"]:
+        if tag_config["enabled"] and tag_config["tags"]:
             member = interaction.user
             if isinstance(member, discord.User):
                 member = interaction.guild.get_member(interaction.user.id)
             
             if member:
-                # Testa se a TAG está no nome do usuário
-                tag_search = tag_config["text"].strip().lower()
+                rules = utils.get_ticket_rules(
+                    await db.aget_config_version(),
+                    await db.aget_bonus_roles(),
+                    tag_config
+                )
                 fields_with_tag = []
                 
                 checks = [
@@ -645,8 +1016,11 @@ async def tag(
                 ]
                 
                 for field_name, field_value in checks:
-                    if field_value and tag_search in field_value.strip().lower():
-                        fields_with_tag.append(f"✅ {field_name}: `{field_value}`")
+                    found = rules.match_name(field_value)
+                    if found:
+                        fields_with_tag.append(
+                            f"✅ {field_name}: `{field_value}` ({', '.join(f'`{t}`' for t in found)})"
+                        )
                     elif field_value:
                         fields_with_tag.append(f"❌ {field_name}: `{field_value}`")
                     else:
@@ -658,20 +1032,39 @@ async def tag(
                     inline=False
                 )
                 
-                # Indica se seria concedida ficha
-                has_tag = any(field_value and tag_search in field_value.strip().lower() 
-                             for _, field_value in checks)
-                
-                embed.add_field(
-                    name="Resultado",
-                    value=f"{'✅ Você receberia' if has_tag else '❌ Você NÃO receberia'} +{tag_config['quantity']} ficha(s) da TAG",
-                    inline=False
-                )
+                # Indica se seria concedida ficha (nomes e cargos)
+                tickets = rules.calculate(member)
+                if tickets.get("tags"):
+                    result = (f"✅ Você receberia +{tickets['tag']} ficha(s) da TAG "
+                              f"({', '.join(f'`{t}`' for t in tickets['tags'])})")
+                else:
+                    result = "❌ Você NÃO receberia fichas da TAG"
+                embed.add_field(name="Resultado", value=result, inline=False)
         
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
     
     if acao == "on":
+        if not texto and not (await db.aget_tag())["tags"]:
+            await interaction.response.send_message(
+                "❌ Você precisa fornecer o texto da tag!",
+                ephemeral=True
+            )
+            return
+        
+        # o recálculo pode passar do prazo de resposta da interação
+        await interaction.response.defer(ephemeral=True)
+        await db.aset_tag(True, texto, quantidade)
+        touched, changed = await recalculate_tickets(interaction.guild, tag_holders(interaction.guild))
+        if texto:
+            message = f"✅ TAG ativada!\n**Texto**: {texto}\n**Fichas bônus**: {quantidade}"
+        else:
+            message = "✅ TAGs ativadas!"
+        await interaction.followup.send(f"{message}\n**Participantes atualizados**: {changed}", ephemeral=True)
+        logger.info(f"TAG ativada: '{texto}' ({quantidade} fichas) por {interaction.user}; "
+                    f"{touched} participante(s) recalculado(s), {changed} alterado(s)")
+    
+    elif acao == "remover":
         if not texto:
             await interaction.response.send_message(
                 "❌ Você precisa fornecer o texto da tag!",
@@ -679,17 +1072,28 @@ async def tag(
             )
             return
         
-        db.set_tag(True, texto, quantidade)
-        await interaction.response.send_message(
-            f"✅ TAG ativada!\n**Texto**: {texto}\n**Fichas bônus**: {quantidade}",
-            ephemeral=True
-        )
-        logger.info(f"TAG ativada: '{texto}' ({quantidade} fichas) por {interaction.user}")
+        await interaction.response.defer(ephemeral=True)
+        if await db.aremove_tag(texto):
+            touched, changed = await recalculate_tickets(interaction.guild, tag_holders(interaction.guild))
+            await interaction.followup.send(
+                f"✅ TAG `{texto}` removida!\n**Participantes atualizados**: {changed}",
+                ephemeral=True
+            )
+            logger.info(f"TAG removida: '{texto}' por {interaction.user}; "
+                        f"{touched} participante(s) recalculado(s), {changed} alterado(s)")
+        else:
+            await interaction.followup.send(f"❌ TAG `{texto}` não encontrada!", ephemeral=True)
     
     elif acao == "off":
-        db.set_tag(False)
-        await interaction.response.send_message("❌ TAG desativada!", ephemeral=True)
-        logger.info(f"TAG desativada por {interaction.user}")
+        await interaction.response.defer(ephemeral=True)
+        await db.aset_tag(False)
+        touched, changed = await recalculate_tickets(interaction.guild, tag_holders(interaction.guild))
+        await interaction.followup.send(
+            f"❌ TAG desativada!\n**Participantes atualizados**: {changed}",
+            ephemeral=True
+        )
+        logger.info(f"TAG desativada por {interaction.user}; "
+                    f"{touched} participante(s) recalculado(s), {changed} alterado(s)")
 
 @bot.tree.command(name="fichas", description="[ADMIN] Adiciona um cargo bônus")
 @app_commands.guild_only()
@@ -705,7 +1109,7 @@ async def fichas(
     quantidade: int,
     abreviacao: str
 ):
-    if not is_admin_or_moderator(interaction):
+    if not await is_admin_or_moderator(interaction):
         await interaction.response.send_message(
             "❌ Você não tem permissão para usar este comando.",
             ephemeral=True
@@ -721,29 +1125,40 @@ async def fichas(
     
     abbrev = abreviacao.strip()
     
-    db.add_bonus_role(cargo.id, quantidade, abbrev)
+    # o recálculo pode passar do prazo de resposta da interação
+    await interaction.response.defer(ephemeral=True)
+    await db.aadd_bonus_role(cargo.id, quantidade, abbrev)
+    # só quem tem o cargo muda de fichas
+    touched, changed = await recalculate_tickets(interaction.guild, role_holders(cargo))
     
-    await interaction.response.send_message(
+    await interaction.followup.send(
         f"✅ Cargo {cargo.mention} configurado!\n"
         f"**Fichas bônus**: {quantidade}\n"
-        f"**Abreviação**: {abbrev}",
+        f"**Abreviação**: {abbrev}\n"
+        f"**Participantes atualizados**: {changed}",
         ephemeral=True
     )
     
-    logger.info(f"Cargo bônus adicionado: {cargo.name} ({quantidade} fichas, {abbrev}) por {interaction.user}")
+    logger.info(f"Cargo bônus adicionado: {cargo.name} ({quantidade} fichas, {abbrev}) por {interaction.user}; "
+                f"{touched} participante(s) recalculado(s), {changed} alterado(s)")
 
 @bot.tree.command(name="tirar", description="[ADMIN] Remove um cargo bônus")
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(cargo="Cargo a ser removido dos bônus")
 async def tirar(interaction: discord.Interaction, cargo: discord.Role):
-    if db.remove_bonus_role(cargo.id):
-        await interaction.response.send_message(
-            f"✅ Cargo {cargo.mention} removido dos bônus!",
+    # o recálculo pode passar do prazo de resposta da interação
+    await interaction.response.defer(ephemeral=True)
+    if await db.aremove_bonus_role(cargo.id):
+        touched, changed = await recalculate_tickets(interaction.guild, role_holders(cargo))
+        await interaction.followup.send(
+            f"✅ Cargo {cargo.mention} removido dos bônus!\n"
+            f"**Participantes atualizados**: {changed}",
             ephemeral=True
         )
-        logger.info(f"Cargo bônus removido: {cargo.name} por {interaction.user}")
+        logger.info(f"Cargo bônus removido: {cargo.name} por {interaction.user}; "
+                    f"{touched} participante(s) recalculado(s), {changed} alterado(s)")
     else:
-        await interaction.response.send_message(
+        await interaction.followup.send(
             f"❌ Cargo {cargo.mention} não estava configurado como bônus.",
             ephemeral=True
         )
@@ -752,7 +1167,9 @@ async def tirar(interaction: discord.Interaction, cargo: discord.Role):
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(tipo="Tipo de listagem")
 async def lista(interaction: discord.Interaction, tipo: Literal["simples", "com_fichas"]):
-    participants = db.get_all_participants()
+    # snapshot: inscrições feitas durante a listagem não alteram a lista em andamento
+    snap = await db.asnapshot()
+    participants = snap.participants
     
     if not participants:
         await interaction.response.send_message(
@@ -768,19 +1185,21 @@ async def lista(interaction: discord.Interaction, tipo: Literal["simples", "com_
     if tipo == "simples":
         lines.append("📋 **Lista de Participantes (Simples)**\n")
         # monta lista de nomes e ordena alfabeticamente
-        names = [f"{data['first_name']} {data['last_name']}" for _, data in participants.items()]
+        names = [f"{data.first_name} {data.last_name}" for _, data in participants.items()]
         names.sort(key=lambda s: s.lower())
         for i, name in enumerate(names, 1):
             lines.append(f"{i}. {name}")
     
     else:
         lines.append("📋 **Lista de Participantes (Com Fichas)**\n")
+        role_lookup = snap.role_lookup
         # não colocar linha em branco entre participantes
         for user_id, data in participants.items():
             entries = utils.format_detailed_entry(
-                data["first_name"],
-                data["last_name"],
-                data["tickets"]
+                data.first_name,
+                data.last_name,
+                data.tickets,
+                role_lookup=role_lookup
             )
             lines.extend(entries)
             # removido: lines.append("")
@@ -808,13 +1227,15 @@ async def exportar(interaction: discord.Interaction, tipo: Literal['simples','co
     mas altera o sobrenome para as duas primeiras letras + '.' (ex: 'Rafael Fe.') e remove aspas.
     """
     await interaction.response.defer(ephemeral=True)
-    participants = db.get_all_participants() or {}
+    snap = await db.asnapshot()
+    participants = snap.participants
+    role_lookup = snap.role_lookup
 
     lines: list[str] = []
 
     for uid, data in participants.items():
-        first = (data.get("first_name") or "").strip()
-        last = (data.get("last_name") or "").strip()
+        first = data.first_name.strip()
+        last = data.last_name.strip()
         if not first and not last:
             continue
 
@@ -831,15 +1252,15 @@ async def exportar(interaction: discord.Interaction, tipo: Literal['simples','co
 
         # com_fichas: pegar as mesmas entradas que /lista (usa util para consistência)
         try:
-            entries = utils.format_detailed_entry(first, last, data.get("tickets", {}), interaction.guild)
+            entries = utils.format_detailed_entry(first, last, data.tickets, interaction.guild, role_lookup)
         except Exception:
             # fallback simples: inclui base + roles/tags manualmente se utils falhar
             entries = [f"{first} {last}"]
-            tickets = data.get("tickets", {}) or {}
+            tickets = data.tickets
             # roles
-            for role_info in (tickets.get("roles") or {}).values():
-                qty = int(role_info.get("quantity", role_info.get("qty", 1)) or 1)
-                abbr = (role_info.get("abbreviation") or role_info.get("abreviation") or "").strip()
+            for role_id in tickets.get("roles") or ():
+                qty, abbr = role_lookup.get(int(role_id), (0, ""))
+                abbr = abbr.strip()
                 for _ in range(qty):
                     entries.append(f"{first} {last} {abbr}".strip())
             # tags
@@ -876,51 +1297,106 @@ async def exportar(interaction: discord.Interaction, tipo: Literal['simples','co
     filename = f"marbles_participantes_{tipo}_{now}.csv"
     await interaction.followup.send(file=discord.File(fp=bio, filename=filename))
 
+async def fetch_members(guild: discord.Guild, user_ids: list, chunk_size: int = 100) -> Dict[int, discord.Member]:
+    """
+    Busca no gateway os membros que não estão no cache do servidor, em lotes de até
+    100 ids por guild.query_members() (o limite da API). Quem não voltar saiu do servidor.
+    
+    Returns:
+        Dict user_id -> Member dos membros encontrados (também entram no cache)
+    """
+    found: Dict[int, discord.Member] = {}
+    for i in range(0, len(user_ids), chunk_size):
+        chunk = user_ids[i:i + chunk_size]
+        try:
+            members = await guild.query_members(user_ids=chunk, limit=len(chunk), cache=True)
+        except Exception as e:
+            logger.error(f"Erro ao buscar {len(chunk)} membro(s) de {guild.id}: {e}")
+            continue
+        found.update((member.id, member) for member in members)
+    return found
+
 @bot.tree.command(name="atualizar", description="[ADMIN] Recalcula fichas de todos os participantes")
+@app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 async def atualizar(interaction: discord.Interaction):
     await interaction.response.defer(ephemeral=True)
-    
-    participants = db.get_all_participants()
-    bonus_roles = db.get_bonus_roles()
-    tag_config = db.get_tag()
-    
-    updated = 0
-    errors = 0
-    
-    for user_id, data in participants.items():
-        try:
-            member = interaction.guild.get_member(int(user_id))
-            if not member:
+    guild = interaction.guild
+    
+    # snapshot referenciado até o fim: inscrições feitas durante o recálculo (que
+    # atravessa vários awaits) não alteram a lista em andamento
+    snap = await db.asnapshot()
+    participants = snap.participants
+    user_ids = list(participants)
+    total = len(user_ids)
+    progress = await interaction.followup.send(f"⏳ Recalculando fichas de {total} participante(s)...",
+                                               ephemeral=True, wait=True)
+    
+    # membros fora do cache: uma busca por lote de 100 em vez de pular o participante
+    missing = [user_id for user_id in user_ids if guild.get_member(user_id) is None]
+    fetched: Dict[int, discord.Member] = {}
+    if missing:
+        await progress.edit(content=f"⏳ Buscando {len(missing)} membro(s) fora do cache...")
+        fetched = await fetch_members(guild, missing)
+    
+    # regras compiladas uma vez para todos os membros
+    rules = utils.get_ticket_rules(
+        await db.aget_config_version(),
+        await db.aget_bonus_roles(),
+        await db.aget_tag()
+    )
+    changes: Dict[int, dict] = {}
+    departed = errors = 0
+    # fatias curtas devolvem o event loop entre elas; progresso a cada ~5%
+    slice_size = 500
+    report_every = max(1, total // 20)
+    next_report = report_every
+    for start in range(0, total, slice_size):
+        for user_id in user_ids[start:start + slice_size]:
+            member = guild.get_member(user_id) or fetched.get(user_id)
+            if member is None:
+                departed += 1
                 continue
-            
-            new_tickets = utils.calculate_tickets(
-                member,
-                bonus_roles,
-                tag_config["enabled"],
-                tag_config["text"],
-                tag_config["quantity"]
-            )
-            
-            db.update_tickets(int(user_id), new_tickets)
-            updated += 1
-        except Exception as e:
-            logger.error(f"Erro ao atualizar fichas do usuário {user_id}: {e}")
-            errors += 1
-    
-    await interaction.followup.send(
-        f"✅ Fichas atualizadas!\n"
-        f"**Atualizados**: {updated}\n"
-        f"**Erros**: {errors}",
-        ephemeral=True
+            try:
+                # mantém a TAG manual do participante
+                data = participants[user_id]
+                tickets = rules.calculate(member, data.manual_tag)
+                if not utils.same_tickets(data.tickets, tickets):
+                    changes[user_id] = tickets
+            except Exception as e:
+                logger.error(f"Erro ao atualizar fichas do usuário {user_id}: {e}")
+                errors += 1
+        done = min(start + slice_size, total)
+        if done >= next_report and done < total:
+            next_report = done + report_every
+            try:
+                await progress.edit(content=f"⏳ Recalculando fichas... {done}/{total} ({done * 100 // total}%)")
+            except Exception as e:
+                logger.error(f"Erro ao atualizar progresso do /atualizar: {e}")
+        await asyncio.sleep(0)
+    
+    # solta o snapshot antes de gravar (sem ele a gravação não precisa copiar o dict)
+    del snap, participants
+    changed, removed = await db.submit(write_tickets, changes) if changes else (0, 0)
+    # fichas que já estavam certas na hora de gravar também contam como sem alteração
+    skipped = total - departed - errors - changed - removed
+    
+    await progress.edit(
+        content=f"✅ Fichas atualizadas!\n"
+                f"**Alterados**: {changed}\n"
+                f"**Sem alteração**: {skipped}\n"
+                f"**Saíram do servidor**: {departed}\n"
+                f"**Saíram do sorteio durante o recálculo**: {removed}\n"
+                f"**Erros**: {errors}"
     )
     
-    logger.info(f"Fichas atualizadas por {interaction.user}: {updated} sucesso, {errors} erros")
+    logger.info(f"Fichas atualizadas por {interaction.user}: {changed} alterados, {skipped} sem alteração, "
+                f"{departed} fora do servidor, {removed} fora do sorteio, {errors} erros ({len(fetched)} membros buscados fora do cache)")
 
 @bot.tree.command(name="estatisticas", description="[ADMIN] Mostra estatísticas do sorteio")
 @app_commands.default_permissions(administrator=True)
 async def estatisticas(interaction: discord.Interaction):
-    stats = db.get_statistics()
+    stats = (await db.asnapshot()).statistics
     
     embed = discord.Embed(
         title="📊 Estatísticas do Sorteio",
@@ -973,7 +1449,7 @@ async def estatisticas(interaction: discord.Interaction):
 @app_commands.guild_only()
 @app_commands.default_permissions(administrator=True)
 async def limpar(interaction: discord.Interaction):
-    if not is_admin_or_moderator(interaction):
+    if not await is_admin_or_moderator(interaction):
         await interaction.response.send_message(
             "❌ Você não tem permissão para usar este comando.",
             ephemeral=True
@@ -986,7 +1462,7 @@ async def limpar(interaction: discord.Interaction):
         v.add_item(btn)
         return v
 
-    class ConfirmView(discord.ui.View):
+    class ConfirmView(GuildView):
         def __init__(self):
             super().__init__(timeout=60)
             self.value = None
@@ -1002,33 +1478,13 @@ async def limpar(interaction: discord.Interaction):
             self.closed = True
             self.stop()
 
-        def _extract_mid(self, data):
-            # tenta várias chaves comuns onde o DB pode ter guardado o id da mensagem
-            return data.get("message_id") or data.get("msg_id") or data.get("mid") or data.get("message") or data.get("messageId")
-
-        async def _delete_msg_by_id(self, inter: discord.Interaction, mid):
+        async def _delete_msg_by_id(self, inter: discord.Interaction, mid_int: int):
             """Tenta deletar a mensagem: primeiro no canal configurado, depois procura em todos os canais do guild."""
-            try:
-                mid_int = int(mid)
-            except Exception:
-                logger.warning(f"ID de mensagem inválido: {mid}")
-                return False
-
-            channel_id = db.get_inscricao_channel()
+            channel_id = await db.aget_inscricao_channel()
             channel = None
-            # tenta pegar canal a partir do guild (mais confiável dentro de interações)
-            try:
-                if channel_id:
-                    channel = inter.guild.get_channel(int(channel_id))
-            except Exception:
-                channel = None
-
-            # fallback para cache global
-            if not channel and channel_id:
-                try:
-                    channel = bot.get_channel(int(channel_id))
-                except Exception:
-                    channel = None
+            if channel_id:
+                # tenta pegar canal a partir do guild (mais confiável dentro de interações), depois o cache global
+                channel = inter.guild.get_channel(channel_id) or bot.get_channel(channel_id)
 
             # tenta deletar no canal conhecido
             if channel:
@@ -1058,14 +1514,17 @@ async def limpar(interaction: discord.Interaction):
                 return
             await inter.response.defer(ephemeral=True)
 
-            participants = db.get_all_participants() or {}
+            # o snapshot fica referenciado até o fim: inscrições feitas durante o
+            # /limpar não alteram a lista percorrida
+            snap = await db.asnapshot()
+            participants = snap.participants
             deleted_count = 0
             attempted = 0
             removed_from_db = 0
 
-            # tenta deletar mensagens e remover participante individualmente (workaround se clear_participants estiver quebrado)
-            for user_id, data in list(participants.items()):
-                mid = self._extract_mid(data)
+            # deleta as mensagens de inscrição (a remoção do DB acontece depois, de uma vez)
+            for user_id, data in participants.items():
+                mid = data.message_id
                 if mid:
                     attempted += 1
                     try:
@@ -1075,31 +1534,20 @@ async def limpar(interaction: discord.Interaction):
                     except Exception as e:
                         logger.warning(f"Erro ao tentar deletar mensagem {mid}: {e}", exc_info=True)
 
-                # tenta remover participante individualmente do DB
-                try:
-                    # algumas impls usam str/int keys; tenta ambos
-                    try:
-                        success = db.remove_participant(int(user_id))
-                    except Exception:
-                        success = db.remove_participant(user_id)
-                    if success:
-                        removed_from_db += 1
-                except AttributeError:
-                    # função não existe no DB -> ignora (iremos tentar clear_participants abaixo)
-                    pass
-                except Exception as e:
-                    logger.warning(f"Erro ao remover participante {user_id} individualmente: {e}", exc_info=True)
-
-            # tenta fallback para limpar tudo no DB (apenas se existir)
+            # arquiva os participantes no histórico (/historico) e esvazia o sorteio
+            # em uma única transação (preserva TAGs manuais)
             try:
-                db.clear_participants()
+                removed_from_db = await db.aclear_participants()
             except Exception as e:
-                logger.warning(f"clear_participants falhou (ignorado): {e}")
+                logger.warning(f"clear_participants falhou: {e}", exc_info=True)
+
+            # ação destrutiva: grava imediatamente mesmo no modo write-behind
+            await db.aflush()
 
             logger.info(f"/limpar -> participantes={len(participants)} attempted_delete={attempted} deleted_messages={deleted_count} removed_db={removed_from_db}")
             await inter.followup.send(
                 f"✅ Inscrições limpas!\n"
-                f"**Participantes removidos do DB**: {removed_from_db if removed_from_db>0 else len(participants)}\n"
+                f"**Participantes arquivados**: {removed_from_db if removed_from_db>0 else len(participants)} (veja em /historico)\n"
                 f"**Mensagens deletadas**: {deleted_count}",
                 ephemeral=True
             )
@@ -1112,13 +1560,16 @@ async def limpar(interaction: discord.Interaction):
                 return
             await inter.response.defer(ephemeral=True)
 
-            participants = db.get_all_participants() or {}
+            # o snapshot fica referenciado até o fim: inscrições feitas durante o
+            # /limpar não alteram a lista percorrida
+            snap = await db.asnapshot()
+            participants = snap.participants
             deleted_count = 0
             attempted = 0
             removed_from_db = 0
 
-            for user_id, data in list(participants.items()):
-                mid = self._extract_mid(data)
+            for user_id, data in participants.items():
+                mid = data.message_id
                 if mid:
                     attempted += 1
                     try:
@@ -1128,29 +1579,18 @@ async def limpar(interaction: discord.Interaction):
                     except Exception as e:
                         logger.warning(f"Erro ao tentar deletar mensagem {mid}: {e}", exc_info=True)
 
-                # tenta remover participante individualmente do DB
-                try:
-                    try:
-                        success = db.remove_participant(int(user_id))
-                    except Exception:
-                        success = db.remove_participant(user_id)
-                    if success:
-                        removed_from_db += 1
-                except AttributeError:
-                    pass
-                except Exception as e:
-                    logger.warning(f"Erro ao remover participante {user_id} individualmente: {e}", exc_info=True)
-
-            # tenta fallback para resetar tudo no DB (se existir)
+            # arquiva os participantes e reseta o sorteio em uma única transação
             try:
-                db.clear_all()
+                removed_from_db = await db.aclear_all()
             except Exception as e:
-                logger.warning(f"clear_all falhou (ignorado): {e}")
+                logger.warning(f"clear_all falhou: {e}", exc_info=True)
+
+            await db.aflush()
 
             logger.info(f"/limpar tudo -> participantes={len(participants)} attempted_delete={attempted} deleted_messages={deleted_count} removed_db={removed_from_db}")
             await inter.followup.send(
                 f"✅ Tudo limpo! Sistema resetado.\n"
-                f"**Participantes removidos do DB**: {removed_from_db if removed_from_db>0 else len(participants)}\n"
+                f"**Participantes arquivados**: {removed_from_db if removed_from_db>0 else len(participants)} (veja em /historico)\n"
                 f"**Mensagens deletadas**: {deleted_count}",
                 ephemeral=True
             )
@@ -1164,22 +1604,17 @@ async def limpar(interaction: discord.Interaction):
             await inter.response.defer(ephemeral=True)
 
             try:
-                db.set_inscricoes_closed(True)
+                await db.aset_inscricoes_closed(True)
             except Exception as e:
                 logger.warning(f"Não foi possível setar flag de inscrições: {e}")
 
-            button_msg_id = db.get_button_message_id()
-            button_ids = []
-            if isinstance(button_msg_id, (list, tuple)):
-                button_ids = list(button_msg_id)
-            elif button_msg_id:
-                button_ids = [button_msg_id]
+            button_ids = await db.aget_button_message_id()
 
             edited = False
             for bid in button_ids:
                 for ch in inter.guild.text_channels:
                     try:
-                        msg = await ch.fetch_message(int(bid))
+                        msg = await ch.fetch_message(bid)
                         try:
                             await msg.edit(content="❌ INSCRIÇÕES ENCERRADAS", view=make_closed_view())
                         except Exception:
@@ -1238,6 +1673,77 @@ async def limpar(interaction: discord.Interaction):
         except:
             pass
 
+HISTORY_PAGE_SIZE = 10
+
+def archive_export(path: str, header: dict) -> io.BytesIO:
+    """
+    Lista "Nome Sobrenome - N fichas" de um sorteio arquivado, lida do arquivo um
+    participante por vez (roda fora do event loop). As fichas de cargo usam os
+    cargos bônus da época, guardados no cabeçalho do arquivo.
+    """
+    role_lookup = {
+        int(rid): (int(info.get("quantity", 0)), info.get("abbreviation", ""))
+        for rid, info in (header.get("bonus_roles") or {}).items()
+    }
+    bio = io.BytesIO()
+    for participant in db.iter_archived_participants(path):
+        total = utils.get_total_tickets(participant.tickets, role_lookup)
+        line = f"{participant.first_name} {participant.last_name} - {total} ficha(s)\n"
+        bio.write(line.encode("utf-8"))
+    bio.seek(0)
+    return bio
+
+@bot.tree.command(name="historico", description="[ADMIN] Mostra os sorteios arquivados pelo /limpar")
+@app_commands.guild_only()
+@app_commands.default_permissions(administrator=True)
+@app_commands.describe(
+    pagina="Página da lista (10 sorteios por página)",
+    numero="Número do sorteio na lista para exportar os participantes"
+)
+async def historico(interaction: discord.Interaction, pagina: Optional[int] = 1, numero: Optional[int] = None):
+    if not await is_admin_or_moderator(interaction):
+        await interaction.response.send_message(
+            "❌ Você não tem permissão para usar este comando.",
+            ephemeral=True
+        )
+        return
+    
+    await interaction.response.defer(ephemeral=True)
+    
+    if numero is None:
+        page = max(1, pagina or 1)
+        start = (page - 1) * HISTORY_PAGE_SIZE
+        archives = await db.alist_archives(start, HISTORY_PAGE_SIZE)
+        if not archives:
+            await interaction.followup.send("📋 Nenhum sorteio arquivado encontrado.", ephemeral=True)
+            return
+        
+        lines = [f"📚 Sorteios arquivados (página {page}):"]
+        for index, header in enumerate(archives, start=start + 1):
+            when = datetime.fromisoformat(header["archived_at"]).strftime("%d/%m/%Y %H:%M")
+            line = f"**{index}.** {when} — {header.get('participants', 0)} participante(s), {header.get('total_tickets', 0)} ficha(s)"
+            if header.get("hashtag"):
+                line += f" — {header['hashtag']}"
+            lines.append(line)
+        lines.append("Use `/historico numero:<n>` para exportar os participantes de um sorteio.")
+        await interaction.followup.send("\n".join(lines), ephemeral=True)
+        return
+    
+    archives = await db.alist_archives(numero - 1, 1) if numero >= 1 else []
+    if not archives:
+        await interaction.followup.send("❌ Sorteio arquivado não encontrado.", ephemeral=True)
+        return
+    
+    header = archives[0]
+    bio = await asyncio.to_thread(archive_export, header["path"], header)
+    archived_at = datetime.fromisoformat(header["archived_at"])
+    await interaction.followup.send(
+        f"📚 Sorteio arquivado em {archived_at.strftime('%d/%m/%Y %H:%M')} "
+        f"({header.get('participants', 0)} participante(s))",
+        file=discord.File(fp=bio, filename=f"historico_{archived_at.strftime('%Y%m%d_%H%M%S')}.txt"),
+        ephemeral=True
+    )
+
 @bot.tree.command(name="blacklist", description="[ADMIN] Gerencia a blacklist")
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(
@@ -1252,7 +1758,7 @@ async def blacklist(
     motivo: Optional[str] = None
 ):
     if acao == "lista":
-        blacklist_data = db.get_blacklist()
+        blacklist_data = await db.aget_blacklist()
         
         if not blacklist_data:
             await interaction.response.send_message(
@@ -1285,20 +1791,21 @@ async def blacklist(
     if acao == "banir":
         reason = motivo or "Não especificado"
         
-        if db.is_registered(usuario.id):
-            participant = db.get_participant(usuario.id)
-            if participant and participant.get("message_id"):
+        if await db.ais_registered(usuario.id):
+            participant = await db.aget_participant(usuario.id)
+            if participant and participant.message_id:
                 try:
-                    channel = interaction.guild.get_channel(db.get_inscricao_channel())
+                    channel = interaction.guild.get_channel(await db.aget_inscricao_channel())
                     if channel:
-                        msg = await channel.fetch_message(participant["message_id"])
+                        msg = await channel.fetch_message(participant.message_id)
                         await msg.delete()
                 except:
                     pass
             
-            db.remove_participant(usuario.id)
+            await db.aremove_participant(usuario.id)
         
-        db.add_to_blacklist(usuario.id, reason, interaction.user.id)
+        await db.aadd_to_blacklist(usuario.id, reason, interaction.user.id)
+        await db.aflush()
         
         await interaction.response.send_message(
             f"✅ {usuario.mention} foi adicionado à blacklist!\n**Motivo**: {reason}",
@@ -1307,7 +1814,7 @@ async def blacklist(
         logger.info(f"{usuario} banido por {interaction.user}: {reason}")
     
     elif acao == "desbanir":
-        if db.remove_from_blacklist(usuario.id):
+        if await db.aremove_from_blacklist(usuario.id):
             await interaction.response.send_message(
                 f"✅ {usuario.mention} foi removido da blacklist!",
                 ephemeral=True
@@ -1331,7 +1838,7 @@ async def chat(
     canal: Optional[discord.TextChannel] = None
 ):
     if acao == "status":
-        chat_lock = db.get_chat_lock()
+        chat_lock = await db.aget_chat_lock()
         status = "🔒 Bloqueado" if chat_lock["enabled"] else "🔓 Desbloqueado"
         
         channel_mention = "Nenhum"
@@ -1358,7 +1865,7 @@ async def chat(
             )
             return
 
-        db.set_chat_lock(True, canal.id)
+        await db.aset_chat_lock(True, canal.id)
         await interaction.response.send_message(
             f"🔒 Chat bloqueado em {canal.mention}!\n"
             f"Apenas administradores podem enviar mensagens.",
@@ -1367,7 +1874,7 @@ async def chat(
         logger.info(f"Chat bloqueado em {canal.name} por {interaction.user}")
     
     elif acao == "off":
-        db.set_chat_lock(False)
+        await db.aset_chat_lock(False)
         await interaction.response.send_message(
             "🔓 Chat desbloqueado!",
             ephemeral=True
@@ -1437,17 +1944,20 @@ async def anunciar(
 @app_commands.default_permissions(administrator=True)
 @app_commands.describe(
     acao="Ação a realizar",
-    usuario="Usuário a adicionar/remover"
+    usuario="Usuário a adicionar/remover",
+    cargo="Cargo a adicionar/remover (todos os membros com o cargo viram moderadores)"
 )
 async def controle_acesso(
     interaction: discord.Interaction,
     acao: Literal["adicionar", "remover", "lista"],
-    usuario: Optional[discord.User] = None
+    usuario: Optional[discord.User] = None,
+    cargo: Optional[discord.Role] = None
 ):
     if acao == "lista":
-        moderators = db.get_moderators()
+        moderators = await db.aget_moderators()
+        moderator_roles = await db.aget_moderator_roles()
         
-        if not moderators:
+        if not moderators and not moderator_roles:
             await interaction.response.send_message(
                 "📋 Nenhum moderador configurado.",
                 ephemeral=True
@@ -1462,24 +1972,48 @@ async def controle_acesso(
         mod_list = []
         for mod_id in moderators:
             try:
-                user = await bot.fetch_user(int(mod_id))
+                user = await bot.fetch_user(mod_id)
                 mod_list.append(f"• {user.mention} ({user.name})")
             except:
                 mod_list.append(f"• ID: {mod_id} (usuário não encontrado)")
+        for role_id in moderator_roles:
+            role = interaction.guild.get_role(role_id) if interaction.guild else None
+            mod_list.append(f"• Cargo {role.mention if role else f'ID: {role_id}'}")
         
         embed.description = "\n".join(mod_list)
         await interaction.response.send_message(embed=embed, ephemeral=True)
         return
     
+    if cargo:
+        if acao == "adicionar":
+            await db.aadd_moderator_role(cargo.id)
+            await interaction.response.send_message(
+                f"✅ Membros com o cargo {cargo.mention} agora têm controle total do bot!",
+                ephemeral=True
+            )
+            logger.info(f"Cargo de moderador adicionado: {cargo} por {interaction.user}")
+        elif await db.aremove_moderator_role(cargo.id):
+            await interaction.response.send_message(
+                f"✅ {cargo.mention} foi removido dos cargos de moderador!",
+                ephemeral=True
+            )
+            logger.info(f"Cargo de moderador removido: {cargo} por {interaction.user}")
+        else:
+            await interaction.response.send_message(
+                f"❌ {cargo.mention} não é um cargo de moderador.",
+                ephemeral=True
+            )
+        return
+    
     if not usuario:
         await interaction.response.send_message(
-            "❌ Você precisa especificar um usuário!",
+            "❌ Você precisa especificar um usuário ou um cargo!",
             ephemeral=True
         )
         return
     
     if acao == "adicionar":
-        db.add_moderator(usuario.id)
+        await db.aadd_moderator(usuario.id)
         await interaction.response.send_message(
             f"✅ {usuario.mention} agora tem controle total do bot!",
             ephemeral=True
@@ -1487,7 +2021,7 @@ async def controle_acesso(
         logger.info(f"Moderador adicionado: {usuario} por {interaction.user}")
     
     elif acao == "remover":
-        if db.remove_moderator(usuario.id):
+        if await db.aremove_moderator(usuario.id):
             await interaction.response.send_message(
                 f"✅ {usuario.mention} foi removido dos moderadores!",
                 ephemeral=True
@@ -1511,7 +2045,7 @@ async def tag_manual(
     usuario: discord.User,
     quantidade: Optional[int] = 1
 ):
-    if not is_admin_or_moderator(interaction):
+    if not await is_admin_or_moderator(interaction):
         await interaction.response.send_message(
             "❌ Você não tem permissão para usar este comando.",
             ephemeral=True
@@ -1527,14 +2061,14 @@ async def tag_manual(
     
     # Define/Remove a TAG manual
     if quantidade == 0:
-        db.remove_manual_tag(usuario.id)
+        await db.aremove_manual_tag(usuario.id)
         await interaction.response.send_message(
             f"✅ TAG removida de {usuario.mention}!",
             ephemeral=True
         )
         logger.info(f"TAG manual removida de {usuario} por {interaction.user}")
     else:
-        db.set_manual_tag(usuario.id, quantidade)
+        await db.aset_manual_tag(usuario.id, quantidade)
         await interaction.response.send_message(
             f"✅ TAG concedida!\n"
             f"**Usuário**: {usuario.mention}\n"
@@ -1573,44 +2107,6 @@ async def sync(interaction: discord.Interaction, guild_id: Optional[str] = None)
             ephemeral=True
         )
 
-def format_tickets_list(tickets: dict, guild: discord.Guild) -> list:
-    lines = []
-    
-    # Ficha base
-    lines.append("• 1 ficha base")
-    
-    # Fichas de cargos
-    if "roles" in tickets and tickets["roles"]:
-        for role_id, info in tickets["roles"].items():
-            role = guild.get_role(int(role_id))
-            role_name = role.name if role else "Cargo Desconhecido"
-            lines.append(f"• +{info['quantity']} ficha(s) do cargo {role_name} ({info['abbreviation']})")
-    
-    # TAG automática
-    if tickets.get("tag", 0) > 0:
-        lines.append(f"• +{tickets['tag']} ficha(s) da TAG")
-    
-    # TAG manual (novo)
-    if tickets.get("manual_tag", 0) > 0:
-        lines.append(f"• +{tickets['manual_tag']} ficha(s) da TAG manual")
-    
-    return lines
-
-def get_total_tickets(tickets: dict) -> int:
-    total = 1  # ficha base
-    
-    # Soma fichas de cargos
-    if "roles" in tickets:
-        total += sum(role["quantity"] for role in tickets["roles"].values())
-    
-    # Soma TAG automática
-    total += tickets.get("tag", 0)
-    
-    # Soma TAG manual (novo)
-    total += tickets.get("manual_tag", 0)
-    
-    return total
-
 if __name__ == "__main__":
     # carrega variáveis de ambiente (já usa load_dotenv no topo)
     BOT_TOKEN = os.getenv("BOT_TOKEN")
@@ -1634,3 +2130,6 @@ if __name__ == "__main__":
     except Exception as e:
         logging.error(f"Erro ao iniciar o bot: {e}", exc_info=True)
         exit(1)
+    finally:
+        # grava alterações pendentes do write-behind antes de sair
+        db.flush_all()
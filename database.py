@@ -1,70 +1,2175 @@
+import asyncio
+import atexit
+import collections.abc
+import concurrent.futures
+import contextlib
+import contextvars
+import functools
+import gc
+import itertools
 import json
 import os
-from typing import Dict, List, Optional, Any
+import shutil
+import threading
+import time
+import unicodedata
+import weakref
+from typing import Dict, Iterable, Iterator, List, Optional, Any
 from datetime import datetime
 import logging
 
+import database_archive
+from database_bloom import BloomFilter
+
+try:
+    import orjson
+except ImportError:  # opcional: acelera leitura/gravação de JSON
+    orjson = None
+
+try:
+    import msgpack
+except ImportError:  # opcional: necessário apenas para DB_FORMAT=msgpack
+    msgpack = None
+
 logger = logging.getLogger(__name__)
 
 DATABASE_FILE = "database.json"
+# diretório com os arquivos de cada servidor (ver use_guild())
+GUILDS_DIR = "guilds"
+# diretório dos sorteios nomeados da partição padrão (os dos servidores ficam em GUILDS_DIR/<id>/)
+RAFFLES_DIR = "raffles"
+# nome (reservado) usado pelos comandos para o sorteio padrão do servidor
+DEFAULT_RAFFLE = "padrao"
 
-def load() -> Dict[str, Any]:
+# formatos de snapshot suportados (DB_FORMAT)
+FORMAT_JSON = "json"
+FORMAT_ORJSON = "orjson"
+FORMAT_MSGPACK = "msgpack"
+# cabeçalho dos snapshots msgpack; arquivos JSON começam com "{"
+MSGPACK_MAGIC = b"\x00RDBMSGPACK1\n"
+MSGPACK_EXTENSIONS = (".msgpack", ".mpk")
+
+# segmentos do estado, cada um com seu próprio snapshot/diário: a configuração
+# (pequena, lida pelos caminhos quentes) fica no DATABASE_FILE e os participantes
+# em um arquivo à parte, carregado só quando alguma operação precisa deles
+CONFIG_SEGMENT = "config"
+PARTICIPANTS_SEGMENT = "participants"
+SEGMENTS = (CONFIG_SEGMENT, PARTICIPANTS_SEGMENT)
+# chaves da configuração que pertencem ao servidor e não ao sorteio padrão
+RAFFLE_KEYS = ("raffles", "selected_raffle")
+# versão do formato dos dados gravada em cada segmento (ver _migrate_state())
+# 2: tipos canônicos (ids int, button_message_id em lista...)
+# 3: moderator_roles
+# 4: tag com uma lista de TAGs (texto + fichas de cada uma)
+SCHEMA_VERSION = 4
+
+def _default_data() -> Dict[str, Any]:
     """
-    Carrega o banco de dados JSON.
+    Estrutura inicial do banco de dados (usada quando o arquivo não existe).
     
     Returns:
         Dict com estrutura do banco de dados
     """
-    if not os.path.exists(DATABASE_FILE):
+    return {
+        "schema_version": SCHEMA_VERSION,
+        "participants": {},
+        "bonus_roles": {},
+        "hashtag": {
+            "value": None,
+            "locked": False
+        },
+        # TAGs do servidor: cada uma com o texto e as fichas que concede
+        "tag": {
+            "enabled": False,
+            "tags": []
+        },
+        "inscricao_channel": None,
+        # lista de message_ids das mensagens com o botão de inscrição
+        "button_message_id": [],
+        "inscricoes_closed": False,
+        "blacklist": {},
+        "chat_lock": {
+            "enabled": False,
+            "channel_id": None
+        },
+        "moderators": [],
+        # cargos cujos membros também são moderadores
+        "moderator_roles": [],
+        # sorteios nomeados do servidor (identificador -> {"name", "created_at"}) e o
+        # sorteio usado pelos comandos de administração (None = sorteio padrão)
+        "raffles": {},
+        "selected_raffle": None
+    }
+
+@contextlib.contextmanager
+def _gc_paused():
+    """Pausa o coletor de lixo durante a criação de muitos objetos de uma vez."""
+    enabled = gc.isenabled()
+    gc.disable()
+    try:
+        yield
+    finally:
+        if enabled:
+            gc.enable()
+
+def _int(value: Any, default: Optional[int] = 0) -> Optional[int]:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+# tuplas de cargos já vistas: participantes com os mesmos cargos compartilham o mesmo objeto
+_role_tuples: Dict[tuple, tuple] = {}
+
+def _intern_roles(roles: tuple) -> tuple:
+    if not roles:
+        return ()
+    return _role_tuples.setdefault(roles, roles)
+
+class Participant:
+    """
+    Participante do sorteio mantido em memória.
+    
+    Registro compacto (__slots__, ids inteiros e cargos em tuplas compartilhadas)
+    no lugar dos dicts aninhados do database.json; a conversão para o formato JSON
+    só acontece ao ler e gravar o arquivo ou o backend. Os registros não são
+    alterados no lugar: cada alteração grava um novo registro (ver replace()).
+    
+    roles guarda só os ids dos cargos bônus que o membro tem; quantidade e
+    abreviação vêm de bonus_roles (ver get_role_lookup()).
+    """
+    __slots__ = ("user_id", "first_name", "last_name", "base", "roles", "tag",
+                 "manual_tag", "message_id", "timestamp")
+    
+    def __init__(self, user_id: int, first_name: str, last_name: str, base: int = 1,
+                 roles: tuple = (), tag: int = 0, manual_tag: int = 0,
+                 message_id: Optional[int] = None, timestamp: Optional[str] = None):
+        self.user_id = user_id
+        self.first_name = first_name
+        self.last_name = last_name
+        self.base = base
+        self.roles = roles
+        self.tag = tag
+        self.manual_tag = manual_tag
+        self.message_id = message_id
+        self.timestamp = timestamp
+    
+    @classmethod
+    def from_json(cls, user_id: Any, raw: Dict[str, Any]) -> "Participant":
+        """Converte um participante no formato canônico do database.json (ver _migrate_state())."""
+        return cls(
+            int(user_id),
+            raw["first_name"],
+            raw["last_name"],
+            *_ticket_values(raw["tickets"]),
+            raw.get("message_id"),
+            raw.get("timestamp")
+        )
+    
+    def to_json(self) -> Dict[str, Any]:
+        """Participante no formato do database.json."""
         return {
-            "participants": {},
-            "bonus_roles": {},
-            "hashtag": {
-                "value": None,
-                "locked": False
-            },
-            "tag": {
-                "enabled": False,
-                "text": None,
-                "quantity": 1
-            },
-            "inscricao_channel": None,
-            # agora armazena lista de message_ids (retrocompatível com single)
-            "button_message_id": [],
-            "inscricoes_closed": False,
-            "blacklist": {},
-            "chat_lock": {
-                "enabled": False,
-                "channel_id": None
-            },
-            "moderators": []
+            "first_name": self.first_name,
+            "last_name": self.last_name,
+            "tickets": self.tickets,
+            "message_id": self.message_id,
+            "timestamp": self.timestamp
+        }
+    
+    @property
+    def tickets(self) -> Dict[str, Any]:
+        """Fichas no formato usado pelo utils e pelo database.json (base, roles, tag, manual_tag)."""
+        tickets: Dict[str, Any] = {"base": self.base}
+        if self.roles:
+            tickets["roles"] = list(self.roles)
+        if self.tag:
+            tickets["tag"] = self.tag
+        if self.manual_tag:
+            tickets["manual_tag"] = self.manual_tag
+        return tickets
+    
+    def replace(self, **changes) -> "Participant":
+        """Cópia do registro com os campos informados alterados."""
+        values = {name: getattr(self, name) for name in self.__slots__}
+        values.update(changes)
+        return Participant(**values)
+    
+    def __repr__(self) -> str:
+        return f"Participant({self.user_id}, {self.first_name!r}, {self.last_name!r})"
+
+def _ticket_values(tickets: Optional[Dict[str, Any]]) -> tuple:
+    """(base, roles, tag, manual_tag) de um Participant a partir de um dict de fichas."""
+    if not tickets:
+        return (1, (), 0, 0)
+    roles = tickets.get("roles")
+    return (
+        tickets.get("base", 1),
+        _intern_roles(tuple(roles)) if roles else (),
+        tickets.get("tag", 0),
+        tickets.get("manual_tag", 0)
+    )
+
+def _ticket_fields(tickets: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """Campos base/roles/tag/manual_tag de um Participant a partir de um dict de fichas."""
+    return dict(zip(("base", "roles", "tag", "manual_tag"), _ticket_values(tickets)))
+
+def _participants_from_json(participants: Dict[str, Any]) -> Dict[int, Participant]:
+    # cria um objeto por participante de uma vez; pausar o GC evita varreduras inúteis
+    with _gc_paused():
+        from_json = Participant.from_json
+        return {int(user_id): from_json(user_id, raw) for user_id, raw in participants.items()}
+
+def _participants_to_json(participants: Dict[int, Participant]) -> Dict[str, Any]:
+    with _gc_paused():
+        return {str(user_id): participant.to_json() for user_id, participant in participants.items()}
+
+def _from_json_state(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Estado lido do arquivo/backend -> estado em memória (participantes como Participant)."""
+    if "participants" in data:
+        data["participants"] = _participants_from_json(data["participants"] or {})
+    return data
+
+def _to_json_state(data: Dict[str, Any]) -> Dict[str, Any]:
+    """Cópia rasa do estado em memória no formato do database.json."""
+    payload = dict(data)
+    if "participants" in data:
+        payload["participants"] = _participants_to_json(data["participants"])
+    return payload
+
+def _record_to_json(record: Dict[str, Any]) -> Dict[str, Any]:
+    """Registro set/del do estado em memória no formato gravado no diário."""
+    path = record["path"]
+    if path[0] != "participants":
+        return record
+    encoded = {"op": record["op"], "path": ["participants"] + [str(key) for key in path[1:]]}
+    if record["op"] == "set":
+        value = record["value"]
+        if len(path) == 1:
+            value = _participants_to_json(value)
+        elif isinstance(value, Participant):
+            value = value.to_json()
+        encoded["value"] = value
+    return encoded
+
+# --- esquema ---------------------------------------------------------------
+#
+# Os arquivos guardam a versão do formato em "schema_version" (ausente = 1).
+# Arquivos antigos são convertidos uma única vez, ao serem carregados, para os
+# tipos canônicos abaixo e regravados com a versão atual; depois disso os
+# caminhos quentes usam os valores diretamente, sem conversões defensivas.
+#
+#   button_message_id  lista de int, sem repetições
+#   inscricao_channel  int ou None
+#   moderators         lista de int
+#   moderator_roles    lista de int
+#   tag                {"enabled": bool, "tags": [{"text": str, "quantity": int}]}
+#   bonus_roles        str(role_id) -> {"quantity": int, "abbreviation": str}
+#   blacklist          str(user_id) -> {"reason", "banned_by": int ou None, "timestamp"}
+#   manual_tags        str(user_id) -> int
+#   participants       message_id int ou None; tickets com base/tag/manual_tag int
+#                      e roles como lista de int
+
+def _migrate_config(data: Dict[str, Any]) -> None:
+    """Converte as chaves da configuração para os tipos canônicos (no lugar)."""
+    # versões antigas guardavam um único id de mensagem em vez da lista
+    mids = data.get("button_message_id")
+    if not isinstance(mids, list):
+        mids = [mids] if mids else []
+    for key, value in _config_defaults().items():
+        if value is not None and not isinstance(data.get(key), type(value)):
+            data[key] = value
+        else:
+            data.setdefault(key, value)
+    data["button_message_id"] = list(dict.fromkeys(
+        mid for mid in (_int(mid, None) for mid in mids) if mid is not None
+    ))
+    data["inscricao_channel"] = _int(data.get("inscricao_channel"), None)
+    data["inscricoes_closed"] = bool(data.get("inscricoes_closed"))
+
+    chat_lock = data["chat_lock"]
+    chat_lock["enabled"] = bool(chat_lock.get("enabled"))
+    chat_lock["channel_id"] = _int(chat_lock.get("channel_id"), None)
+    hashtag = data["hashtag"]
+    hashtag["locked"] = bool(hashtag.get("locked"))
+    tag = data["tag"]
+    tag["enabled"] = bool(tag.get("enabled"))
+    # versões antigas tinham uma única TAG (text/quantity)
+    tags = tag.pop("tags", None)
+    if not isinstance(tags, list):
+        tags = [{"text": tag.get("text"), "quantity": tag.get("quantity", 1)}]
+    tag.pop("text", None)
+    tag.pop("quantity", None)
+    tag["tags"] = _tag_list(tags)
+
+    data["bonus_roles"] = {
+        str(int(role_id)): {
+            "quantity": _int((info or {}).get("quantity", 0)),
+            "abbreviation": (info or {}).get("abbreviation") or ""
+        }
+        for role_id, info in data["bonus_roles"].items() if _int(role_id, None) is not None
+    }
+    data["blacklist"] = {
+        str(int(user_id)): {
+            "reason": (entry or {}).get("reason"),
+            "banned_by": _int((entry or {}).get("banned_by"), None),
+            "timestamp": (entry or {}).get("timestamp")
+        }
+        for user_id, entry in data["blacklist"].items() if _int(user_id, None) is not None
+    }
+    for key in ("moderators", "moderator_roles"):
+        data[key] = list(dict.fromkeys(
+            item for item in (_int(item, None) for item in data[key]) if item is not None
+        ))
+    if isinstance(data.get("manual_tags"), dict):
+        data["manual_tags"] = {
+            str(user_id): _int(quantity)
+            for user_id, quantity in data["manual_tags"].items()
+        }
+
+def _tag_list(tags: Iterable[Any]) -> List[Dict[str, Any]]:
+    """TAGs no formato canônico: sem texto vazio e sem repetir o mesmo texto (casefold)."""
+    canonical: Dict[str, Dict[str, Any]] = {}
+    for entry in tags:
+        text = ((entry or {}).get("text") or "").strip()
+        if text:
+            canonical[text.casefold()] = {"text": text, "quantity": _int(entry.get("quantity", 1), 1)}
+    return list(canonical.values())
+
+def _migrate_participant(raw: Dict[str, Any]) -> Dict[str, Any]:
+    """Participante no formato canônico do database.json."""
+    message_id = raw.get("message_id")
+    if message_id is None:
+        # ids de mensagem gravados por versões antigas com outros nomes de chave
+        message_id = raw.get("msg_id") or raw.get("mid") or raw.get("message") or raw.get("messageId")
+    tickets = raw.get("tickets") or {}
+    canonical = {"base": _int(tickets.get("base", 1), 1)}
+    # lista de ids; arquivos antigos guardam um dict role_id -> {quantity, abbreviation}
+    roles = [role_id for role_id in (_int(rid, None) for rid in tickets.get("roles") or ()) if role_id is not None]
+    if roles:
+        canonical["roles"] = roles
+    for key in ("tag", "manual_tag"):
+        if _int(tickets.get(key, 0)):
+            canonical[key] = _int(tickets.get(key, 0))
+    return {
+        "first_name": raw.get("first_name") or "",
+        "last_name": raw.get("last_name") or "",
+        "tickets": canonical,
+        "message_id": _int(message_id, None),
+        "timestamp": raw.get("timestamp")
+    }
+
+def _migrate_state(data: Dict[str, Any], config: bool = True) -> bool:
+    """
+    Atualiza um estado lido do disco (formato do database.json) para SCHEMA_VERSION.
+
+    Args:
+        data: Estado lido de um segmento (alterado no lugar)
+        config: False para o segmento de participantes (sem chaves de configuração)
+
+    Returns:
+        True se o estado estava em uma versão anterior (e precisa ser regravado)
+    """
+    version = _int(data.get("schema_version"), 1)
+    if version >= SCHEMA_VERSION:
+        return False
+    if config:
+        _migrate_config(data)
+    if data.get("participants"):
+        data["participants"] = {
+            str(int(user_id)): _migrate_participant(raw or {})
+            for user_id, raw in data["participants"].items() if _int(user_id, None) is not None
+        }
+    data["schema_version"] = SCHEMA_VERSION
+    logger.info(f"Dados convertidos do esquema {version} para o esquema {SCHEMA_VERSION}")
+    return True
+
+class _Segment:
+    """Estado de persistência de um segmento (assinatura e diário próprios)."""
+    
+    def __init__(self):
+        # assinatura do arquivo/backend quando o segmento foi lido ou gravado
+        self.signature: Optional[tuple] = None
+        # número de sequência do último registro do diário do segmento
+        self.seq = 0
+        # registros no diário do segmento desde a última compactação
+        self.records = 0
+
+# números de versão da configuração, únicos entre todas as partições
+_config_versions = itertools.count(1)
+
+class _Store:
+    """
+    Estado do banco de dados mantido em memória.
+    
+    O conteúdo do arquivo é lido uma única vez e passa a ser a fonte autoritativa;
+    só é relido quando a assinatura do arquivo (mtime/tamanho) muda no disco,
+    por exemplo quando alguém edita o database.json manualmente.
+    
+    A configuração é sempre carregada; data["participants"] só existe depois que
+    o segmento de participantes é carregado (ver load()).
+    
+    Há uma _Store por servidor e sorteio (partição); guild_id None é a partição
+    padrão, gravada em DATABASE_FILE e usada por scripts e pelo bot de um único
+    servidor. raffle None é o sorteio padrão do servidor, que também guarda a
+    configuração do servidor inteiro (blacklist, moderadores, bloqueio de chat e a
+    lista de sorteios).
+    """
+    
+    def __init__(self, guild_id: Optional[int] = None, raffle: Optional[str] = None):
+        self.guild_id = guild_id
+        self.raffle = raffle
+        self.key = (guild_id, raffle)
+        # backend da partição (ex.: SQLite); None = arquivos JSON
+        self.backend = None
+        self.data: Optional[Dict[str, Any]] = None
+        self.path: Optional[str] = None
+        self.segments: Dict[str, _Segment] = {name: _Segment() for name in SEGMENTS}
+        # registros ainda não persistidos (set/del por caminho), usados pelo diário
+        self.ops: List[Dict[str, Any]] = []
+        # True quando o estado mudou sem registros (exige snapshot completo)
+        self.full_write = False
+        # transações abertas (aninhadas) e desfazer das alterações feitas dentro delas
+        self.batch_depth = 0
+        self.undo: List[tuple] = []
+        # índice nome normalizado -> user_id (int, ou set em caso de nomes repetidos);
+        # construído sob demanda e mantido a cada alteração de participante
+        self.name_index: Optional[Dict[str, Any]] = None
+        # agregados de get_statistics(), mantidos da mesma forma
+        self.stats: Optional[_Stats] = None
+        # role_id -> (quantity, abbreviation) dos cargos bônus; refeito quando bonus_roles muda
+        self.role_lookup: Optional[Dict[int, tuple]] = None
+        # moderadores, cargos de moderador e blacklist com ids int (ver _access())
+        self.access: Optional[_AccessIndex] = None
+        # filtro de Bloom dos inscritos + blacklist usado pelo botão de inscrição (ver screen_click())
+        self.click_filter: Optional[BloomFilter] = None
+        # user_id -> nomes do Discord normalizados dos inscritos (ver get_member_names())
+        self.member_names: Dict[int, tuple] = {}
+        # muda a cada alteração/releitura da configuração (ver get_config_version())
+        self.config_version = next(_config_versions)
+        # weakref para a época dos snapshots que compartilham o dict de participantes
+        # atual (ver snapshot()); enquanto houver algum vivo, o dict não é alterado no lugar
+        self.snapshot_epoch: Optional[weakref.ref] = None
+        # alterações ainda não gravadas (write-behind / escritor único) e gravação em andamento
+        self.dirty = 0
+        self.flushing = False
+        # alterações na fila do escritor único; a partição não é descartada enquanto houver
+        self.pending = 0
+        self.last_used = time.monotonic()
+    
+    @property
+    def file(self) -> str:
+        """Arquivo do segmento de configuração da partição."""
+        return partition_file(self.guild_id, self.raffle)
+    
+    def location(self) -> str:
+        """Arquivo de onde o estado é lido (JSON ou o arquivo do backend)."""
+        return self.backend.path if self.backend is not None else self.file
+    
+    def is_idle(self) -> bool:
+        """True quando a partição pode ser descartada sem perder alterações."""
+        return not (self.dirty or self.flushing or self.batch_depth or self.pending)
+    
+    def close(self) -> None:
+        if self.backend is not None:
+            self.backend.close()
+            self.backend = None
+        self.invalidate()
+    
+    def has_participants(self) -> bool:
+        return self.data is not None and PARTICIPANTS_SEGMENT in self.data
+    
+    def is_fresh(self, path: str, segment: str, signature: Optional[tuple]) -> bool:
+        if self.data is None or self.path != path:
+            return False
+        if segment == PARTICIPANTS_SEGMENT and not self.has_participants():
+            return False
+        return self.segments[segment].signature == signature
+    
+    def set(self, path: str, data: Dict[str, Any]):
+        if data is not self.data:
+            self.drop_indexes()
+        self.data = data
+        self.path = path
+    
+    def invalidate(self):
+        self.data = None
+        self.path = None
+        self.segments = {name: _Segment() for name in SEGMENTS}
+        self.ops = []
+        self.full_write = False
+        self.drop_indexes()
+    
+    def drop_indexes(self):
+        self.name_index = None
+        self.stats = None
+        self.role_lookup = None
+        self.access = None
+        self.click_filter = None
+        self.member_names = {}
+        self.snapshot_epoch = None
+        self.config_version = next(_config_versions)
+    
+    def own_participants(self):
+        """
+        Copy-on-write: antes de alterar no lugar o dict de participantes ainda
+        compartilhado com algum snapshot, o estado passa a usar uma cópia rasa
+        própria (os registros Participant continuam compartilhados).
+        """
+        epoch = self.snapshot_epoch
+        if epoch is not None:
+            self.snapshot_epoch = None
+            if epoch() is not None:
+                self.data["participants"] = dict(self.data["participants"])
+                _snapshots.copies += 1
+    
+    def on_config(self, data: Dict[str, Any], path: List[Any]) -> None:
+        """Atualiza os índices derivados após uma alteração fora dos participantes."""
+        section = path[0]
+        self.config_version = next(_config_versions)
+        if section == "bonus_roles":
+            self.role_lookup = None
+        elif self.access is not None and section in _AccessIndex.SECTIONS:
+            self.access.update(data, path)
+        if section == "blacklist":
+            # a blacklist vale para todos os sorteios do servidor
+            user_ids = [path[1]] if len(path) == 2 else list(data.get("blacklist") or ())
+            for store in _loaded_stores():
+                if store.guild_id == self.guild_id:
+                    for user_id in user_ids:
+                        store.filter_add(int(user_id))
+    
+    def filter_add(self, user_id: int) -> None:
+        """Marca um id no filtro do botão; um filtro cheio é descartado e refeito maior."""
+        click_filter = self.click_filter
+        if click_filter is not None:
+            click_filter.add(user_id)
+            if click_filter.full:
+                self.click_filter = None
+    
+    def on_participant(self, user_id: int, old: Optional[Participant], new: Optional[Participant]):
+        """Atualiza os índices derivados após um participante ser criado/alterado/removido."""
+        if new is not None and old is None:
+            self.filter_add(user_id)
+        elif new is None:
+            self.member_names.pop(user_id, None)
+        if self.name_index is not None:
+            old_key = _participant_name_key(old) if old else None
+            new_key = _participant_name_key(new) if new else None
+            if old_key != new_key:
+                if old_key is not None:
+                    _index_remove(self.name_index, old_key, user_id)
+                if new_key is not None:
+                    _index_add(self.name_index, new_key, user_id)
+        if self.stats is not None:
+            if old:
+                self.stats.apply(old, -1)
+            if new:
+                self.stats.apply(new, 1)
+
+class _AccessIndex:
+    """
+    Moderadores, cargos de moderador e blacklist com ids int, usados pelas
+    verificações de permissão (a cada comando de administração e a cada mensagem
+    em um chat bloqueado) e pelo botão de inscrição.
+    
+    Montado uma vez a partir da configuração e mantido a cada alteração; o arquivo
+    continua guardando listas (e a blacklist com chaves str).
+    
+    add_moderator() e afins alteram os sets com add()/discard() junto com a nova
+    lista; só uma lista que não veio deles (ex.: desfeita por um rollback) refaz o set.
+    """
+    SECTIONS = ("moderators", "moderator_roles", "blacklist")
+    
+    def __init__(self, data: Dict[str, Any]):
+        self.moderators = set(data["moderators"])
+        self.moderator_roles = set(data["moderator_roles"])
+        # lista da configuração refletida em cada set
+        self._sources = {"moderators": data["moderators"], "moderator_roles": data["moderator_roles"]}
+        self.blacklist: Dict[int, Dict[str, Any]] = {
+            int(user_id): entry for user_id, entry in data["blacklist"].items()
         }
     
+    def add(self, section: str, value: int, values: List[int]) -> None:
+        """value entra no set da seção; values é a lista que será gravada."""
+        getattr(self, section).add(value)
+        self._sources[section] = values
+    
+    def discard(self, section: str, value: int, values: List[int]) -> None:
+        """value sai do set da seção; values é a lista que será gravada."""
+        getattr(self, section).discard(value)
+        self._sources[section] = values
+    
+    def update(self, data: Dict[str, Any], path: List[Any]) -> None:
+        section = path[0]
+        if section in self._sources:
+            values = data.get(section) or []
+            if values is not self._sources[section]:
+                setattr(self, section, set(values))
+                self._sources[section] = values
+        elif len(path) == 2:
+            entry = (data.get("blacklist") or {}).get(path[1])
+            if entry is None:
+                self.blacklist.pop(int(path[1]), None)
+            else:
+                self.blacklist[int(path[1])] = entry
+        else:
+            self.blacklist = {int(user_id): entry for user_id, entry in (data.get("blacklist") or {}).items()}
+
+class _Stats:
+    """
+    Totais usados por get_statistics(), atualizados a cada participante
+    adicionado/alterado/removido em vez de recalculados a cada consulta.
+    
+    As fichas de cargo não entram em total_tickets: são contadas por cargo e
+    multiplicadas pela quantidade atual do cargo na consulta.
+    """
+    
+    def __init__(self):
+        # fichas base + TAG automática + TAG manual
+        self.total_tickets = 0
+        self.participants_with_tag = 0
+        # role_id -> quantidade de participantes com o cargo
+        self.roles: Dict[int, int] = {}
+    
+    def apply(self, participant: Participant, sign: int) -> None:
+        """Soma (sign=1) ou subtrai (sign=-1) a contribuição de um participante."""
+        self.total_tickets += sign * participant.base
+        
+        for role_id in participant.roles:
+            count = self.roles.get(role_id, 0) + sign
+            if count > 0:
+                self.roles[role_id] = count
+            else:
+                self.roles.pop(role_id, None)
+        
+        tag_amount = participant.tag
+        manual = participant.manual_tag
+        if tag_amount > 0:
+            self.total_tickets += sign * tag_amount
+        if manual > 0:
+            self.total_tickets += sign * manual
+        # TAG automática e manual contam uma única vez como participante com TAG
+        if tag_amount > 0 or manual > 0:
+            self.participants_with_tag += sign
+    
+    def totals(self) -> tuple:
+        """Valores comparados na verificação."""
+        return (self.total_tickets, self.participants_with_tag, self.roles)
+
+class _WriteBehind:
+    """
+    Configuração e métricas do modo write-behind.
+    
+    Com o modo ativo, save() só marca o estado como sujo; uma thread em segundo plano
+    grava o arquivo no máximo uma vez por intervalo (ou antes, ao acumular max_dirty
+    alterações), juntando várias alterações em uma única escrita.
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.interval = 2.0
+        self.max_dirty = 100
+        # True enquanto o escritor único aplica um grupo: a gravação fica para o flush
+        # que ele faz em seguida, fora do event loop (ver _MutationActor)
+        self.deferred = False
+        self.thread: Optional[threading.Thread] = None
+        self.wakeup = threading.Event()
+        # métricas
+        self.writes = 0
+        self.coalesced = 0
+        self.last_flush_ms = 0.0
+        self.max_flush_ms = 0.0
+        self.total_flush_ms = 0.0
+
+_writer = _WriteBehind()
+
+class _Journal:
+    """
+    Configuração do modo diário (journal).
+    
+    Cada alteração vira uma linha no ".journal" do segmento alterado (custo O(1));
+    a cada compact_every registros o diário do segmento é consolidado em um novo
+    snapshot. A numeração e a contagem de registros ficam em cada _Segment.
+    """
+    
+    def __init__(self):
+        self.enabled = False
+        self.compact_every = 1000
+    
+_journal = _Journal()
+
+# backend de persistência ("json" ou "sqlite") e arquivo SQLite da partição padrão
+_backend_name = "json"
+_sqlite_file = "database.db"
+
+# formato usado ao gravar snapshots (a leitura detecta o formato automaticamente)
+_snapshot_format = FORMAT_ORJSON if orjson is not None else FORMAT_JSON
+
+# confere os contadores de estatísticas a cada consulta (DB_VERIFY_STATS)
+_verify_stats = False
+
+JOURNAL_SUFFIX = ".journal"
+BACKUP_SUFFIX = ".bak"
+
+# protege o estado em memória contra a serialização feita pela thread de escrita
+_lock = threading.RLock()
+# garante que apenas um flush grave o arquivo por vez
+_flush_lock = threading.Lock()
+
+# servidor e sorteio (partição) usados pelas funções do módulo no contexto atual; cada
+# tarefa do asyncio tem sua própria cópia, então handlers simultâneos não se misturam
+_guild: contextvars.ContextVar = contextvars.ContextVar("db_guild", default=None)
+_raffle: contextvars.ContextVar = contextvars.ContextVar("db_raffle", default=None)
+
+class _Partitions:
+    """
+    Partições carregadas (uma _Store por servidor e sorteio).
+    
+    Cada partição é carregada na primeira interação e descartada da memória depois
+    de idle_seconds sem uso, ou antes, pelo critério LRU, quando há mais de
+    max_loaded partições. Partições com alterações não gravadas nunca são descartadas.
+    """
+    
+    def __init__(self):
+        self.stores: Dict[tuple, _Store] = {}
+        self.max_loaded = 64
+        self.idle_seconds = 900.0
+        self.last_sweep = time.monotonic()
+        # métricas
+        self.opened = 0
+        self.evicted = 0
+
+_partitions = _Partitions()
+
+def guild_file(guild_id: Optional[int]) -> str:
+    """
+    Arquivo do segmento de configuração de um servidor
+    (DATABASE_FILE para a partição padrão).
+    """
+    if guild_id is None:
+        return DATABASE_FILE
+    return os.path.join(GUILDS_DIR, f"{guild_id}.json")
+
+def partition_file(guild_id: Optional[int], raffle: Optional[str]) -> str:
+    """
+    Arquivo do segmento de configuração de um sorteio
+    (guild_file() para o sorteio padrão do servidor).
+    """
+    if raffle is None:
+        return guild_file(guild_id)
+    if guild_id is None:
+        return os.path.join(RAFFLES_DIR, f"{raffle}.json")
+    return os.path.join(GUILDS_DIR, str(guild_id), f"{raffle}.json")
+
+def raffle_slug(name: Optional[str]) -> Optional[str]:
+    """
+    Identificador de um sorteio a partir do nome digitado: minúsculas, sem acentos,
+    espaços trocados por "-" e só letras, números, "-" e "_" (até 32 caracteres).
+    É usado no nome do arquivo e no custom_id do botão de inscrição.
+    
+    Args:
+        name: Nome do sorteio
+        
+    Returns:
+        O identificador; None para o sorteio padrão (nome vazio ou DEFAULT_RAFFLE)
+        
+    Raises:
+        ValueError: Se o nome não tiver nenhum caractere válido
+    """
+    text = unicodedata.normalize("NFKD", str(name or "").strip().casefold())
+    if not text:
+        return None
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    slug = "".join(ch if ch.isascii() and (ch.isalnum() or ch in "-_") else "-" if ch.isspace() else ""
+                   for ch in text).strip("-")[:32]
+    if not slug:
+        raise ValueError(f"Nome de sorteio inválido: {name!r}")
+    return None if slug == DEFAULT_RAFFLE else slug
+
+def use_guild(guild_id: Optional[int]) -> None:
+    """
+    Seleciona o servidor cujos dados as funções do módulo usam no contexto atual
+    (a tarefa do asyncio ou a thread). O bot chama no início de cada interação.
+    Volta para o sorteio padrão do servidor (ver use_raffle()).
+    
+    Args:
+        guild_id: ID do servidor (None = partição padrão)
+    """
+    _guild.set(int(guild_id) if guild_id is not None else None)
+    _raffle.set(None)
+
+def use_raffle(raffle: Optional[str]) -> None:
+    """
+    Seleciona o sorteio do servidor atual usado no contexto atual: participantes,
+    hashtag, TAG, cargos bônus e botões passam a ser os desse sorteio. Blacklist,
+    moderadores e bloqueio de chat são do servidor e valem para todos os sorteios.
+    
+    Args:
+        raffle: Identificador ou nome do sorteio (None/DEFAULT_RAFFLE = sorteio padrão)
+    """
+    _raffle.set(raffle_slug(raffle))
+
+def current_raffle() -> Optional[str]:
+    """Sorteio selecionado no contexto atual (None = sorteio padrão)."""
+    return _raffle.get()
+
+@contextlib.contextmanager
+def partition(guild_id: Optional[int], raffle: Optional[str] = None):
+    """
+    Usa os dados do servidor (e sorteio) informado dentro do bloco.
+    
+    Exemplo:
+        with db.partition(guild.id, "natal"):
+            ids = db.get_button_message_id()
+    """
+    guild_token = _guild.set(int(guild_id) if guild_id is not None else None)
+    raffle_token = _raffle.set(raffle_slug(raffle))
+    try:
+        yield
+    finally:
+        _raffle.reset(raffle_token)
+        _guild.reset(guild_token)
+
+def _guild_scope(fn):
+    """
+    Executa fn no sorteio padrão do servidor atual, onde fica a configuração que vale
+    para o servidor inteiro (blacklist, moderadores, bloqueio de chat, sorteios).
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        token = _raffle.set(None)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            _raffle.reset(token)
+    wrapper.guild_wide = True
+    return wrapper
+
+def _partition() -> _Store:
+    """_Store do servidor e sorteio atuais, aberta sob demanda."""
+    key = (_guild.get(), _raffle.get())
+    store = _partitions.stores.get(key)
+    now = time.monotonic()
+    if store is None:
+        store = _open_partition(key)
+    elif now - _partitions.last_sweep > 60:
+        with _lock:
+            _partitions.last_sweep = now
+            _evict(now)
+    store.last_used = now
+    return store
+
+def _open_partition(key: tuple) -> _Store:
+    with _lock:
+        store = _partitions.stores.get(key)
+        if store is None:
+            store = _Store(*key)
+            directory = os.path.dirname(store.file)
+            if directory:
+                os.makedirs(directory, exist_ok=True)
+            store.backend = _open_backend(store)
+            _partitions.stores[key] = store
+            _partitions.opened += 1
+            _evict(time.monotonic())
+        return store
+
+def _evict(now: float) -> None:
+    """Descarta as partições ociosas ou excedentes (chamar com _lock adquirido)."""
+    stores = _partitions.stores
+    current = (_guild.get(), _raffle.get())
+    candidates = sorted(
+        (store for key, store in stores.items()
+         if key != (None, None) and key != current and store.is_idle()),
+        key=lambda store: store.last_used
+    )
+    excess = len(stores) - _partitions.max_loaded
+    for store in candidates:
+        if excess <= 0 and now - store.last_used < _partitions.idle_seconds:
+            break
+        del stores[store.key]
+        store.close()
+        _partitions.evicted += 1
+        excess -= 1
+        logger.debug(f"Partição {store.file} descartada da memória")
+
+def _open_backend(store: _Store):
+    """Backend da partição conforme DB_BACKEND (None para arquivos JSON)."""
+    if _backend_name != "sqlite":
+        return None
+    from database_sqlite import SqliteBackend
+    json_file = store.file
+    if store.key == (None, None):
+        path = _sqlite_file
+    else:
+        path = os.path.splitext(json_file)[0] + ".db"
+    backend = SqliteBackend(path)
+    if backend.is_empty() and _signature(json_file) is not None:
+        backend.replace_all(read_json_files(json_file))
+        logger.info(f"{json_file} migrado para {backend.path}")
+    return backend
+
+def _loaded_stores() -> List[_Store]:
+    return list(_partitions.stores.values())
+
+def _mutation(fn):
+    """
+    Executa uma função que altera o banco com o lock do estado adquirido.
+    """
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with _lock:
+            return fn(*args, **kwargs)
+    return wrapper
+
+def _apply_record(data: Dict[str, Any], record: Dict[str, Any]) -> None:
+    """
+    Aplica um registro {"op": "set"|"del", "path": [...], "value": ...} ao estado.
+    """
+    path = record["path"]
+    parent = data
+    for key in path[:-1]:
+        if record["op"] == "del" and key not in parent:
+            return
+        parent = parent.setdefault(key, {})
+    if record["op"] == "set":
+        parent[path[-1]] = record["value"]
+    else:
+        parent.pop(path[-1], None)
+
+def _set(data: Dict[str, Any], path: tuple, value: Any) -> None:
+    """
+    Define data[path] = value e registra a alteração para o diário.
+    """
+    _record(data, {"op": "set", "path": list(path), "value": value})
+
+def _delete(data: Dict[str, Any], path: tuple) -> None:
+    """
+    Remove data[path] e registra a alteração para o diário.
+    """
+    _record(data, {"op": "del", "path": list(path)})
+
+def _record(data: Dict[str, Any], record: Dict[str, Any]) -> None:
+    store = _partition()
+    path = record["path"]
+    if store.batch_depth:
+        store.undo.append(_undo_entry(data, path))
+    if path[0] != "participants":
+        _apply_record(data, record)
+        store.on_config(data, path)
+    elif len(path) == 1:
+        # a seção inteira foi substituída: os índices são reconstruídos sob demanda
+        _apply_record(data, record)
+        store.drop_indexes()
+    else:
+        store.own_participants()
+        user_id = path[1]
+        old = data["participants"].get(user_id)
+        _apply_record(data, record)
+        store.on_participant(user_id, old, data["participants"].get(user_id))
+    store.ops.append(record)
+
+def _undo_entry(data: Dict[str, Any], path: List[str]) -> tuple:
+    """(caminho, existia, valor anterior) para desfazer uma alteração."""
+    parent = data
+    for key in path[:-1]:
+        if not isinstance(parent, dict) or key not in parent:
+            return (path, False, None)
+        parent = parent[key]
+    if isinstance(parent, dict) and path[-1] in parent:
+        return (path, True, parent[path[-1]])
+    return (path, False, None)
+
+@contextlib.contextmanager
+def transaction():
+    """
+    Agrupa várias alterações em uma única gravação.
+    
+    O estado é carregado uma vez, as alterações são aplicadas em memória e persistidas
+    juntas ao sair do bloco; se ocorrer uma exceção, todas são desfeitas. Transações
+    aninhadas fazem parte da transação externa.
+    
+    Não use await dentro do bloco: outras tarefas do event loop poderiam alterar o
+    banco no meio da transação.
+    
+    Exemplo:
+        with db.transaction():
+            for user_id, tickets in novos.items():
+                db.update_tickets(user_id, tickets)
+    """
+    with _lock:
+        store = _partition()
+        data = _load_config()
+        ops_mark = len(store.ops)
+        undo_mark = len(store.undo)
+        store.batch_depth += 1
+        try:
+            yield data
+        except BaseException:
+            _rollback(store, data, ops_mark, undo_mark)
+            raise
+        finally:
+            store.batch_depth -= 1
+        
+        if store.batch_depth == 0:
+            store.undo = []
+            if store.ops or store.full_write:
+                _commit_batch(store)
+
+def _rollback(store: _Store, data: Dict[str, Any], ops_mark: int, undo_mark: int) -> None:
+    """Desfaz as alterações registradas a partir das marcas informadas."""
+    for path, existed, value in reversed(store.undo[undo_mark:]):
+        record = {"op": "set", "path": path, "value": value} if existed else {"op": "del", "path": path}
+        if path[0] == "participants" and len(path) == 2:
+            # mantém os índices em vez de reconstruí-los (uma alteração com erro no
+            # escritor único não deve custar uma reconstrução completa)
+            store.own_participants()
+            user_id = path[1]
+            old = data["participants"].get(user_id)
+            _apply_record(data, record)
+            store.on_participant(user_id, old, data["participants"].get(user_id))
+        else:
+            _apply_record(data, record)
+            if path[0] == "participants":
+                store.drop_indexes()
+            else:
+                store.on_config(data, path)
+    del store.undo[undo_mark:]
+    del store.ops[ops_mark:]
+
+def _commit_batch(store: _Store) -> bool:
+    """Persiste uma transação concluída (chamar com _lock adquirido)."""
+    if _writer.enabled or _writer.deferred:
+        store.dirty += 1
+        if _writer.enabled and store.dirty >= _writer.max_dirty:
+            _writer.wakeup.set()
+        return True
+    return _commit(store)
+
+def normalize_name(first_name: str, last_name: str) -> str:
+    """
+    Chave normalizada de um nome completo: sem acentos, casefold e com espaços colapsados.
+    "Rafaél  Felipe" e "rafael felipe" geram a mesma chave.
+    
+    Args:
+        first_name: Primeiro nome
+        last_name: Sobrenome
+        
+    Returns:
+        Chave usada no índice de nomes
+    """
+    text = unicodedata.normalize("NFKD", f"{first_name or ''} {last_name or ''}")
+    text = "".join(ch for ch in text if not unicodedata.combining(ch))
+    return " ".join(text.casefold().split())
+
+def _participant_name_key(participant: Participant) -> str:
+    return normalize_name(participant.first_name, participant.last_name)
+
+def _index_add(index: Dict[str, Any], key: str, user_id: int) -> None:
+    owner = index.get(key)
+    if owner is None:
+        index[key] = user_id
+    elif isinstance(owner, set):
+        owner.add(user_id)
+    elif owner != user_id:
+        index[key] = {owner, user_id}
+
+def _index_remove(index: Dict[str, Any], key: str, user_id: int) -> None:
+    owner = index.get(key)
+    if isinstance(owner, set):
+        owner.discard(user_id)
+        if len(owner) == 1:
+            index[key] = next(iter(owner))
+    elif owner == user_id:
+        del index[key]
+
+def _name_index() -> Dict[str, Any]:
+    """
+    Índice nome normalizado -> user_id do estado atual (construído uma vez por carga).
+    """
+    data = load()
+    store = _partition()
+    if store.name_index is None:
+        index: Dict[str, Any] = {}
+        for user_id, participant in data["participants"].items():
+            _index_add(index, _participant_name_key(participant), user_id)
+        store.name_index = index
+    return store.name_index
+
+def _file_signature(path: str) -> Optional[tuple]:
+    """
+    Retorna (mtime_ns, tamanho) do arquivo ou None se ele não existir.
+    """
+    try:
+        st = os.stat(path)
+    except OSError:
+        return None
+    return (st.st_mtime_ns, st.st_size)
+
+def _signature(path: str) -> Optional[tuple]:
+    """
+    Assinatura do snapshot mais a do diário (None se nenhum dos dois existir).
+    """
+    snapshot = _file_signature(path)
+    journal = _file_signature(path + JOURNAL_SUFFIX)
+    if snapshot is None and journal is None:
+        return None
+    return (snapshot, journal)
+
+def _fsync_dir(path: str) -> None:
+    try:
+        fd = os.open(os.path.dirname(os.path.abspath(path)), os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(fd)
+    except OSError:
+        pass
+    finally:
+        os.close(fd)
+
+def _atomic_write(path: str, payload: bytes) -> None:
+    """
+    Grava o snapshot de forma segura contra quedas: arquivo temporário + fsync + rename.
+    O snapshot anterior é mantido em path + ".bak" como último snapshot válido.
+    """
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+    if os.path.exists(path):
+        backup = path + BACKUP_SUFFIX
+        try:
+            if os.path.exists(backup):
+                os.remove(backup)
+            os.link(path, backup)
+        except OSError:
+            shutil.copy2(path, backup)
+    os.replace(tmp, path)
+    _fsync_dir(path)
+
+def _append_journal(path: str, payload: bytes) -> None:
+    with open(path + JOURNAL_SUFFIX, 'ab') as f:
+        f.write(payload)
+        f.flush()
+        os.fsync(f.fileno())
+
+def _dumps_json(value: Any) -> bytes:
+    """JSON compacto em UTF-8 (orjson quando instalado)."""
+    if orjson is not None:
+        return orjson.dumps(value)
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def _loads_json(raw: bytes) -> Any:
+    if orjson is not None:
+        return orjson.loads(raw)
+    return json.loads(raw.decode("utf-8-sig"))
+
+def encode_snapshot(data: Dict[str, Any], fmt: Optional[str] = None) -> bytes:
+    """
+    Serializa o estado no formato de snapshot configurado.
+    
+    Args:
+        data: Estado a serializar
+        fmt: Formato ("json", "orjson" ou "msgpack"); padrão: o configurado
+        
+    Returns:
+        Conteúdo do arquivo de snapshot
+    """
+    fmt = fmt or _snapshot_format
+    if fmt == FORMAT_MSGPACK:
+        return MSGPACK_MAGIC + msgpack.packb(data, use_bin_type=True)
+    if fmt == FORMAT_ORJSON:
+        return orjson.dumps(data)
+    return json.dumps(data, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+def decode_snapshot(raw: bytes, path: str = "") -> Dict[str, Any]:
+    """
+    Lê um snapshot detectando o formato pelo cabeçalho (ou pela extensão do arquivo).
+    Arquivos JSON antigos (inclusive os indentados) continuam sendo aceitos.
+    
+    Args:
+        raw: Conteúdo do arquivo
+        path: Caminho do arquivo (usado para detectar pela extensão)
+        
+    Returns:
+        Estado lido
+    """
+    # o parse cria milhares de dicts de uma vez; pausar o GC evita varreduras inúteis
+    with _gc_paused():
+        if raw.startswith(MSGPACK_MAGIC) or (
+            path.endswith(MSGPACK_EXTENSIONS) and not raw.lstrip().startswith(b"{")
+        ):
+            if msgpack is None:
+                raise RuntimeError("snapshot em msgpack, mas o pacote msgpack não está instalado")
+            body = raw[len(MSGPACK_MAGIC):] if raw.startswith(MSGPACK_MAGIC) else raw
+            data = msgpack.unpackb(body, raw=False, strict_map_key=False)
+        else:
+            data = _loads_json(raw)
+    if not isinstance(data, dict):
+        raise ValueError("snapshot não contém um objeto")
+    return data
+
+def _serialize(payload: Dict[str, Any], seq: int) -> bytes:
+    if seq:
+        payload["_journal_seq"] = seq
+    return encode_snapshot(payload)
+
+def _read_snapshot(path: str) -> Dict[str, Any]:
+    with open(path, 'rb') as f:
+        return decode_snapshot(f.read(), path)
+
+def _replay_journal(path: str, data: Dict[str, Any], snapshot_seq: int) -> tuple:
+    """
+    Reaplica os registros do diário posteriores ao snapshot.
+    
+    Returns:
+        (quantidade de registros aplicados, seq do último registro aplicado)
+    """
+    journal_path = path + JOURNAL_SUFFIX
+    if not os.path.exists(journal_path):
+        return 0, snapshot_seq
+    applied = 0
+    last_seq = snapshot_seq
+    valid_end = 0
+    with open(journal_path, 'rb') as f:
+        for line_no, raw in enumerate(f, 1):
+            line = raw.strip()
+            if line:
+                try:
+                    record = _loads_json(line)
+                except ValueError:
+                    # linha final incompleta (queda durante a escrita): trunca o diário aqui
+                    # para que os próximos registros não fiquem depois de lixo
+                    logger.warning(f"Registro inválido no diário (linha {line_no}); descartando o restante")
+                    break
+                seq = record.get("seq", 0)
+                if seq > snapshot_seq:
+                    _apply_record(data, record)
+                    last_seq = max(last_seq, seq)
+                    applied += 1
+            valid_end += len(raw)
+    if valid_end < os.path.getsize(journal_path):
+        with open(journal_path, 'r+b') as f:
+            f.truncate(valid_end)
+    return applied, last_seq
+
+def _read_state(path: str) -> tuple:
+    """
+    Lê o snapshot (ou o último snapshot válido, se estiver corrompido) e reaplica o diário.
+    
+    Returns:
+        (estado no formato do database.json, seq do diário, registros no diário)
+    """
+    data = None
+    if os.path.exists(path):
+        try:
+            data = _read_snapshot(path)
+        except Exception as e:
+            logger.error(f"Erro ao carregar database: {e}")
+            # preserva o arquivo corrompido para análise e para não virar o próximo .bak
+            corrupt = f"{path}.corrupt-{datetime.now().strftime('%Y%m%d_%H%M%S')}"
+            try:
+                os.replace(path, corrupt)
+                logger.error(f"Arquivo corrompido movido para {corrupt}")
+            except OSError:
+                pass
+    
+    if data is None and os.path.exists(path + BACKUP_SUFFIX):
+        try:
+            data = _read_snapshot(path + BACKUP_SUFFIX)
+            logger.warning("Database recuperado do último snapshot válido")
+        except Exception as e:
+            logger.error(f"Erro ao carregar snapshot de backup: {e}")
+    
+    if data is None:
+        data = _default_data()
+    
+    snapshot_seq = int(data.pop("_journal_seq", 0) or 0)
+    records, seq = _replay_journal(path, data, snapshot_seq)
+    return data, seq, records
+
+def read_json_files(path: str) -> Dict[str, Any]:
+    """
+    Estado completo (configuração + participantes) no formato do database.json,
+    lido dos arquivos dos segmentos. Também aceita o arquivo único de versões
+    anteriores, com os participantes dentro do próprio database.json.
+    
+    Args:
+        path: Arquivo do segmento de configuração (DATABASE_FILE)
+        
+    Returns:
+        Estado lido
+    """
+    data = _read_state(path)[0]
+    _migrate_state(data)
+    participants_path = segment_path(path, PARTICIPANTS_SEGMENT)
+    if _signature(participants_path) is not None:
+        state = _read_state(participants_path)[0]
+        _migrate_state(state, config=False)
+        data["participants"] = state.get("participants") or {}
+    data.setdefault("participants", {})
+    return data
+
+def segment_path(path: str, segment: str) -> str:
+    """
+    Arquivo de um segmento: o próprio path para a configuração e, para os
+    participantes, path com ".participants" antes da extensão
+    (database.json -> database.participants.json).
+    """
+    if segment == CONFIG_SEGMENT:
+        return path
+    root, ext = os.path.splitext(path)
+    return f"{root}.{segment}{ext}"
+
+def _segment_of(path: List[Any]) -> str:
+    return PARTICIPANTS_SEGMENT if path[0] == "participants" else CONFIG_SEGMENT
+
+def _segment_state(data: Dict[str, Any], segment: str) -> Dict[str, Any]:
+    """Parte do estado em memória gravada no segmento, no formato do database.json."""
+    if segment == PARTICIPANTS_SEGMENT:
+        return {"schema_version": SCHEMA_VERSION, "participants": _participants_to_json(data["participants"])}
+    return {key: value for key, value in data.items() if key != "participants"}
+
+def _config_defaults() -> Dict[str, Any]:
+    data = _default_data()
+    del data["participants"]
+    return data
+
+def _segment_signature(store: _Store, segment: str) -> Optional[tuple]:
+    if store.backend is not None:
+        return store.backend.signature()
+    return _signature(segment_path(store.file, segment))
+
+def _prepare_write(store: _Store) -> List[tuple]:
+    """
+    Consome os registros pendentes e decide o que gravar (chamar com _lock adquirido).
+    
+    Cada segmento é gravado separadamente, e só os segmentos alterados são gravados:
+    uma inscrição não regrava a configuração e vice-versa.
+    
+    Returns:
+        Lista de (segmento, tipo, conteúdo): ("journal", linhas) para anexar ao
+        diário do segmento, ("snapshot", conteúdo) para gravar um snapshot completo
+        do segmento (que também descarta o diário dele) ou, com o backend
+        configurado, um único (None, "backend", alterações) / (None, "backend_full", estado)
+    """
+    data = store.data
+    ops, full_write = store.ops, store.full_write
+    store.ops, store.full_write = [], False
+    
+    if store.backend is not None:
+        if full_write:
+            # cópia rasa: as seções podem continuar mudando enquanto a gravação acontece
+            return [(None, "backend_full", {
+                key: (dict(value) if isinstance(value, dict) else value)
+                for key, value in _to_json_state(data).items()
+            })]
+        return [(None, "backend", [_change_to_json(change) for change in store.backend.plan(ops, data)])]
+    
+    by_segment: Dict[str, List[Dict[str, Any]]] = {name: [] for name in SEGMENTS}
+    for record in ops:
+        by_segment[_segment_of(record["path"])].append(record)
+    
+    plans = []
+    for name, records in by_segment.items():
+        loaded = name == CONFIG_SEGMENT or "participants" in data
+        if not records and not (full_write and loaded):
+            continue
+        segment = store.segments[name]
+        if _journal.enabled and records and not full_write:
+            lines = []
+            for record in records:
+                segment.seq += 1
+                lines.append(_dumps_json({"seq": segment.seq, **_record_to_json(record)}))
+            segment.records += len(records)
+            if segment.records < _journal.compact_every:
+                plans.append((name, "journal", b"\n".join(lines) + b"\n"))
+                continue
+        
+        # snapshot completo: modo snapshot, alteração sem registros ou compactação do diário
+        segment.records = 0
+        plans.append((name, "snapshot", _serialize(_segment_state(data, name), segment.seq)))
+    return plans
+
+def _change_to_json(change: tuple) -> tuple:
+    """Alteração (seção, chave, valor, presente) do backend no formato do database.json."""
+    section, key, value, present = change
+    if section != "participants" or not present:
+        return (section, None if key is None else str(key), value, present)
+    if key is None:
+        return (section, None, _participants_to_json(value), present)
+    return (section, str(key), value.to_json(), present)
+
+def _execute_write(store: _Store, path: str, plans: List[tuple]) -> None:
+    for segment, kind, payload in plans:
+        if kind == "backend":
+            store.backend.apply(payload)
+            continue
+        if kind == "backend_full":
+            store.backend.replace_all(payload)
+            continue
+        target = segment_path(path, segment)
+        if kind == "journal":
+            _append_journal(target, payload)
+            continue
+        _atomic_write(target, payload)
+        try:
+            os.remove(target + JOURNAL_SUFFIX)
+        except FileNotFoundError:
+            pass
+
+def _refresh_signatures(store: _Store, plans: List[tuple]) -> None:
+    """Guarda a assinatura dos segmentos que acabaram de ser gravados."""
+    for segment, _, _ in plans:
+        for name in (SEGMENTS if segment is None else (segment,)):
+            store.segments[name].signature = _segment_signature(store, name)
+
+def _consolidate_leftovers(store: _Store, records: int) -> None:
+    """
+    Diário sobrando de um modo diário anterior (ou arquivo em formato antigo):
+    consolida em um snapshot imediatamente (chamar com _lock adquirido).
+    """
+    if records and not _journal.enabled:
+        store.full_write = True
+    if store.full_write and not store.batch_depth:
+        _commit(store)
+
+def _load_config() -> Dict[str, Any]:
+    """
+    Carrega só o segmento de configuração (hashtag, TAG, cargos bônus, blacklist,
+    moderadores, canal...), sem ler os participantes.
+    
+    Usado pelas leituras dos caminhos quentes (botão de inscrição, on_message), cujo
+    custo assim não depende da quantidade de participantes; load() completa o estado
+    com os participantes quando alguma operação precisa deles.
+    
+    Returns:
+        O estado em memória (data["participants"] pode ainda não existir)
+    """
+    store = _partition()
+    # dentro de uma transação o estado já foi carregado no início
+    if store.batch_depth and store.data is not None:
+        return store.data
+    
+    location = store.location()
+    # com alterações ainda não gravadas, a memória é a única versão correta
+    if store.data is not None and store.path == location and (store.dirty or store.flushing):
+        return store.data
+    
+    if store.is_fresh(location, CONFIG_SEGMENT, _segment_signature(store, CONFIG_SEGMENT)):
+        return store.data
+    
+    with _lock:
+        store.invalidate()
+        config = store.segments[CONFIG_SEGMENT]
+        if store.backend is not None:
+            data = _config_defaults()
+            state = store.backend.read_config()
+            if _int(state.get("schema_version"), 1) < SCHEMA_VERSION:
+                # banco de uma versão anterior: converte os participantes junto
+                state["participants"] = store.backend.read_participants()
+                _migrate_state(state)
+            participants = state.pop("participants", None)
+            data.update(state)
+            store.set(location, data)
+            config.signature = store.backend.signature()
+            if participants is not None:
+                _install_participants(store, _participants_from_json(participants), None)
+                store.full_write = True
+                _consolidate_leftovers(store, 0)
+            return data
+
+        data, config.seq, config.records = _read_state(location)
+        store.set(location, data)
+        config.signature = _signature(location)
+        if _migrate_state(data):
+            store.full_write = True
+
+        # arquivo único de versões anteriores: os participantes vão para o próprio segmento
+        legacy = data.pop("participants", None)
+        participants_path = segment_path(location, PARTICIPANTS_SEGMENT)
+        if legacy and _signature(participants_path) is None:
+            _install_participants(store, _participants_from_json(legacy), None)
+            store.full_write = True
+            logger.info(f"Participantes movidos de {location} para {participants_path}")
+        elif legacy:
+            logger.warning(f"{location} ainda contém participantes, mas {participants_path} já existe; usando {participants_path}")
+            store.full_write = True
+        _consolidate_leftovers(store, config.records)
+    return data
+
+def _install_participants(store: _Store, participants: Dict[int, Participant],
+                          signature: Optional[tuple]) -> None:
+    store.data["participants"] = participants
+    store.name_index = None
+    store.stats = None
+    store.click_filter = None
+    store.snapshot_epoch = None
+    store.segments[PARTICIPANTS_SEGMENT].signature = signature
+
+def _participants_current(store: _Store) -> bool:
+    """True quando os participantes em memória podem ser usados sem reler o segmento."""
+    if not store.has_participants():
+        return False
+    if store.batch_depth or store.dirty or store.flushing:
+        return True
+    return store.is_fresh(store.location(), PARTICIPANTS_SEGMENT,
+                          _segment_signature(store, PARTICIPANTS_SEGMENT))
+
+def load() -> Dict[str, Any]:
+    """
+    Carrega o banco de dados JSON completo (configuração + participantes).
+    
+    Cada segmento só é lido (e parseado) quando mudou no disco desde a última
+    leitura; nas demais chamadas o estado em memória é devolvido diretamente. No
+    modo diário o snapshot é lido e os registros do diário são reaplicados por cima.
+    
+    Returns:
+        Dict com estrutura do banco de dados
+    """
+    data = _load_config()
+    store = _partition()
+    if _participants_current(store):
+        return data
+    
+    with _lock:
+        data = _load_config()
+        if _participants_current(store):
+            return data
+        segment = store.segments[PARTICIPANTS_SEGMENT]
+        if store.backend is not None:
+            _install_participants(store, _participants_from_json(store.backend.read_participants()),
+                                  store.backend.signature())
+            return data
+        path = segment_path(store.file, PARTICIPANTS_SEGMENT)
+        state, segment.seq, segment.records = _read_state(path)
+        if _migrate_state(state, config=False):
+            store.full_write = True
+        _install_participants(store, _participants_from_json(state.get("participants") or {}),
+                              _signature(path))
+        _consolidate_leftovers(store, segment.records)
+    return data
+
+def _commit(store: _Store) -> bool:
+    """
+    Persiste o estado da partição de forma síncrona (chamar com _lock adquirido).
+    """
+    path = store.path
     try:
-        with open(DATABASE_FILE, 'r', encoding='utf-8') as f:
-            return json.load(f)
+        plans = _prepare_write(store)
+        _execute_write(store, path, plans)
+        _refresh_signatures(store, plans)
+        return True
     except Exception as e:
-        logger.error(f"Erro ao carregar database: {e}")
-        return load()
+        logger.error(f"Erro ao salvar database: {e}")
+        store.invalidate()
+        return False
 
 def save(data: Dict[str, Any]) -> bool:
     """
     Salva o banco de dados JSON.
     
+    No modo diário apenas os registros das alterações são anexados ao diário; no modo
+    write-behind o estado só é marcado como sujo e a gravação acontece em segundo
+    plano ou em flush().
+    
     Args:
         data: Dicionário com os dados a serem salvos
         
     Returns:
         True se salvou com sucesso, False caso contrário
     """
-    try:
-        with open(DATABASE_FILE, 'w', encoding='utf-8') as f:
-            json.dump(data, f, indent=4, ensure_ascii=False)
+    with _lock:
+        store = _partition()
+        location = store.location()
+        if data is not store.data or store.path != location or not store.ops:
+            # alteração feita fora dos helpers _set/_delete: exige snapshot completo
+            # e os índices derivados podem estar desatualizados
+            store.full_write = True
+            store.drop_indexes()
+        store.set(location, data)
+        
+        # dentro de uma transação a gravação acontece uma única vez, ao final
+        if store.batch_depth:
+            return True
+        return _commit_batch(store)
+
+def flush() -> bool:
+    """
+    Grava imediatamente as alterações pendentes do modo write-behind do sorteio
+    atual e da configuração do servidor (ver flush_all()).
+    
+    Deve ser chamado após ações administrativas destrutivas.
+    
+    Returns:
+        True se não havia nada pendente ou se gravou com sucesso
+    """
+    store = _partition()
+    ok = _flush(store)
+    base = _partitions.stores.get((store.guild_id, None))
+    if base is not None and base is not store:
+        ok = _flush(base) and ok
+    return ok
+
+def flush_all() -> bool:
+    """
+    Grava as alterações pendentes de todos os servidores carregados.
+    
+    Deve ser chamado no desligamento do bot.
+    
+    Returns:
+        True se todas as gravações deram certo
+    """
+    ok = True
+    for store in _loaded_stores():
+        ok = _flush(store) and ok
+    return ok
+
+def _flush(store: _Store) -> bool:
+    with _flush_lock:
+        start = time.perf_counter()
+        with _lock:
+            if not store.dirty or store.data is None:
+                return True
+            path = store.path
+            pending = store.dirty
+            ops, full_write = store.ops, store.full_write
+            plans = _prepare_write(store)
+            store.dirty = 0
+            store.flushing = True
+        
+        try:
+            _execute_write(store, path, plans)
+            ok = True
+        except Exception as e:
+            logger.error(f"Erro ao salvar database: {e}")
+            ok = False
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        
+        with _lock:
+            store.flushing = False
+            if not ok:
+                # devolve as alterações para a próxima tentativa
+                store.dirty += pending
+                store.ops = ops + store.ops
+                store.full_write = (store.full_write or full_write
+                                    or any(kind == "snapshot" for _, kind, _ in plans))
+                return False
+            _refresh_signatures(store, plans)
+            _writer.writes += 1
+            _writer.coalesced += pending - 1
+            _writer.last_flush_ms = elapsed_ms
+            _writer.max_flush_ms = max(_writer.max_flush_ms, elapsed_ms)
+            _writer.total_flush_ms += elapsed_ms
         return True
-    except Exception as e:
-        logger.error(f"Erro ao salvar database: {e}")
+
+def _writer_loop():
+    while _writer.enabled:
+        _writer.wakeup.wait(_writer.interval)
+        _writer.wakeup.clear()
+        if any(store.dirty for store in _loaded_stores()):
+            try:
+                flush_all()
+            except Exception as e:
+                logger.error(f"Erro no flush em segundo plano: {e}", exc_info=True)
+
+# thread única para a E/S do banco feita a partir do event loop (cargas e gravações)
+_io_executor = concurrent.futures.ThreadPoolExecutor(max_workers=1, thread_name_prefix="db-io")
+
+def _run_io(fn) -> asyncio.Future:
+    """Executa fn na thread de E/S, no servidor (partição) do contexto atual."""
+    return asyncio.get_running_loop().run_in_executor(_io_executor, contextvars.copy_context().run, fn)
+
+def _cached(store: _Store, participants: bool = True) -> bool:
+    """
+    True quando a leitura pode responder da memória, sem ler arquivo/backend.
+    Com participants=False basta o segmento de configuração.
+    """
+    location = store.location()
+    if store.data is None or store.path != location:
+        return False
+    if participants and not store.has_participants():
+        return False
+    if store.batch_depth or store.dirty or store.flushing:
+        return True
+    if not store.is_fresh(location, CONFIG_SEGMENT, _segment_signature(store, CONFIG_SEGMENT)):
         return False
+    return not participants or store.is_fresh(location, PARTICIPANTS_SEGMENT,
+                                              _segment_signature(store, PARTICIPANTS_SEGMENT))
+
+def _load_indexed() -> None:
+    """Carrega o estado e monta os índices derivados (chamado na thread de E/S)."""
+    with _lock:
+        load()
+        _name_index()
+        _statistics()
+        get_role_lookup()
+        _access()
+
+def _load_config_indexed() -> None:
+    """Carrega só a configuração, a tabela de cargos bônus e o índice de moderadores/blacklist (chamado na thread de E/S)."""
+    with _lock:
+        _load_config()
+        get_role_lookup()
+        _access()
+
+async def _ensure_loaded() -> None:
+    """
+    Carrega o estado na thread de E/S se ele ainda não estiver em memória, já com os
+    índices montados, para que nenhuma leitura no event loop precise percorrer os
+    participantes.
+    """
+    store = _partition()
+    if (not _cached(store) or store.name_index is None or store.stats is None
+            or store.role_lookup is None or store.access is None):
+        await _run_io(_load_indexed)
+
+async def _ensure_config_loaded() -> None:
+    """Como _ensure_loaded(), mas sem exigir (nem carregar) o segmento de participantes."""
+    store = _partition()
+    if not _cached(store, participants=False) or store.role_lookup is None or store.access is None:
+        await _run_io(_load_config_indexed)
+
+class _MutationActor:
+    """
+    Escritor único para o código assíncrono do bot.
+    
+    As alterações enviadas com submit() entram em uma fila consumida por uma única
+    tarefa, que as aplica em memória na ordem de chegada; tudo o que se acumulou na
+    fila enquanto o grupo anterior era gravado vira uma única transação (group
+    commit), gravada na thread de E/S. Cada chamador aguarda o resultado da sua
+    própria alteração, resolvido só depois da gravação do grupo (no modo
+    write-behind, a gravação fica a cargo da thread do write-behind). Uma alteração
+    que falha é desfeita sem afetar as demais.
+    
+    Cada alteração é aplicada no servidor e sorteio (partição) de quem a enviou; um
+    grupo com alterações de várias partições vira uma transação por partição.
+    """
+    
+    def __init__(self):
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.queue: Optional[asyncio.Queue] = None
+        self.task: Optional[asyncio.Task] = None
+        self.max_batch = 64
+        # métricas
+        self.batches = 0
+        self.ops = 0
+        self.largest_batch = 0
+    
+    def _ensure_started(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.loop is not loop or self.task is None or self.task.done():
+            self.loop = loop
+            self.queue = asyncio.Queue()
+            self.max_batch = max(1, int(os.getenv("DB_ACTOR_MAX_BATCH", "64")))
+            self.task = loop.create_task(self._run(), name="db-actor")
+    
+    async def submit(self, fn, args: tuple, kwargs: Dict[str, Any]) -> Any:
+        self._ensure_started()
+        store = _partition()
+        future = self.loop.create_future()
+        store.pending += 1
+        self.queue.put_nowait((fn, args, kwargs, future, store))
+        return await future
+    
+    async def _run(self) -> None:
+        while True:
+            batch = [await self.queue.get()]
+            while len(batch) < self.max_batch and not self.queue.empty():
+                batch.append(self.queue.get_nowait())
+            groups: Dict[tuple, List[tuple]] = {}
+            for item in batch:
+                groups.setdefault(item[4].key, []).append(item)
+            
+            for (guild_id, raffle), items in groups.items():
+                guild_token = _guild.set(guild_id)
+                raffle_token = _raffle.set(raffle)
+                try:
+                    await _ensure_loaded()
+                    outcomes = self._apply(items)
+                    if not _writer.enabled:
+                        await _run_io(flush)
+                except Exception as e:
+                    logger.error(f"Erro ao gravar grupo de alterações: {e}", exc_info=True)
+                    outcomes = [(item[3], None, e) for item in items]
+                finally:
+                    _raffle.reset(raffle_token)
+                    _guild.reset(guild_token)
+                    for item in items:
+                        item[4].pending -= 1
+                
+                for future, result, error in outcomes:
+                    if future.done():
+                        continue
+                    if error is not None:
+                        future.set_exception(error)
+                    else:
+                        future.set_result(result)
+            self.batches += 1
+            self.ops += len(batch)
+            self.largest_batch = max(self.largest_batch, len(batch))
+    
+    def _apply(self, batch: List[tuple]) -> List[tuple]:
+        """Aplica o grupo em memória, em uma única transação; a gravação fica pendente."""
+        outcomes = []
+        with _lock:
+            _writer.deferred = True
+            try:
+                with transaction():
+                    for fn, args, kwargs, future, _ in batch:
+                        if future.cancelled():
+                            continue
+                        try:
+                            # transação aninhada: uma alteração com erro é desfeita sozinha
+                            with transaction():
+                                outcomes.append((future, fn(*args, **kwargs), None))
+                        except Exception as e:
+                            outcomes.append((future, None, e))
+            finally:
+                _writer.deferred = False
+        return outcomes
+
+_actor = _MutationActor()
+
+async def submit(fn, *args, **kwargs) -> Any:
+    """
+    Executa a alteração fn(*args, **kwargs) pelo escritor único do event loop.
+    
+    Todas as alterações feitas pelos handlers do bot devem passar por aqui: elas são
+    aplicadas uma de cada vez, na ordem de chegada, e gravadas em grupo.
+    
+    Exemplo:
+        await db.submit(db.add_participant, user_id, nome, sobrenome, fichas, msg.id)
+    
+    Args:
+        fn: Função de alteração do database (add_participant, set_tag...)
+        
+    Returns:
+        O valor retornado por fn
+    """
+    return await _actor.submit(fn, args, kwargs)
+
+def configure_write_behind(enabled: Optional[bool] = None, interval: Optional[float] = None,
+                           max_dirty: Optional[int] = None) -> None:
+    """
+    Ativa/desativa o modo write-behind.
+    
+    Valores omitidos são lidos das variáveis de ambiente DB_WRITE_BEHIND,
+    DB_FLUSH_INTERVAL (segundos) e DB_FLUSH_MAX_DIRTY.
+    
+    Args:
+        enabled: Se o modo write-behind deve ficar ativo
+        interval: Intervalo mínimo entre gravações em segundos
+        max_dirty: Quantidade de alterações que força uma gravação antecipada
+    """
+    if enabled is None:
+        enabled = os.getenv("DB_WRITE_BEHIND", "0").strip().lower() in ("1", "true", "yes", "on")
+    if interval is None:
+        interval = float(os.getenv("DB_FLUSH_INTERVAL", "2.0"))
+    if max_dirty is None:
+        max_dirty = int(os.getenv("DB_FLUSH_MAX_DIRTY", "100"))
+    
+    if not enabled and _writer.enabled:
+        _writer.enabled = False
+        _writer.wakeup.set()
+        flush_all()
+    
+    _writer.interval = max(0.0, interval)
+    _writer.max_dirty = max(1, max_dirty)
+    
+    if enabled and not _writer.enabled:
+        _writer.enabled = True
+        if _writer.thread is None or not _writer.thread.is_alive():
+            _writer.thread = threading.Thread(target=_writer_loop, name="db-writer", daemon=True)
+            _writer.thread.start()
+        logger.info(f"Write-behind ativo (intervalo={_writer.interval}s, max_dirty={_writer.max_dirty})")
+
+def configure_journal(enabled: Optional[bool] = None, compact_every: Optional[int] = None) -> None:
+    """
+    Ativa/desativa o modo diário (journal) de persistência.
+    
+    Valores omitidos são lidos das variáveis de ambiente DB_STORAGE_MODE
+    ("journal" ativa o modo) e DB_COMPACT_EVERY.
+    
+    Args:
+        enabled: Se as alterações devem ser anexadas a um diário em vez de regravar o arquivo
+        compact_every: Quantidade de registros no diário que dispara a compactação
+    """
+    if enabled is None:
+        enabled = os.getenv("DB_STORAGE_MODE", "snapshot").strip().lower() == "journal"
+    if compact_every is None:
+        compact_every = int(os.getenv("DB_COMPACT_EVERY", "1000"))
+    
+    _journal.compact_every = max(1, compact_every)
+    if _journal.enabled and not enabled:
+        # consolida o diário para que o arquivo principal fique completo (os servidores
+        # que não estão em memória são consolidados quando forem carregados)
+        flush_all()
+        with _lock:
+            _journal.enabled = False
+        for store in _loaded_stores():
+            if any(segment.records for segment in store.segments.values()):
+                with partition(store.guild_id, store.raffle):
+                    compact()
+    _journal.enabled = enabled
+    if enabled:
+        logger.info(f"Modo diário ativo (compactação a cada {_journal.compact_every} registros)")
+
+def compact() -> bool:
+    """
+    Consolida o diário do servidor atual em um novo snapshot imediatamente.
+    
+    Returns:
+        True se gravou com sucesso
+    """
+    with _lock:
+        load()
+        store = _partition()
+        store.full_write = True
+        if not _writer.enabled:
+            return _commit(store)
+        store.dirty += 1
+    return flush()
+
+def configure_format(name: Optional[str] = None) -> str:
+    """
+    Define o formato usado ao gravar snapshots.
+    
+    O valor omitido é lido da variável de ambiente DB_FORMAT: "json" (JSON compacto),
+    "orjson" (JSON compacto via orjson, se instalado), "msgpack" (binário, requer o
+    pacote msgpack) ou "auto" (orjson quando disponível, senão json). A leitura sempre
+    detecta o formato do arquivo, então trocar de formato não exige migração.
+    
+    Args:
+        name: Nome do formato
+        
+    Returns:
+        Formato efetivamente em uso
+    """
+    global _snapshot_format
+    if name is None:
+        name = os.getenv("DB_FORMAT", "auto")
+    name = name.strip().lower()
+    
+    if name == "auto":
+        name = FORMAT_ORJSON if orjson is not None else FORMAT_JSON
+    elif name == FORMAT_ORJSON and orjson is None:
+        logger.warning("DB_FORMAT=orjson, mas orjson não está instalado; usando json")
+        name = FORMAT_JSON
+    elif name == FORMAT_MSGPACK and msgpack is None:
+        logger.warning("DB_FORMAT=msgpack, mas msgpack não está instalado; usando json")
+        name = FORMAT_JSON
+    elif name not in (FORMAT_JSON, FORMAT_ORJSON, FORMAT_MSGPACK):
+        raise ValueError(f"Formato de database desconhecido: {name}")
+    
+    with _lock:
+        changed = name != _snapshot_format
+        _snapshot_format = name
+    if changed and _backend_name == "json":
+        # regrava no novo formato os servidores em memória (os demais são regravados
+        # no novo formato na próxima gravação completa)
+        for store in _loaded_stores() or [_partition()]:
+            if _signature(store.file) is not None:
+                with partition(store.guild_id, store.raffle):
+                    compact()
+    return name
+
+def export_readable(path: str) -> int:
+    """
+    Exporta o estado atual como JSON indentado e legível, independente do formato
+    de armazenamento.
+    
+    Args:
+        path: Arquivo de saída
+        
+    Returns:
+        Quantidade de participantes exportados
+    """
+    with _lock:
+        data = load()
+        payload = json.dumps(_to_json_state(data), indent=4, ensure_ascii=False)
+        count = len(data["participants"])
+    with open(path, 'w', encoding='utf-8') as f:
+        f.write(payload)
+    return count
+
+def configure_backend(name: Optional[str] = None, path: Optional[str] = None) -> None:
+    """
+    Seleciona o backend de persistência.
+    
+    Valores omitidos são lidos das variáveis de ambiente DB_BACKEND ("json" ou "sqlite")
+    e DB_SQLITE_FILE. Com SQLite cada servidor usa seu próprio arquivo
+    (GUILDS_DIR/<guild_id>.db, e GUILDS_DIR/<guild_id>/<sorteio>.db para os sorteios
+    nomeados; a partição padrão usa DB_SQLITE_FILE). Na primeira
+    carga de cada servidor com SQLite o conteúdo dos arquivos JSON existentes é
+    migrado automaticamente.
+    
+    Args:
+        name: "json" (padrão) ou "sqlite"
+        path: Arquivo do banco SQLite da partição padrão
+    """
+    global _backend_name, _sqlite_file
+    if name is None:
+        name = os.getenv("DB_BACKEND", "json")
+    name = name.strip().lower()
+    if name not in ("json", "sqlite"):
+        raise ValueError(f"Backend de database desconhecido: {name}")
+    
+    # grava o que estiver pendente no backend anterior antes de trocar
+    flush_all()
+    with _lock:
+        _backend_name = name
+        _sqlite_file = path or os.getenv("DB_SQLITE_FILE", "database.db")
+        for store in _loaded_stores():
+            store.close()
+        _partitions.stores.clear()
+    if name == "sqlite":
+        logger.info(f"Backend SQLite ativo ({_sqlite_file})")
+
+def configure_partitions(max_loaded: Optional[int] = None, idle_seconds: Optional[float] = None,
+                         directory: Optional[str] = None) -> None:
+    """
+    Configura as partições por servidor.
+    
+    Valores omitidos são lidos das variáveis de ambiente DB_MAX_GUILDS (servidores
+    mantidos em memória), DB_GUILD_IDLE (segundos sem uso até o servidor ser
+    descartado da memória) e DB_GUILDS_DIR (diretório dos arquivos dos servidores).
+    
+    Args:
+        max_loaded: Quantidade máxima de servidores em memória (LRU)
+        idle_seconds: Inatividade que descarta um servidor da memória
+        directory: Diretório dos arquivos de cada servidor
+    """
+    global GUILDS_DIR
+    if max_loaded is None:
+        max_loaded = int(os.getenv("DB_MAX_GUILDS", "64"))
+    if idle_seconds is None:
+        idle_seconds = float(os.getenv("DB_GUILD_IDLE", "900"))
+    if directory is None:
+        directory = os.getenv("DB_GUILDS_DIR", GUILDS_DIR)
+    
+    with _lock:
+        _partitions.max_loaded = max(1, max_loaded)
+        _partitions.idle_seconds = max(0.0, idle_seconds)
+        if directory != GUILDS_DIR:
+            flush_all()
+            for key in [key for key in _partitions.stores if key != (None, None)]:
+                _partitions.stores.pop(key).close()
+            GUILDS_DIR = directory
+
+def has_legacy_database() -> bool:
+    """
+    True quando existem dados da versão de um único servidor (na partição padrão)
+    que ainda não foram atribuídos a um servidor com adopt_legacy_database().
+    """
+    return (_signature(DATABASE_FILE) is not None
+            or (_backend_name == "sqlite" and os.path.exists(_sqlite_file)))
 
+def adopt_legacy_database(guild_id: int) -> bool:
+    """
+    Move os dados da partição padrão (DATABASE_FILE, segmento de participantes,
+    diários, o arquivo SQLite e os sorteios nomeados) para a partição do servidor
+    informado.
+    
+    Args:
+        guild_id: ID do servidor dono dos dados
+        
+    Returns:
+        True se moveu; False se não há dados antigos ou se o servidor já tem dados próprios
+    """
+    target = guild_file(guild_id)
+    target_db = os.path.splitext(target)[0] + ".db"
+    with _lock:
+        if not has_legacy_database():
+            return False
+        if _signature(target) is not None or os.path.exists(target_db):
+            logger.warning(f"Servidor {guild_id} já tem dados próprios; {DATABASE_FILE} não foi movido")
+            return False
+        
+        flush_all()
+        for key in [key for key in _partitions.stores if key[0] in (None, int(guild_id))]:
+            _partitions.stores.pop(key).close()
+        os.makedirs(GUILDS_DIR, exist_ok=True)
+        raffles_dir = os.path.dirname(partition_file(guild_id, "-"))
+        if os.path.isdir(RAFFLES_DIR) and not os.path.exists(raffles_dir):
+            os.replace(RAFFLES_DIR, raffles_dir)
+        for segment in SEGMENTS:
+            for suffix in ("", JOURNAL_SUFFIX, BACKUP_SUFFIX):
+                source = segment_path(DATABASE_FILE, segment) + suffix
+                if os.path.exists(source):
+                    os.replace(source, segment_path(target, segment) + suffix)
+        if _backend_name == "sqlite":
+            for suffix in ("", "-wal", "-shm"):
+                if os.path.exists(_sqlite_file + suffix):
+                    os.replace(_sqlite_file + suffix, target_db + suffix)
+    logger.info(f"Dados de {DATABASE_FILE} atribuídos ao servidor {guild_id}")
+    return True
+
+def _indexed_backend():
+    """
+    Backend indexado do servidor atual quando as consultas podem ir direto a ele
+    (não há alterações em memória ainda não gravadas); None caso contrário.
+    """
+    store = _partition()
+    if store.backend is None:
+        return None
+    _load_config()
+    if store.dirty or store.flushing:
+        return None
+    return store.backend
+
+def get_persistence_stats() -> Dict[str, Any]:
+    """
+    Obtém métricas de persistência (write-behind, diário e partições), somadas
+    para todos os servidores em memória.
+    
+    Returns:
+        Dict com modo, alterações pendentes, gravações, gravações agrupadas,
+        latência de flush (última, máxima e média em ms), tamanho do diário,
+        servidores em memória/carregados/descartados, grupos/alterações
+        processados pelo escritor único (submit()), snapshots tirados/cópias
+        feitas por copy-on-write (snapshot()) e respostas do filtro do botão de
+        inscrição (screen_click())
+    """
+    writes = _writer.writes
+    stores = _loaded_stores()
+    screened = _click.negatives + _click.maybe
+    return {
+        "backend": _backend_name,
+        "format": _snapshot_format,
+        "write_behind": _writer.enabled,
+        "journal": _journal.enabled and _backend_name == "json",
+        "journal_records": sum(segment.records for store in stores for segment in store.segments.values()),
+        "pending": sum(store.dirty for store in stores),
+        "partitions_loaded": len(stores),
+        "partitions_opened": _partitions.opened,
+        "partitions_evicted": _partitions.evicted,
+        "writes": writes,
+        "coalesced_writes": _writer.coalesced,
+        "last_flush_ms": round(_writer.last_flush_ms, 3),
+        "max_flush_ms": round(_writer.max_flush_ms, 3),
+        "avg_flush_ms": round(_writer.total_flush_ms / writes, 3) if writes else 0.0,
+        "actor_batches": _actor.batches,
+        "actor_ops": _actor.ops,
+        "actor_largest_batch": _actor.largest_batch,
+        "actor_queue": _actor.queue.qsize() if _actor.queue is not None else 0,
+        "snapshots": _snapshots.taken,
+        "snapshot_copies": _snapshots.copies,
+        "click_filter": _click.enabled,
+        "click_filter_fp_rate": _click.fp_rate,
+        "click_filter_builds": _click.builds,
+        "click_filter_negatives": _click.negatives,
+        "click_filter_maybe": _click.maybe,
+        "click_filter_unavailable": _click.unavailable,
+        # fração dos cliques triados que dispensou as consultas exatas
+        "click_filter_negative_ratio": round(_click.negatives / screened, 4) if screened else 0.0,
+        "click_filter_maybe_ratio": round(_click.maybe / screened, 4) if screened else 0.0
+    }
+
+atexit.register(flush_all)
+
+@_mutation
 def add_participant(user_id: int, first_name: str, last_name: str, 
                    tickets: Dict[str, Any], message_id: Optional[int] = None) -> bool:
     """
@@ -81,19 +2186,17 @@ def add_participant(user_id: int, first_name: str, last_name: str,
         True se adicionou com sucesso
     """
     data = load()
-    # garante estrutura mínima de tickets
-    tickets = tickets or {}
-    if "base" not in tickets:
-        tickets.setdefault("base", 1)
-    data["participants"][str(user_id)] = {
-        "first_name": first_name,
-        "last_name": last_name,
-        "tickets": tickets,
-        "message_id": message_id,
-        "timestamp": datetime.now().isoformat()
-    }
+    _set(data, ("participants", int(user_id)), Participant(
+        int(user_id),
+        first_name,
+        last_name,
+        message_id=int(message_id) if message_id is not None else None,
+        timestamp=datetime.now().isoformat(),
+        **_ticket_fields(tickets)
+    ))
     return save(data)
 
+@_mutation
 def remove_participant(user_id: int) -> bool:
     """
     Remove um participante do banco de dados.
@@ -102,54 +2205,182 @@ def remove_participant(user_id: int) -> bool:
         user_id: ID do usuário Discord
         
     Returns:
-        True se removeu com sucesso
+        True se removeu com sucesso
+    """
+    data = load()
+    if int(user_id) in data["participants"]:
+        _delete(data, ("participants", int(user_id)))
+        return save(data)
+    return False
+
+def get_participant(user_id: int) -> Optional[Participant]:
+    """
+    Obtém os dados de um participante.
+    
+    Args:
+        user_id: ID do usuário Discord
+        
+    Returns:
+        Participant ou None se não encontrado
+    """
+    data = load()
+    return data["participants"].get(int(user_id))
+
+def get_member_names() -> Dict[int, tuple]:
+    """
+    Nomes do Discord normalizados dos participantes do sorteio atual, preenchidos
+    pelo utils (ver utils.TicketRules.tag_candidates()) para que uma mudança de TAG
+    não normalize de novo quem não mudou de nome.
+    
+    Índice derivado da partição, como o de nomes: perde quem sai do sorteio e é
+    descartado junto com os demais índices, então nunca passa do número de inscritos.
+    
+    Returns:
+        Dict user_id -> (nomes como vieram do Discord, casefold, versão limpa)
+    """
+    return _partition().member_names
+
+def get_all_participants() -> Dict[int, Participant]:
+    """
+    Obtém todos os participantes.
+    
+    Returns:
+        Dict user_id -> Participant
+    """
+    data = load()
+    return data["participants"]
+
+def is_registered(user_id: int) -> bool:
+    """
+    Verifica se um usuário está registrado.
+    
+    Args:
+        user_id: ID do usuário Discord
+        
+    Returns:
+        True se está registrado
     """
+    backend = _indexed_backend()
+    if backend is not None:
+        return backend.is_registered(user_id)
     data = load()
-    if str(user_id) in data["participants"]:
-        del data["participants"][str(user_id)]
-        return save(data)
-    return False
+    return int(user_id) in data["participants"]
 
-def get_participant(user_id: int) -> Optional[Dict[str, Any]]:
+def peek_registered(user_id: int) -> Optional[bool]:
     """
-    Obtém os dados de um participante.
+    Versão de is_registered() para caminhos quentes (botão de inscrição): responde
+    apenas quando isso não exige ler o segmento de participantes, ou seja, quando
+    ele já está em memória ou o backend tem índice para a consulta.
     
     Args:
         user_id: ID do usuário Discord
         
     Returns:
-        Dict com dados do participante ou None se não encontrado
-    """
-    data = load()
-    return data["participants"].get(str(user_id))
+        True/False, ou None se a resposta exigiria carregar os participantes
+        (a inscrição deve ser conferida depois, com is_registered())
+    """
+    backend = _indexed_backend()
+    if backend is not None:
+        return backend.is_registered(user_id)
+    participants = _load_config().get("participants")
+    if participants is None:
+        return None
+    return int(user_id) in participants
 
-def get_all_participants() -> Dict[str, Any]:
-    """
-    Obtém todos os participantes.
+class _ClickFilter:
+    """Configuração e métricas do filtro de Bloom do botão de inscrição (get_persistence_stats())."""
     
-    Returns:
-        Dict com todos os participantes
+    def __init__(self):
+        self.enabled = True
+        self.fp_rate = 0.01
+        # respostas "com certeza ausente" (consultas exatas evitadas) e "talvez presente"
+        self.negatives = 0
+        self.maybe = 0
+        # cliques sem filtro disponível (participantes fora da memória, sem backend)
+        self.unavailable = 0
+        self.builds = 0
+
+_click = _ClickFilter()
+
+def configure_click_filter(enabled: Optional[bool] = None, fp_rate: Optional[float] = None) -> None:
     """
-    data = load()
-    return data["participants"]
+    Configura o filtro de Bloom do botão de inscrição (ver screen_click()).
+    
+    Valores omitidos são lidos das variáveis de ambiente DB_CLICK_FILTER (padrão
+    ativo) e DB_CLICK_FILTER_FP (taxa de falsos positivos, padrão 0.01).
+    
+    Args:
+        enabled: Se o filtro deve ser usado
+        fp_rate: Taxa de falsos positivos usada para dimensionar o filtro
+    """
+    if enabled is None:
+        enabled = os.getenv("DB_CLICK_FILTER", "1").strip().lower() in ("1", "true", "yes", "on")
+    if fp_rate is None:
+        fp_rate = float(os.getenv("DB_CLICK_FILTER_FP", "0.01"))
+    with _lock:
+        changed = fp_rate != _click.fp_rate or not enabled
+        _click.enabled = enabled
+        _click.fp_rate = fp_rate
+        if changed:
+            for store in _loaded_stores():
+                store.click_filter = None
 
-def is_registered(user_id: int) -> bool:
+def _click_filter() -> Optional[BloomFilter]:
+    """
+    Filtro dos inscritos do sorteio atual + blacklist do servidor, montado quando os
+    participantes estão em memória ou o backend pode listar os ids sem carregá-los.
+    None quando o filtro está desativado ou montá-lo exigiria ler os participantes.
+    """
+    if not _click.enabled:
+        return None
+    data = _load_config()
+    store = _partition()
+    if store.click_filter is None:
+        if store.has_participants():
+            user_ids = list(data["participants"])
+        elif store.backend is not None:
+            user_ids = store.backend.participant_ids()
+        else:
+            return None
+        user_ids.extend(int(user_id) for user_id in get_blacklist())
+        store.click_filter = BloomFilter.from_ids(user_ids, len(user_ids), _click.fp_rate)
+        _click.builds += 1
+    return store.click_filter
+
+def screen_click(user_id: int) -> Optional[bool]:
     """
-    Verifica se um usuário está registrado.
+    Triagem do botão de inscrição pelo filtro de Bloom, antes das consultas exatas.
     
     Args:
         user_id: ID do usuário Discord
         
     Returns:
-        True se está registrado
-    """
-    data = load()
-    return str(user_id) in data["participants"]
+        False se o usuário com certeza não está inscrito nem na blacklist (o formulário
+        pode ser enviado sem outras consultas), True se talvez esteja (conferir com
+        get_blacklist_entry() e peek_registered()) ou None sem filtro disponível
+    """
+    click_filter = _click_filter()
+    if click_filter is None:
+        _click.unavailable += 1
+        return None
+    if user_id in click_filter:
+        _click.maybe += 1
+        return True
+    _click.negatives += 1
+    return False
+
+def _build_click_filter() -> None:
+    """Monta o filtro na thread de E/S (a listagem dos ids no backend é uma consulta)."""
+    with _lock:
+        _click_filter()
 
 def is_name_taken(first_name: str, last_name: str, exclude_user_id: Optional[int] = None) -> bool:
     """
     Verifica se um nome completo já foi registrado.
     
+    A comparação usa o nome normalizado (sem acentos, casefold, espaços colapsados)
+    e é uma consulta O(1) no índice de nomes.
+    
     Args:
         first_name: Primeiro nome
         last_name: Sobrenome
@@ -158,15 +2389,18 @@ def is_name_taken(first_name: str, last_name: str, exclude_user_id: Optional[int
     Returns:
         True se o nome já está em uso
     """
-    data = load()
-    for user_id, participant in data["participants"].items():
-        if exclude_user_id and str(exclude_user_id) == user_id:
-            continue
-        if (participant["first_name"].lower() == first_name.lower() and 
-            participant["last_name"].lower() == last_name.lower()):
-            return True
-    return False
+    backend = _indexed_backend()
+    if backend is not None:
+        return backend.is_name_taken(first_name, last_name, exclude_user_id)
+    owner = _name_index().get(normalize_name(first_name, last_name))
+    if owner is None:
+        return False
+    excluded = int(exclude_user_id) if exclude_user_id else None
+    if isinstance(owner, set):
+        return any(user_id != excluded for user_id in owner)
+    return owner != excluded
 
+@_mutation
 def add_bonus_role(role_id: int, quantity: int, abbreviation: str) -> bool:
     """
     Adiciona um cargo bônus.
@@ -179,13 +2413,14 @@ def add_bonus_role(role_id: int, quantity: int, abbreviation: str) -> bool:
     Returns:
         True se adicionou com sucesso
     """
-    data = load()
-    data["bonus_roles"][str(role_id)] = {
+    data = _load_config()
+    _set(data, ("bonus_roles", str(role_id)), {
         "quantity": quantity,
         "abbreviation": abbreviation
-    }
+    })
     return save(data)
 
+@_mutation
 def remove_bonus_role(role_id: int) -> bool:
     """
     Remove um cargo bônus.
@@ -196,9 +2431,9 @@ def remove_bonus_role(role_id: int) -> bool:
     Returns:
         True se removeu com sucesso
     """
-    data = load()
+    data = _load_config()
     if str(role_id) in data["bonus_roles"]:
-        del data["bonus_roles"][str(role_id)]
+        _delete(data, ("bonus_roles", str(role_id)))
         return save(data)
     return False
 
@@ -209,9 +2444,30 @@ def get_bonus_roles() -> Dict[str, Any]:
     Returns:
         Dict com todos os cargos bônus
     """
-    data = load()
+    data = _load_config()
     return data["bonus_roles"]
 
+def get_role_lookup() -> Dict[int, tuple]:
+    """
+    Tabela role_id -> (quantidade, abreviação) dos cargos bônus, usada para calcular
+    totais, listas e exportações a partir dos ids guardados em tickets["roles"].
+    
+    É montada uma vez e refeita apenas quando os cargos bônus mudam, então alterar
+    a quantidade de um cargo vale imediatamente para todos os participantes.
+    
+    Returns:
+        Dict com role_id (int) -> (quantity, abbreviation)
+    """
+    data = _load_config()
+    store = _partition()
+    if store.role_lookup is None:
+        store.role_lookup = {
+            int(role_id): (info["quantity"], info["abbreviation"])
+            for role_id, info in data["bonus_roles"].items()
+        }
+    return store.role_lookup
+
+@_mutation
 def set_hashtag(hashtag: str, locked: bool = False) -> bool:
     """
     Define a hashtag obrigatória.
@@ -223,13 +2479,13 @@ def set_hashtag(hashtag: str, locked: bool = False) -> bool:
     Returns:
         True se definiu com sucesso
     """
-    data = load()
+    data = _load_config()
     if data["hashtag"]["locked"] and not locked:
         return False
-    data["hashtag"]["value"] = hashtag
-    data["hashtag"]["locked"] = locked
+    _set(data, ("hashtag",), {"value": hashtag, "locked": locked})
     return save(data)
 
+@_mutation
 def lock_hashtag(locked: bool = True) -> bool:
     """
     Bloqueia/desbloqueia a hashtag.
@@ -240,8 +2496,8 @@ def lock_hashtag(locked: bool = True) -> bool:
     Returns:
         True se atualizou com sucesso
     """
-    data = load()
-    data["hashtag"]["locked"] = locked
+    data = _load_config()
+    _set(data, ("hashtag", "locked"), locked)
     return save(data)
 
 def get_hashtag() -> Optional[str]:
@@ -251,7 +2507,7 @@ def get_hashtag() -> Optional[str]:
     Returns:
         String da hashtag ou None
     """
-    data = load()
+    data = _load_config()
     return data["hashtag"]["value"]
 
 def is_hashtag_locked() -> bool:
@@ -261,38 +2517,57 @@ def is_hashtag_locked() -> bool:
     Returns:
         True se está bloqueada
     """
-    data = load()
+    data = _load_config()
     return data["hashtag"]["locked"]
 
+@_mutation
 def set_tag(enabled: bool, text: Optional[str] = None, quantity: int = 1) -> bool:
     """
-    Configura a tag do servidor.
+    Ativa/desativa as TAGs do servidor e, com text, adiciona uma TAG (ou altera as
+    fichas de uma TAG já cadastrada com o mesmo texto, sem diferenciar maiúsculas).
     
     Args:
-        enabled: Se a tag está habilitada
-        text: Texto da tag
-        quantity: Quantidade de fichas da tag
+        enabled: Se as TAGs estão habilitadas
+        text: Texto da TAG a adicionar/alterar
+        quantity: Quantidade de fichas da TAG
         
     Returns:
         True se configurou com sucesso
     """
-    data = load()
-    data["tag"]["enabled"] = enabled
-    if text is not None:
-        data["tag"]["text"] = text
-    data["tag"]["quantity"] = quantity
+    data = _load_config()
+    tag = {"enabled": bool(enabled), "tags": data["tag"]["tags"]}
+    if text is not None and text.strip():
+        tag["tags"] = _tag_list(data["tag"]["tags"] + [{"text": text, "quantity": quantity}])
+    _set(data, ("tag",), tag)
+    return save(data)
+
+@_mutation
+def remove_tag(text: str) -> bool:
+    """
+    Remove uma TAG do servidor (sem diferenciar maiúsculas).
+    
+    Returns:
+        True se a TAG existia e foi removida
+    """
+    data = _load_config()
+    key = (text or "").strip().casefold()
+    tags = [entry for entry in data["tag"]["tags"] if entry["text"].casefold() != key]
+    if len(tags) == len(data["tag"]["tags"]):
+        return False
+    _set(data, ("tag",), {"enabled": data["tag"]["enabled"], "tags": tags})
     return save(data)
 
 def get_tag() -> Dict[str, Any]:
     """
-    Obtém a configuração da tag do servidor.
+    Obtém a configuração das TAGs do servidor.
     
     Returns:
-        Dict com enabled, text e quantity
+        Dict com enabled e tags (lista de {text, quantity})
     """
-    data = load()
+    data = _load_config()
     return data["tag"]
 
+@_mutation
 def set_inscricao_channel(channel_id: Optional[int]) -> bool:
     """
     Define o canal de inscrições.
@@ -303,8 +2578,8 @@ def set_inscricao_channel(channel_id: Optional[int]) -> bool:
     Returns:
         True se definiu com sucesso
     """
-    data = load()
-    data["inscricao_channel"] = channel_id
+    data = _load_config()
+    _set(data, ("inscricao_channel",), channel_id)
     return save(data)
 
 def get_inscricao_channel() -> Optional[int]:
@@ -314,10 +2589,11 @@ def get_inscricao_channel() -> Optional[int]:
     Returns:
         ID do canal ou None
     """
-    data = load()
+    data = _load_config()
     return data["inscricao_channel"]
 
 # button message helpers (suporta múltiplos IDs)
+@_mutation
 def add_button_message_id(message_id: int) -> bool:
     """
     Adiciona um ID de mensagem à lista de mensagens do botão de inscrição.
@@ -328,40 +2604,39 @@ def add_button_message_id(message_id: int) -> bool:
     Returns:
         True se adicionou com sucesso
     """
-    data = load()
-    mids = data.get("button_message_id", [])
-    if not isinstance(mids, list):
-        # compatibilidade: transforma single em lista
-        mids = [mids] if mids else []
-    if str(message_id) not in [str(x) for x in mids]:
-        mids.append(int(message_id))
-    data["button_message_id"] = mids
+    data = _load_config()
+    message_id = int(message_id)
+    mids = data["button_message_id"]
+    if message_id not in mids:
+        _set(data, ("button_message_id",), mids + [message_id])
     return save(data)
 
+@_mutation
 def set_button_message_id(message_id: Optional[int]) -> bool:
     """
-    Define o ID da mensagem com o botão de inscrição.
+    Define o ID da mensagem com o botão de inscrição, substituindo os anteriores.
     
     Args:
-        message_id: ID da mensagem
+        message_id: ID da mensagem (None remove todos)
         
     Returns:
         True se definiu com sucesso
     """
-    data = load()
-    data["button_message_id"] = message_id
+    data = _load_config()
+    _set(data, ("button_message_id",), [] if message_id is None else [int(message_id)])
     return save(data)
 
-def get_button_message_id() -> Any:
+def get_button_message_id() -> List[int]:
     """
-    Obtém o(s) ID(s) da mensagem com o botão de inscrição.
+    Obtém os IDs das mensagens com o botão de inscrição.
     
     Returns:
-        ID da mensagem ou lista de IDs
+        Lista de IDs
     """
-    data = load()
-    return data.get("button_message_id")
+    data = _load_config()
+    return data["button_message_id"]
 
+@_mutation
 def set_inscricoes_closed(enabled: bool) -> bool:
     """
     Define se as inscrições estão fechadas.
@@ -372,8 +2647,8 @@ def set_inscricoes_closed(enabled: bool) -> bool:
     Returns:
         True se atualizou com sucesso
     """
-    data = load()
-    data["inscricoes_closed"] = bool(enabled)
+    data = _load_config()
+    _set(data, ("inscricoes_closed",), bool(enabled))
     return save(data)
 
 def get_inscricoes_closed() -> bool:
@@ -383,9 +2658,30 @@ def get_inscricoes_closed() -> bool:
     Returns:
         True se estão fechadas
     """
-    data = load()
-    return bool(data.get("inscricoes_closed", False))
+    data = _load_config()
+    return data["inscricoes_closed"]
+
+def get_config_version() -> tuple:
+    """
+    Versão da configuração do sorteio atual: (partição, número), com um número
+    novo a cada alteração da configuração ou releitura do arquivo. Permite a quem
+    compila algo a partir da configuração (ex.: utils.get_ticket_rules()) reaproveitar
+    o resultado enquanto a versão não mudar.
+    """
+    _load_config()
+    store = _partition()
+    return (store.key, store.config_version)
 
+def _access() -> _AccessIndex:
+    """Índice de moderadores/blacklist da partição atual, montado na primeira consulta."""
+    data = _load_config()
+    store = _partition()
+    if store.access is None:
+        store.access = _AccessIndex(data)
+    return store.access
+
+@_guild_scope
+@_mutation
 def add_to_blacklist(user_id: int, reason: str, banned_by: int) -> bool:
     """
     Adiciona um usuário à blacklist.
@@ -398,14 +2694,16 @@ def add_to_blacklist(user_id: int, reason: str, banned_by: int) -> bool:
     Returns:
         True se adicionou com sucesso
     """
-    data = load()
-    data["blacklist"][str(user_id)] = {
+    data = _load_config()
+    _set(data, ("blacklist", str(user_id)), {
         "reason": reason,
-        "banned_by": banned_by,
+        "banned_by": int(banned_by),
         "timestamp": datetime.now().isoformat()
-    }
+    })
     return save(data)
 
+@_guild_scope
+@_mutation
 def remove_from_blacklist(user_id: int) -> bool:
     """
     Remove um usuário da blacklist.
@@ -416,12 +2714,13 @@ def remove_from_blacklist(user_id: int) -> bool:
     Returns:
         True se removeu com sucesso
     """
-    data = load()
+    data = _load_config()
     if str(user_id) in data["blacklist"]:
-        del data["blacklist"][str(user_id)]
+        _delete(data, ("blacklist", str(user_id)))
         return save(data)
     return False
 
+@_guild_scope
 def get_blacklist() -> Dict[str, Any]:
     """
     Obtém a blacklist completa.
@@ -429,9 +2728,23 @@ def get_blacklist() -> Dict[str, Any]:
     Returns:
         Dict com usuários na blacklist
     """
-    data = load()
+    data = _load_config()
     return data["blacklist"]
 
+@_guild_scope
+def get_blacklist_entry(user_id: int) -> Optional[Dict[str, Any]]:
+    """
+    Obtém o registro de um usuário na blacklist.
+    
+    Args:
+        user_id: ID do usuário
+        
+    Returns:
+        Dict com reason, banned_by e timestamp, ou None se não está na blacklist
+    """
+    return _access().blacklist.get(int(user_id))
+
+@_guild_scope
 def is_blacklisted(user_id: int) -> bool:
     """
     Verifica se um usuário está na blacklist.
@@ -442,9 +2755,10 @@ def is_blacklisted(user_id: int) -> bool:
     Returns:
         True se está na blacklist
     """
-    data = load()
-    return str(user_id) in data["blacklist"]
+    return int(user_id) in _access().blacklist
 
+@_guild_scope
+@_mutation
 def set_chat_lock(enabled: bool, channel_id: Optional[int] = None) -> bool:
     """
     Configura o bloqueio de chat.
@@ -456,12 +2770,15 @@ def set_chat_lock(enabled: bool, channel_id: Optional[int] = None) -> bool:
     Returns:
         True se configurou com sucesso
     """
-    data = load()
-    data["chat_lock"]["enabled"] = enabled
+    data = _load_config()
+    chat_lock = dict(data["chat_lock"])
+    chat_lock["enabled"] = enabled
     if channel_id is not None:
-        data["chat_lock"]["channel_id"] = channel_id
+        chat_lock["channel_id"] = channel_id
+    _set(data, ("chat_lock",), chat_lock)
     return save(data)
 
+@_guild_scope
 def get_chat_lock() -> Dict[str, Any]:
     """
     Obtém a configuração de bloqueio de chat.
@@ -469,110 +2786,442 @@ def get_chat_lock() -> Dict[str, Any]:
     Returns:
         Dict com enabled e channel_id
     """
-    data = load()
+    data = _load_config()
     return data["chat_lock"]
 
-def clear_participants():
+@_guild_scope
+@_mutation
+def create_raffle(name: str) -> Optional[str]:
+    """
+    Cria um sorteio nomeado no servidor atual. Cada sorteio tem seus próprios
+    participantes, hashtag, TAG, cargos bônus, canal e botões de inscrição, e seus
+    arquivos só são carregados quando o sorteio é usado.
+    
+    Args:
+        name: Nome do sorteio
+        
+    Returns:
+        O identificador do sorteio, ou None se o nome for inválido/reservado ou já existir
+    """
+    try:
+        raffle = raffle_slug(name)
+    except ValueError:
+        return None
+    data = _load_config()
+    if raffle is None or raffle in data["raffles"]:
+        return None
+    _set(data, ("raffles", raffle), {
+        "name": name.strip(),
+        "created_at": datetime.now().isoformat()
+    })
+    save(data)
+    return raffle
+
+@_guild_scope
+def get_raffles() -> Dict[str, Any]:
     """
-    Limpa apenas os participantes do sorteio, preservando quaisquer TAGs manuais.
-    Move manual_tag encontradas em participantes para _db['manual_tags'] antes de limpar.
+    Obtém os sorteios nomeados do servidor atual.
+    
+    Returns:
+        Dict identificador -> {"name", "created_at"}
     """
-    # garante estrutura
-    manual_tags = _db.get("manual_tags", {}).copy() if isinstance(_db.get("manual_tags", {}), dict) else {}
+    data = _load_config()
+    return data["raffles"]
 
-    # extrai manual_tag dos participantes existentes (se houver)
-    for user_id, data in list(_db.get("participants", {}).items()):
-        try:
-            tag_amount = data.get("tickets", {}).get("manual_tag")
-            if tag_amount:
-                manual_tags[str(user_id)] = int(tag_amount)
-        except Exception:
-            continue
+@_guild_scope
+def raffle_exists(raffle: Optional[str]) -> bool:
+    """
+    Verifica se um sorteio existe no servidor atual (o sorteio padrão sempre existe).
+    
+    Args:
+        raffle: Identificador do sorteio
+        
+    Returns:
+        True se existe
+    """
+    if raffle is None:
+        return True
+    data = _load_config()
+    return raffle in data["raffles"]
+
+@_guild_scope
+@_mutation
+def set_selected_raffle(raffle: Optional[str]) -> bool:
+    """
+    Define o sorteio usado pelos comandos de administração do servidor atual.
+    
+    Args:
+        raffle: Identificador do sorteio (None = sorteio padrão)
+        
+    Returns:
+        True se selecionou; False se o sorteio não existe
+    """
+    if not raffle_exists(raffle):
+        return False
+    data = _load_config()
+    _set(data, ("selected_raffle",), raffle)
+    return save(data)
+
+@_guild_scope
+def get_selected_raffle() -> Optional[str]:
+    """
+    Obtém o sorteio usado pelos comandos de administração do servidor atual.
+    
+    Returns:
+        Identificador do sorteio (None = sorteio padrão)
+    """
+    data = _load_config()
+    return data["selected_raffle"]
+
+def _collect_manual_tags(data: Dict[str, Any]) -> Dict[str, int]:
+    """
+    Junta as TAGs manuais já guardadas em manual_tags com as dos participantes atuais.
+    """
+    manual_tags = dict(data.get("manual_tags") or {})
+    for user_id, participant in data.get("participants", {}).items():
+        if participant.manual_tag:
+            manual_tags[str(user_id)] = participant.manual_tag
+    return manual_tags
+
+def archive_directory() -> str:
+    """Diretório do histórico (sorteios arquivados) do sorteio atual."""
+    return database_archive.archive_dir(_partition().file)
+
+def _archive_snapshot(reason: str) -> tuple:
+    """
+    Participantes atuais e cabeçalho do arquivo do histórico (chamar com _lock adquirido).
+    Os registros de Participant nunca são alterados no lugar, então a cópia rasa
+    continua válida enquanto o arquivo é gravado em outra thread.
+    """
+    data = load()
+    stats = get_statistics()
+    header = {
+        "guild_id": _guild.get(),
+        "raffle": _raffle.get(),
+        "archived_at": datetime.now().isoformat(),
+        "reason": reason,
+        "participants": stats["total_participants"],
+        "total_tickets": stats["total_tickets"],
+        "hashtag": data["hashtag"]["value"],
+        "tag": data["tag"],
+        "bonus_roles": data["bonus_roles"],
+        "inscricao_channel": data["inscricao_channel"]
+    }
+    return dict(data["participants"]), header
+
+def _write_archive(participants: Dict[int, Participant], header: Dict[str, Any]) -> Optional[str]:
+    """Grava os participantes no histórico do sorteio atual; None se não havia participantes."""
+    if not participants:
+        return None
+    rows = ({"user_id": user_id, **participant.to_json()} for user_id, participant in participants.items())
+    path = database_archive.write_archive(archive_directory(), header, rows)
+    logger.info(f"{len(participants)} participante(s) arquivado(s) em {path}")
+    return path
 
-    # persiste manual_tags e limpa participantes
-    if manual_tags:
-        _db["manual_tags"] = manual_tags
-    _db["participants"] = {}
+@_mutation
+def _reset_participants(reset_all: bool, archived: Dict[int, Participant]) -> int:
+    """
+    Remove do sorteio os participantes já arquivados, preservando as TAGs manuais.
+    Quem se inscreveu depois do arquivo ser gravado continua inscrito. Com reset_all,
+    a configuração do sorteio também volta ao padrão (a lista de sorteios do
+    servidor é mantida).
+    
+    Returns:
+        Quantidade de participantes removidos
+    """
+    with transaction():
+        data = load()
+        manual_tags = _collect_manual_tags(data)
+        remaining = {user_id: participant for user_id, participant in data["participants"].items()
+                     if user_id not in archived}
+        removed = len(data["participants"]) - len(remaining)
+        
+        if reset_all:
+            # limpa tudo e inicializa defaults
+            defaults = _default_data()
+            for key in RAFFLE_KEYS:
+                defaults[key] = data.get(key, defaults[key])
+            for key in list(data):
+                if key not in defaults:
+                    _delete(data, (key,))
+            for key, value in defaults.items():
+                _set(data, (key,), value)
+        _set(data, ("participants",), remaining)
+        
+        # restaura manual_tags se houver
+        if manual_tags:
+            _set(data, ("manual_tags",), manual_tags)
+        save(data)
+    return removed
+
+def _archive_and_reset(reset_all: bool) -> int:
+    with _lock:
+        archived, header = _archive_snapshot("all" if reset_all else "participants")
+        # o arquivo é gravado antes: se a gravação falhar, nada é removido
+        _write_archive(archived, header)
+        return _reset_participants(reset_all, archived)
+
+def clear_participants() -> int:
+    """
+    Encerra o sorteio atual: arquiva os participantes no histórico (gzip JSONL, ver
+    database_archive) e esvazia o sorteio, preservando quaisquer TAGs manuais.
+    Move manual_tag encontradas em participantes para data['manual_tags'] antes de limpar.
+    
+    Returns:
+        Quantidade de participantes removidos
+    """
+    return _archive_and_reset(False)
 
-def clear_all():
+def clear_all() -> int:
     """
-    Reseta o DB mantendo somente as TAGs manuais (se existirem).
+    Arquiva os participantes no histórico e reseta o sorteio mantendo somente as
+    TAGs manuais (se existirem).
+    
+    Returns:
+        Quantidade de participantes removidos
     """
-    # coleta manual_tags atuais e também dos participantes (por segurança)
-    manual_tags = _db.get("manual_tags", {}).copy() if isinstance(_db.get("manual_tags", {}), dict) else {}
+    return _archive_and_reset(True)
 
-    for user_id, data in list(_db.get("participants", {}).items()):
+def list_archives(offset: int = 0, limit: int = 10) -> List[Dict[str, Any]]:
+    """
+    Sorteios arquivados do sorteio atual, do mais recente para o mais antigo.
+    Só os cabeçalhos da página pedida são lidos.
+    
+    Args:
+        offset: Quantidade de arquivos a pular
+        limit: Quantidade máxima de arquivos retornados
+        
+    Returns:
+        Lista de cabeçalhos (data, motivo, totais, hashtag...) com o caminho em "path"
+    """
+    headers = []
+    for path in itertools.islice(database_archive.iter_archives(archive_directory()), offset, offset + limit):
         try:
-            tag_amount = data.get("tickets", {}).get("manual_tag")
-            if tag_amount:
-                manual_tags[str(user_id)] = int(tag_amount)
-        except Exception:
-            continue
+            headers.append(database_archive.read_header(path))
+        except Exception as e:
+            logger.error(f"Erro ao ler o histórico {path}: {e}")
+    return headers
+
+def iter_archived_participants(path: str) -> Iterator[Participant]:
+    """
+    Participantes de um sorteio arquivado, lidos um por vez do arquivo.
+    
+    Args:
+        path: Caminho do arquivo (campo "path" de list_archives())
+    """
+    for row in database_archive.iter_rows(path):
+        yield Participant.from_json(row["user_id"], row)
+
+def _compute_statistics(participants: Dict[str, Any]) -> _Stats:
+    """Recalcula os agregados do zero percorrendo todos os participantes."""
+    stats = _Stats()
+    for participant in participants.values():
+        stats.apply(participant, 1)
+    return stats
+
+def _statistics() -> _Stats:
+    """
+    Agregados do estado atual (recalculados uma vez por carga e depois mantidos
+    a cada alteração de participante).
+    """
+    data = load()
+    store = _partition()
+    if store.stats is None:
+        store.stats = _compute_statistics(data["participants"])
+    return store.stats
 
-    # limpa tudo e inicializa defaults
-    _db.clear()
-    _init_db()
+def configure_statistics(verify: Optional[bool] = None) -> None:
+    """
+    Ativa/desativa a conferência dos contadores de estatísticas.
+    
+    O valor omitido é lido da variável de ambiente DB_VERIFY_STATS. Com a conferência
+    ativa, cada get_statistics() também recalcula tudo do zero e registra um erro se
+    os contadores divergirem (útil para depuração; volta a ser O(participantes)).
+    
+    Args:
+        verify: Se os contadores devem ser conferidos a cada consulta
+    """
+    global _verify_stats
+    if verify is None:
+        verify = os.getenv("DB_VERIFY_STATS", "0").strip().lower() in ("1", "true", "yes", "on")
+    _verify_stats = verify
+    if verify:
+        logger.info("Conferência das estatísticas ativa")
 
-    # restaura manual_tags se houver
-    if manual_tags:
-        _db["manual_tags"] = manual_tags
+def verify_statistics() -> bool:
+    """
+    Confere os contadores de estatísticas com um recálculo completo e os substitui
+    pelo resultado do recálculo.
+    
+    Returns:
+        True se os contadores estavam corretos
+    """
+    with _lock:
+        data = load()
+        store = _partition()
+        current = store.stats
+        fresh = _compute_statistics(data["participants"])
+        store.stats = fresh
+    if current is None or current.totals() == fresh.totals():
+        return True
+    logger.error(f"Estatísticas divergentes: contadores {current.totals()}, recálculo {fresh.totals()}")
+    return False
 
 def get_statistics() -> Dict[str, Any]:
     """
     Obtém estatísticas do banco de dados.
     
+    Os totais são contadores mantidos a cada alteração, então a consulta custa
+    O(cargos bônus) e não percorre os participantes. Cargos que deixaram de ser
+    bônus não entram nos totais.
+    
     Returns:
         Dict com estatísticas
     """
-    data = load()
-    participants = data["participants"]
+    with _lock:
+        if _verify_stats:
+            verify_statistics()
+        data = load()
+        stats = _statistics()
+        role_lookup = get_role_lookup()
+        total_tickets = stats.total_tickets
+        tickets_by_role = {}
+        for role_id, count in stats.roles.items():
+            if role_id not in role_lookup:
+                continue
+            quantity, abbreviation = role_lookup[role_id]
+            tickets_by_role[str(role_id)] = {
+                "count": count,
+                "total_tickets": count * quantity,
+                "abbreviation": abbreviation or "?"
+            }
+            total_tickets += count * quantity
+        return {
+            "total_participants": len(data["participants"]),
+            "total_tickets": total_tickets,
+            "tickets_by_role": tickets_by_role,
+            "participants_with_tag": stats.participants_with_tag,
+            # a blacklist é do servidor, não do sorteio
+            "blacklist_count": len(get_blacklist())
+        }
+
+class _SnapshotEpoch:
+    """Referência compartilhada pelos snapshots de um mesmo dict de participantes."""
+    __slots__ = ("__weakref__",)
+
+class _SnapshotStats:
+    """Métricas dos snapshots (get_persistence_stats())."""
+    
+    def __init__(self):
+        self.taken = 0
+        # cópias rasas feitas por escritores que encontraram um snapshot em uso
+        self.copies = 0
+
+_snapshots = _SnapshotStats()
+
+class _ParticipantsView(collections.abc.Mapping):
+    """
+    Participantes de um snapshot, só para leitura. Guarda uma referência forte ao
+    epoch: enquanto a view (ou um iterador dela) estiver em uso o copy-on-write
+    continua valendo, mesmo que o Snapshot em si já tenha sido descartado
+    (ex.: participants = (await db.asnapshot()).participants).
+    """
+    __slots__ = ("_data", "_epoch")
     
-    total_participants = len(participants)
-    total_tickets = 0
-    tickets_by_role = {}
-    participants_with_tag = 0
+    def __init__(self, participants: Dict[int, Participant], epoch: _SnapshotEpoch):
+        self._data = participants
+        self._epoch = epoch
     
-    for participant in participants.values():
-        tickets = participant.get("tickets", {})
-        # base
-        base = tickets.get("base", 1)
-        total_tickets += base
-        
-        # roles
-        if "roles" in tickets:
-            for role_id, role_data in tickets["roles"].items():
-                if role_id not in tickets_by_role:
-                    tickets_by_role[role_id] = {
-                        "count": 0,
-                        "total_tickets": 0,
-                        "abbreviation": role_data.get("abbreviation", "?")
-                    }
-                tickets_by_role[role_id]["count"] += 1
-                tickets_by_role[role_id]["total_tickets"] += role_data.get("quantity", 0)
-                total_tickets += role_data.get("quantity", 0)
-        
-        # tag automatic
-        tag_amount = tickets.get("tag", 0)
-        if tag_amount > 0:
-            participants_with_tag += 1
-            total_tickets += tag_amount
-        
-        # manual tag
-        manual = tickets.get("manual_tag", 0)
-        if manual and manual > 0:
-            # if manual_tag present we also count as participant with tag (avoid double count)
-            if tag_amount == 0:
-                participants_with_tag += 1
-            total_tickets += manual
+    def __getitem__(self, user_id: int) -> Participant:
+        return self._data[user_id]
     
-    return {
-        "total_participants": total_participants,
-        "total_tickets": total_tickets,
-        "tickets_by_role": tickets_by_role,
-        "participants_with_tag": participants_with_tag,
-        "blacklist_count": len(data.get("blacklist", {}))
-    }
+    def __iter__(self):
+        # gerador: o frame mantém a view (e o epoch) viva durante a iteração
+        yield from self._data
+    
+    def __len__(self) -> int:
+        return len(self._data)
+    
+    def __contains__(self, user_id: object) -> bool:
+        return user_id in self._data
+    
+    def get(self, user_id: int, default: Any = None) -> Any:
+        return self._data.get(user_id, default)
+    
+    def keys(self):
+        return _ParticipantsKeys(self)
+    
+    def items(self):
+        return _ParticipantsItems(self)
+    
+    def values(self):
+        return _ParticipantsValues(self)
+
+# as views guardam a _ParticipantsView (e, por ela, o epoch); a iteração usa o dict direto
+class _ParticipantsKeys(collections.abc.KeysView):
+    __slots__ = ()
+    
+    def __iter__(self):
+        yield from self._mapping._data
 
+class _ParticipantsItems(collections.abc.ItemsView):
+    __slots__ = ()
+    
+    def __iter__(self):
+        yield from self._mapping._data.items()
+
+class _ParticipantsValues(collections.abc.ValuesView):
+    __slots__ = ()
+    
+    def __iter__(self):
+        yield from self._mapping._data.values()
+
+class Snapshot:
+    """
+    Visão imutável e consistente do sorteio atual, para comandos de leitura que
+    atravessam vários awaits (/lista, /exportar, /estatisticas, /limpar).
+    
+    participants é o próprio dict de participantes do estado em memória, exposto
+    só para leitura (e mantendo o snapshot válido enquanto for usado, mesmo sem o
+    Snapshot): tirar um snapshot não copia nada. Enquanto algum snapshot
+    estiver em uso, a primeira alteração de participante troca o dict do estado
+    por uma cópia rasa (copy-on-write), então o snapshot nunca muda e quem escreve
+    nunca espera quem lê. Os registros Participant são imutáveis e compartilhados.
+    """
+    __slots__ = ("participants", "role_lookup", "statistics", "_epoch")
+    
+    def __init__(self, participants: Dict[int, Participant], role_lookup: Dict[int, tuple],
+                 statistics: Dict[str, Any], epoch: _SnapshotEpoch):
+        self.participants = _ParticipantsView(participants, epoch)
+        self.role_lookup = role_lookup
+        self.statistics = statistics
+        self._epoch = epoch
+
+def snapshot() -> Snapshot:
+    """
+    Obtém um snapshot imutável do sorteio atual (participantes, cargos bônus e
+    estatísticas), em O(cargos bônus).
+    
+    Exemplo:
+        snap = await db.asnapshot()
+        for user_id, participant in snap.participants.items():
+            ...
+    
+    Returns:
+        Snapshot
+    """
+    with _lock:
+        data = load()
+        store = _partition()
+        epoch = store.snapshot_epoch() if store.snapshot_epoch is not None else None
+        if epoch is None:
+            epoch = _SnapshotEpoch()
+            store.snapshot_epoch = weakref.ref(epoch)
+        _snapshots.taken += 1
+        # role_lookup é refeito (nunca alterado no lugar) quando os cargos bônus mudam
+        return Snapshot(data["participants"], get_role_lookup(), get_statistics(), epoch)
+
+@_mutation
 def update_tickets(user_id: int, tickets: Dict[str, Any]) -> bool:
     """
     Atualiza as fichas de um participante.
@@ -585,11 +3234,14 @@ def update_tickets(user_id: int, tickets: Dict[str, Any]) -> bool:
         True se atualizou com sucesso
     """
     data = load()
-    if str(user_id) in data["participants"]:
-        data["participants"][str(user_id)]["tickets"] = tickets
+    participant = data["participants"].get(int(user_id))
+    if participant is not None:
+        _set(data, ("participants", int(user_id)), participant.replace(**_ticket_fields(tickets)))
         return save(data)
     return False
 
+@_guild_scope
+@_mutation
 def add_moderator(user_id: int) -> bool:
     """
     Adiciona um moderador.
@@ -600,14 +3252,18 @@ def add_moderator(user_id: int) -> bool:
     Returns:
         True se adicionou com sucesso
     """
-    data = load()
-    if "moderators" not in data:
-        data["moderators"] = []
-    if str(user_id) not in data["moderators"]:
-        data["moderators"].append(str(user_id))
+    data = _load_config()
+    user_id = int(user_id)
+    access = _access()
+    if user_id not in access.moderators:
+        values = data["moderators"] + [user_id]
+        access.add("moderators", user_id, values)
+        _set(data, ("moderators",), values)
         return save(data)
     return False
 
+@_guild_scope
+@_mutation
 def remove_moderator(user_id: int) -> bool:
     """
     Remove um moderador.
@@ -618,38 +3274,101 @@ def remove_moderator(user_id: int) -> bool:
     Returns:
         True se removeu com sucesso
     """
-    data = load()
-    if "moderators" not in data:
-        data["moderators"] = []
-    if str(user_id) in data["moderators"]:
-        data["moderators"].remove(str(user_id))
+    data = _load_config()
+    user_id = int(user_id)
+    access = _access()
+    if user_id in access.moderators:
+        values = [m for m in data["moderators"] if m != user_id]
+        access.discard("moderators", user_id, values)
+        _set(data, ("moderators",), values)
         return save(data)
     return False
 
-def get_moderators() -> List[str]:
+@_guild_scope
+def get_moderators() -> List[int]:
     """
     Obtém a lista de moderadores.
     
     Returns:
         Lista de IDs de moderadores
     """
-    data = load()
-    return data.get("moderators", [])
+    data = _load_config()
+    return data["moderators"]
+
+@_guild_scope
+@_mutation
+def add_moderator_role(role_id: int) -> bool:
+    """
+    Adiciona um cargo de moderador: todos os membros com o cargo são moderadores.
+    
+    Args:
+        role_id: ID do cargo
+        
+    Returns:
+        True se adicionou com sucesso
+    """
+    data = _load_config()
+    role_id = int(role_id)
+    access = _access()
+    if role_id not in access.moderator_roles:
+        values = data["moderator_roles"] + [role_id]
+        access.add("moderator_roles", role_id, values)
+        _set(data, ("moderator_roles",), values)
+        return save(data)
+    return False
+
+@_guild_scope
+@_mutation
+def remove_moderator_role(role_id: int) -> bool:
+    """
+    Remove um cargo de moderador.
+    
+    Args:
+        role_id: ID do cargo
+        
+    Returns:
+        True se removeu com sucesso
+    """
+    data = _load_config()
+    role_id = int(role_id)
+    access = _access()
+    if role_id in access.moderator_roles:
+        values = [r for r in data["moderator_roles"] if r != role_id]
+        access.discard("moderator_roles", role_id, values)
+        _set(data, ("moderator_roles",), values)
+        return save(data)
+    return False
+
+@_guild_scope
+def get_moderator_roles() -> List[int]:
+    """
+    Obtém a lista de cargos de moderador.
+    
+    Returns:
+        Lista de IDs de cargos
+    """
+    data = _load_config()
+    return data["moderator_roles"]
 
-def is_moderator(user_id: int) -> bool:
+@_guild_scope
+def is_moderator(user_id: int, role_ids: Iterable[int] = ()) -> bool:
     """
-    Verifica se um usuário é moderador.
+    Verifica se um usuário é moderador, diretamente ou por ter um cargo de moderador.
     
     Args:
         user_id: ID do usuário
+        role_ids: IDs dos cargos do membro (ex.: frozenset de role.id)
         
     Returns:
         True se é moderador
     """
-    data = load()
-    return str(user_id) in data.get("moderators", [])
+    access = _access()
+    # ids como texto (ex.: vindos de um script) valem como os int do índice
+    return (int(user_id) in access.moderators
+            or not access.moderator_roles.isdisjoint(map(int, role_ids)))
 
 # MANUAL TAG helpers (guardam quantidade em tickets.manual_tag)
+@_mutation
 def set_manual_tag(user_id: int, quantity: int) -> bool:
     """
     Define fichas de TAG manual para um participante.
@@ -662,13 +3381,13 @@ def set_manual_tag(user_id: int, quantity: int) -> bool:
         True se definiu com sucesso
     """
     data = load()
-    if str(user_id) not in data["participants"]:
+    participant = data["participants"].get(int(user_id))
+    if participant is None:
         return False
-    tickets = data["participants"][str(user_id)].get("tickets", {})
-    tickets["manual_tag"] = int(quantity)
-    data["participants"][str(user_id)]["tickets"] = tickets
+    _set(data, ("participants", int(user_id)), participant.replace(manual_tag=int(quantity)))
     return save(data)
 
+@_mutation
 def remove_manual_tag(user_id: int) -> bool:
     """
     Remove a TAG manual de um participante.
@@ -680,12 +3399,10 @@ def remove_manual_tag(user_id: int) -> bool:
         True se removeu com sucesso
     """
     data = load()
-    if str(user_id) not in data["participants"]:
+    participant = data["participants"].get(int(user_id))
+    if participant is None:
         return False
-    tickets = data["participants"][str(user_id)].get("tickets", {})
-    if "manual_tag" in tickets:
-        del tickets["manual_tag"]
-    data["participants"][str(user_id)]["tickets"] = tickets
+    _set(data, ("participants", int(user_id)), participant.replace(manual_tag=0))
     return save(data)
 
 def has_manual_tag(user_id: int) -> bool:
@@ -699,7 +3416,141 @@ def has_manual_tag(user_id: int) -> bool:
         True se tem TAG manual
     """
     data = load()
-    participant = data["participants"].get(str(user_id))
-    if not participant:
-        return False
-    return bool(participant.get("tickets", {}).get("manual_tag", 0))
+    participant = data["participants"].get(int(user_id))
+    return participant is not None and participant.manual_tag > 0
+
+# API assíncrona (usada pelo bot): leituras respondem da memória (a primeira carga
+# roda na thread de E/S) e alterações passam pelo escritor único (submit()).
+# As funções síncronas acima continuam disponíveis para scripts e testes.
+
+def _async_reader(fn, participants: bool = True):
+    """
+    participants=False para leituras que só usam o segmento de configuração: elas
+    nunca carregam os participantes.
+    """
+    ensure = _ensure_loaded if participants else _ensure_config_loaded
+    guild_wide = getattr(fn, "guild_wide", False)
+    
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        # configuração do servidor: carrega o sorteio padrão, não o selecionado
+        token = _raffle.set(None) if guild_wide else None
+        try:
+            await ensure()
+            return fn(*args, **kwargs)
+        finally:
+            if token is not None:
+                _raffle.reset(token)
+    wrapper.__doc__ = f"Versão assíncrona de {fn.__name__}() (lê da memória, sem bloquear o event loop)."
+    return wrapper
+
+def _async_writer(fn):
+    guild_wide = getattr(fn, "guild_wide", False)
+    
+    @functools.wraps(fn)
+    async def wrapper(*args, **kwargs):
+        token = _raffle.set(None) if guild_wide else None
+        try:
+            return await submit(fn, *args, **kwargs)
+        finally:
+            if token is not None:
+                _raffle.reset(token)
+    wrapper.__doc__ = f"Versão assíncrona de {fn.__name__}() (aplicada e gravada pelo escritor único)."
+    return wrapper
+
+async def ascreen_click(user_id: int) -> Optional[bool]:
+    """Versão assíncrona de screen_click() (o filtro é montado na thread de E/S)."""
+    await _ensure_config_loaded()
+    store = _partition()
+    if _click.enabled and store.click_filter is None and (store.has_participants() or store.backend is not None):
+        await _run_io(_build_click_filter)
+    return screen_click(user_id)
+
+async def _aarchive_and_reset(reset_all: bool) -> int:
+    # cópia e cabeçalho na memória; a compressão e a gravação ficam na thread de E/S
+    # e a remoção passa pelo escritor único depois que o arquivo está gravado
+    await _ensure_loaded()
+    with _lock:
+        archived, header = _archive_snapshot("all" if reset_all else "participants")
+    await _run_io(functools.partial(_write_archive, archived, header))
+    return await submit(_reset_participants, reset_all, archived)
+
+async def aclear_participants() -> int:
+    """Versão assíncrona de clear_participants() (o arquivo é gravado na thread de E/S)."""
+    return await _aarchive_and_reset(False)
+
+async def aclear_all() -> int:
+    """Versão assíncrona de clear_all() (o arquivo é gravado na thread de E/S)."""
+    return await _aarchive_and_reset(True)
+
+async def alist_archives(offset: int = 0, limit: int = 10) -> List[Dict[str, Any]]:
+    """Versão assíncrona de list_archives() (lê os cabeçalhos na thread de E/S)."""
+    return await _run_io(functools.partial(list_archives, offset, limit))
+
+async def aflush() -> bool:
+    """Versão assíncrona de flush() (grava na thread de E/S)."""
+    return await _run_io(flush)
+
+aget_participant = _async_reader(get_participant)
+aget_all_participants = _async_reader(get_all_participants)
+ais_registered = _async_reader(is_registered)
+apeek_registered = _async_reader(peek_registered, participants=False)
+ais_name_taken = _async_reader(is_name_taken)
+aget_bonus_roles = _async_reader(get_bonus_roles, participants=False)
+aget_role_lookup = _async_reader(get_role_lookup, participants=False)
+aget_config_version = _async_reader(get_config_version, participants=False)
+aget_hashtag = _async_reader(get_hashtag, participants=False)
+ais_hashtag_locked = _async_reader(is_hashtag_locked, participants=False)
+aget_tag = _async_reader(get_tag, participants=False)
+aget_inscricao_channel = _async_reader(get_inscricao_channel, participants=False)
+aget_button_message_id = _async_reader(get_button_message_id, participants=False)
+aget_inscricoes_closed = _async_reader(get_inscricoes_closed, participants=False)
+aget_blacklist = _async_reader(get_blacklist, participants=False)
+aget_blacklist_entry = _async_reader(get_blacklist_entry, participants=False)
+ais_blacklisted = _async_reader(is_blacklisted, participants=False)
+aget_chat_lock = _async_reader(get_chat_lock, participants=False)
+aget_statistics = _async_reader(get_statistics)
+asnapshot = _async_reader(snapshot)
+aget_moderators = _async_reader(get_moderators, participants=False)
+aget_moderator_roles = _async_reader(get_moderator_roles, participants=False)
+ais_moderator = _async_reader(is_moderator, participants=False)
+ahas_manual_tag = _async_reader(has_manual_tag)
+aget_raffles = _async_reader(get_raffles, participants=False)
+araffle_exists = _async_reader(raffle_exists, participants=False)
+aget_selected_raffle = _async_reader(get_selected_raffle, participants=False)
+
+aadd_participant = _async_writer(add_participant)
+aremove_participant = _async_writer(remove_participant)
+aupdate_tickets = _async_writer(update_tickets)
+aadd_bonus_role = _async_writer(add_bonus_role)
+aremove_bonus_role = _async_writer(remove_bonus_role)
+aset_hashtag = _async_writer(set_hashtag)
+alock_hashtag = _async_writer(lock_hashtag)
+aset_tag = _async_writer(set_tag)
+aremove_tag = _async_writer(remove_tag)
+aset_inscricao_channel = _async_writer(set_inscricao_channel)
+aadd_button_message_id = _async_writer(add_button_message_id)
+aset_button_message_id = _async_writer(set_button_message_id)
+aset_inscricoes_closed = _async_writer(set_inscricoes_closed)
+aadd_to_blacklist = _async_writer(add_to_blacklist)
+aremove_from_blacklist = _async_writer(remove_from_blacklist)
+aset_chat_lock = _async_writer(set_chat_lock)
+aadd_moderator = _async_writer(add_moderator)
+aremove_moderator = _async_writer(remove_moderator)
+aadd_moderator_role = _async_writer(add_moderator_role)
+aremove_moderator_role = _async_writer(remove_moderator_role)
+aset_manual_tag = _async_writer(set_manual_tag)
+aremove_manual_tag = _async_writer(remove_manual_tag)
+acreate_raffle = _async_writer(create_raffle)
+aset_selected_raffle = _async_writer(set_selected_raffle)
+
+if __name__ == "__main__":
+    import sys
+    
+    if len(sys.argv) >= 2 and sys.argv[1] == "export":
+        target = sys.argv[2] if len(sys.argv) > 2 else "database_export.json"
+        count = export_readable(target)
+        print(f"{count} participante(s) exportado(s) para {target}")
+    else:
+        print("Uso: python database.py export [saida.json]")
+        sys.exit(1)
@@ -0,0 +1,128 @@
+"""
+Arquivo de sorteios encerrados para o database.py.
+
+/limpar não descarta mais os participantes: antes de esvaziar o sorteio, o
+database.py grava os participantes em um arquivo JSONL compactado com gzip,
+particionado por mês, ao lado dos arquivos da partição:
+
+    guilds/<id>.archive/2025-12/20251224-183000-000000.jsonl.gz
+
+A primeira linha de cada arquivo é o cabeçalho (data, sorteio, hashtag, cargos
+bônus, totais); as demais são um participante por linha. A leitura é sempre em
+fluxo: listar o histórico só lê os cabeçalhos e exportar um sorteio lê uma linha
+por vez, então o tamanho do histórico não afeta a memória do bot.
+
+Para ver um arquivo manualmente:
+    python database_archive.py guilds/<id>.archive/2025-12/20251224-183000-000000.jsonl.gz
+"""
+import gzip
+import json
+import os
+import sys
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterable, Iterator, Optional
+
+ARCHIVE_SUFFIX = ".jsonl.gz"
+ARCHIVE_VERSION = 1
+
+def archive_dir(partition_file: str) -> str:
+    """Diretório do histórico de uma partição (ex.: guilds/123.json -> guilds/123.archive)."""
+    return os.path.splitext(partition_file)[0] + ".archive"
+
+def _dumps(value: Any) -> bytes:
+    return json.dumps(value, ensure_ascii=False, separators=(",", ":")).encode("utf-8") + b"\n"
+
+def write_archive(directory: str, header: Dict[str, Any], rows: Iterable[Dict[str, Any]],
+                  when: Optional[datetime] = None) -> str:
+    """
+    Grava um sorteio encerrado no histórico.
+
+    O arquivo é escrito em um temporário e renomeado só depois do fsync, então um
+    arquivo do histórico nunca fica pela metade.
+
+    Args:
+        directory: Diretório do histórico (ver archive_dir())
+        header: Cabeçalho (primeira linha)
+        rows: Participantes, um dict por linha
+        when: Data usada no nome e na partição do arquivo (padrão: agora)
+
+    Returns:
+        Caminho do arquivo gravado
+    """
+    when = when or datetime.now()
+    month_dir = os.path.join(directory, when.strftime("%Y-%m"))
+    os.makedirs(month_dir, exist_ok=True)
+    # nomes com microssegundos: a ordem alfabética é a ordem cronológica
+    path = os.path.join(month_dir, when.strftime("%Y%m%d-%H%M%S-%f") + ARCHIVE_SUFFIX)
+    while os.path.exists(path):
+        when += timedelta(microseconds=1)
+        path = os.path.join(month_dir, when.strftime("%Y%m%d-%H%M%S-%f") + ARCHIVE_SUFFIX)
+
+    tmp = path + ".tmp"
+    try:
+        with open(tmp, "wb") as raw:
+            with gzip.GzipFile(filename="", mode="wb", fileobj=raw, compresslevel=6, mtime=0) as f:
+                f.write(_dumps(dict(header, version=ARCHIVE_VERSION)))
+                for row in rows:
+                    f.write(_dumps(row))
+            raw.flush()
+            os.fsync(raw.fileno())
+        os.replace(tmp, path)
+    except BaseException:
+        try:
+            os.remove(tmp)
+        except OSError:
+            pass
+        raise
+    try:
+        fd = os.open(month_dir, os.O_RDONLY)
+        try:
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+    except OSError:
+        pass
+    return path
+
+def iter_archives(directory: str) -> Iterator[str]:
+    """
+    Arquivos do histórico, do mais recente para o mais antigo.
+
+    Lista um mês de cada vez, então parar a iteração cedo não percorre o histórico todo.
+    """
+    try:
+        months = sorted((entry.name for entry in os.scandir(directory) if entry.is_dir()), reverse=True)
+    except FileNotFoundError:
+        return
+    for month in months:
+        month_dir = os.path.join(directory, month)
+        try:
+            names = sorted((name for name in os.listdir(month_dir) if name.endswith(ARCHIVE_SUFFIX)),
+                           reverse=True)
+        except FileNotFoundError:
+            continue
+        for name in names:
+            yield os.path.join(month_dir, name)
+
+def read_header(path: str) -> Dict[str, Any]:
+    """Cabeçalho de um arquivo do histórico (lê só a primeira linha)."""
+    with gzip.open(path, "rb") as f:
+        header = json.loads(f.readline())
+    header["path"] = path
+    return header
+
+def iter_rows(path: str) -> Iterator[Dict[str, Any]]:
+    """Participantes de um arquivo do histórico, um por vez."""
+    with gzip.open(path, "rb") as f:
+        f.readline()
+        for line in f:
+            if line.strip():
+                yield json.loads(line)
+
+if __name__ == "__main__":
+    if len(sys.argv) != 2:
+        print("Uso: python database_archive.py <arquivo.jsonl.gz>")
+        sys.exit(1)
+    print(json.dumps(read_header(sys.argv[1]), ensure_ascii=False, indent=4))
+    for row in iter_rows(sys.argv[1]):
+        print(f"{row.get('user_id')}: {row.get('first_name', '')} {row.get('last_name', '')}")
@@ -0,0 +1,72 @@
+"""
+Filtro de Bloom de ids (int) para o database.py.
+
+Usado na frente das consultas exatas do botão de inscrição: quem clica e não está
+no filtro com certeza não está inscrito nem na blacklist, então o formulário pode
+ser enviado sem consultar os participantes (nem o SQLite). Uma resposta "talvez"
+cai nas consultas exatas de sempre, então um falso positivo só custa a consulta.
+
+O filtro não suporta remoções: um id removido continua marcado até o filtro ser
+reconstruído (o que só gera falsos positivos, nunca falsos negativos).
+"""
+import math
+from typing import Iterable
+
+_MASK = (1 << 64) - 1
+_MUL1 = 0x9E3779B97F4A7C15
+_MUL2 = 0xC2B2AE3D27D4EB4F
+
+class BloomFilter:
+    """
+    Filtro de Bloom dimensionado para capacity ids com a taxa de falsos positivos
+    fp_rate (bits em um bytearray, k posições por double hashing do id).
+    """
+    __slots__ = ("capacity", "fp_rate", "size", "hashes", "count", "_bits")
+
+    def __init__(self, capacity: int, fp_rate: float = 0.01):
+        self.capacity = max(1, int(capacity))
+        self.fp_rate = min(max(fp_rate, 1e-9), 0.5)
+        # m = -n ln(p) / ln(2)^2 bits e k = (m / n) ln(2) posições por id
+        self.size = max(64, math.ceil(-self.capacity * math.log(self.fp_rate) / (math.log(2) ** 2)))
+        self.hashes = max(1, round(self.size / self.capacity * math.log(2)))
+        self.count = 0
+        self._bits = bytearray((self.size + 7) // 8)
+
+    @classmethod
+    def from_ids(cls, ids: Iterable[int], expected: int, fp_rate: float = 0.01,
+                 headroom: float = 2.0) -> "BloomFilter":
+        """
+        Filtro com os ids informados e espaço para crescer até expected * headroom
+        ids mantendo a taxa de falsos positivos.
+        """
+        bloom = cls(max(1024, int(expected * headroom)), fp_rate)
+        for user_id in ids:
+            bloom.add(user_id)
+        return bloom
+
+    def _positions(self, user_id: int):
+        # ids do Discord são snowflakes (tempo nos bits altos): mistura antes de usar
+        h1 = (user_id * _MUL1) & _MASK
+        h2 = (((user_id ^ (user_id >> 31)) * _MUL2) & _MASK) | 1
+        size = self.size
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % size
+
+    def add(self, user_id: int) -> None:
+        bits = self._bits
+        for pos in self._positions(user_id):
+            bits[pos >> 3] |= 1 << (pos & 7)
+        self.count += 1
+
+    def __contains__(self, user_id: int) -> bool:
+        """False: com certeza ausente; True: talvez presente."""
+        bits = self._bits
+        for pos in self._positions(user_id):
+            if not bits[pos >> 3] & (1 << (pos & 7)):
+                return False
+        return True
+
+    @property
+    def full(self) -> bool:
+        """True quando passou da capacidade (a taxa de falsos positivos começa a subir)."""
+        return self.count > self.capacity
@@ -0,0 +1,364 @@
+"""
+Backend SQLite para o database.py.
+
+Ativado com DB_BACKEND=sqlite (arquivo em DB_SQLITE_FILE, padrão "database.db").
+O database.py continua mantendo o estado em memória; este backend só persiste as
+alterações em tabelas indexadas e responde às consultas que se beneficiam de índice
+(nome já registrado e inscrição).
+
+Migração manual de um database.json existente:
+    python database_sqlite.py database.json database.db
+"""
+import json
+import sqlite3
+import sys
+import threading
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import logging
+
+from database import normalize_name, read_json_files
+
+logger = logging.getLogger(__name__)
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS participants (
+    user_id     INTEGER PRIMARY KEY,
+    first_name  TEXT NOT NULL,
+    last_name   TEXT NOT NULL,
+    name_key    TEXT NOT NULL,
+    tickets     TEXT NOT NULL,
+    base        INTEGER NOT NULL DEFAULT 1,
+    tag         INTEGER NOT NULL DEFAULT 0,
+    manual_tag  INTEGER NOT NULL DEFAULT 0,
+    message_id  INTEGER,
+    timestamp   TEXT
+);
+CREATE INDEX IF NOT EXISTS idx_participants_name_key ON participants(name_key);
+CREATE INDEX IF NOT EXISTS idx_participants_message_id ON participants(message_id);
+
+CREATE TABLE IF NOT EXISTS participant_roles (
+    user_id INTEGER NOT NULL REFERENCES participants(user_id) ON DELETE CASCADE,
+    role_id INTEGER NOT NULL,
+    PRIMARY KEY (user_id, role_id)
+);
+CREATE INDEX IF NOT EXISTS idx_participant_roles_role_id ON participant_roles(role_id);
+
+CREATE TABLE IF NOT EXISTS bonus_roles (
+    role_id      INTEGER PRIMARY KEY,
+    quantity     INTEGER NOT NULL,
+    abbreviation TEXT NOT NULL
+);
+
+CREATE TABLE IF NOT EXISTS blacklist (
+    user_id   INTEGER PRIMARY KEY,
+    reason    TEXT,
+    banned_by INTEGER,
+    timestamp TEXT
+);
+
+CREATE TABLE IF NOT EXISTS moderators (
+    user_id INTEGER PRIMARY KEY
+);
+
+CREATE TABLE IF NOT EXISTS config (
+    key   TEXT PRIMARY KEY,
+    value TEXT NOT NULL
+);
+"""
+
+# seções do estado que viram tabelas com uma linha por chave
+KEYED_SECTIONS = ("participants", "bonus_roles", "blacklist")
+
+# tabelas de cada segmento do estado (ver database.SEGMENTS)
+CONFIG_TABLES = ("bonus_roles", "blacklist", "moderators", "config")
+PARTICIPANT_TABLES = ("participant_roles", "participants")
+
+# versão do esquema gravada em PRAGMA user_version
+# 1: name_key com a regra atual de normalização
+# 2: participant_roles guarda só o id do cargo (quantidade/abreviação vêm de bonus_roles)
+SCHEMA_VERSION = 2
+
+def name_key(first_name: str, last_name: str) -> str:
+    """Chave do nome completo usada no índice de nomes (mesma regra do database.py)."""
+    return normalize_name(first_name, last_name)
+
+def _int(value: Any, default: int = 0) -> int:
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        return default
+
+class SqliteBackend:
+    """
+    Persistência em SQLite (modo WAL) com uma única conexão reaproveitada
+    durante toda a vida do processo.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        # a conexão é compartilhada com a thread do write-behind; o lock serializa o uso
+        self._conn = sqlite3.connect(path, check_same_thread=False, isolation_level=None)
+        self._lock = threading.Lock()
+        with self._lock:
+            self._conn.execute("PRAGMA journal_mode=WAL")
+            self._conn.execute("PRAGMA synchronous=NORMAL")
+            self._conn.execute("PRAGMA foreign_keys=ON")
+            self._conn.executescript(SCHEMA)
+            self._migrate()
+
+    def _migrate(self):
+        """Atualiza bancos criados por versões anteriores do esquema."""
+        c = self._conn
+        version = c.execute("PRAGMA user_version").fetchone()[0]
+        if version >= SCHEMA_VERSION:
+            return
+        c.execute("BEGIN")
+        if version < 1:
+            # recalcula name_key quando a regra de normalização muda
+            rows = c.execute("SELECT user_id, first_name, last_name FROM participants").fetchall()
+            c.executemany(
+                "UPDATE participants SET name_key = ? WHERE user_id = ?",
+                [(name_key(first, last), uid) for uid, first, last in rows]
+            )
+        columns = [row[1] for row in c.execute("PRAGMA table_info(participant_roles)")]
+        if version < 2 and "quantity" in columns:
+            # remove as cópias de quantidade/abreviação de cada participante
+            c.execute("ALTER TABLE participant_roles RENAME TO participant_roles_old")
+            c.execute(
+                "CREATE TABLE participant_roles ("
+                "user_id INTEGER NOT NULL REFERENCES participants(user_id) ON DELETE CASCADE, "
+                "role_id INTEGER NOT NULL, PRIMARY KEY (user_id, role_id))"
+            )
+            c.execute("INSERT INTO participant_roles (user_id, role_id) SELECT user_id, role_id FROM participant_roles_old")
+            c.execute("DROP TABLE participant_roles_old")
+            c.execute("CREATE INDEX IF NOT EXISTS idx_participant_roles_role_id ON participant_roles(role_id)")
+        c.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+        c.execute("COMMIT")
+
+    def close(self):
+        with self._lock:
+            self._conn.close()
+
+    def signature(self) -> Tuple[str, int]:
+        """Muda quando outra conexão grava no banco (PRAGMA data_version)."""
+        with self._lock:
+            return (self.path, self._conn.execute("PRAGMA data_version").fetchone()[0])
+
+    def is_empty(self) -> bool:
+        with self._lock:
+            for table in ("participants", "bonus_roles", "blacklist", "moderators", "config"):
+                if self._conn.execute(f"SELECT 1 FROM {table} LIMIT 1").fetchone():
+                    return False
+        return True
+
+    # --- leitura -----------------------------------------------------------
+
+    def read_config(self) -> Dict[str, Any]:
+        """Monta o segmento de configuração (tudo menos os participantes) no formato do database.json."""
+        with self._lock:
+            c = self._conn
+            bonus_roles = {
+                str(rid): {"quantity": qty, "abbreviation": abbr}
+                for rid, qty, abbr in c.execute("SELECT role_id, quantity, abbreviation FROM bonus_roles")
+            }
+            blacklist = {
+                str(uid): {"reason": reason, "banned_by": banned_by, "timestamp": timestamp}
+                for uid, reason, banned_by, timestamp in c.execute(
+                    "SELECT user_id, reason, banned_by, timestamp FROM blacklist"
+                )
+            }
+            moderators = [uid for (uid,) in c.execute("SELECT user_id FROM moderators ORDER BY rowid")]
+            state = {key: json.loads(value) for key, value in c.execute("SELECT key, value FROM config")}
+        state["bonus_roles"] = bonus_roles
+        state["blacklist"] = blacklist
+        state["moderators"] = moderators
+        return state
+
+    def read_participants(self) -> Dict[str, Any]:
+        """Monta o segmento de participantes no formato do database.json."""
+        with self._lock:
+            return {
+                str(uid): {
+                    "first_name": first,
+                    "last_name": last,
+                    "tickets": json.loads(tickets),
+                    "message_id": message_id,
+                    "timestamp": timestamp
+                }
+                for uid, first, last, tickets, message_id, timestamp in self._conn.execute(
+                    "SELECT user_id, first_name, last_name, tickets, message_id, timestamp FROM participants"
+                )
+            }
+
+    def participant_ids(self) -> List[int]:
+        """IDs de todos os participantes (sem montar os registros)."""
+        with self._lock:
+            return [uid for (uid,) in self._conn.execute("SELECT user_id FROM participants")]
+
+    def is_registered(self, user_id: int) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM participants WHERE user_id = ?", (int(user_id),)
+            ).fetchone()
+        return row is not None
+
+    def is_name_taken(self, first_name: str, last_name: str, exclude_user_id: Optional[int] = None) -> bool:
+        with self._lock:
+            row = self._conn.execute(
+                "SELECT 1 FROM participants WHERE name_key = ? AND user_id != ? LIMIT 1",
+                (name_key(first_name, last_name), int(exclude_user_id) if exclude_user_id else -1)
+            ).fetchone()
+        return row is not None
+
+    # --- escrita -----------------------------------------------------------
+
+    @staticmethod
+    def plan(ops: Iterable[Dict[str, Any]], data: Dict[str, Any]) -> List[tuple]:
+        """
+        Converte registros set/del em uma lista de alterações (seção, chave, valor, presente)
+        com o valor atual de cada chave tocada. Deve ser chamado com o estado travado;
+        várias alterações na mesma chave viram uma única linha gravada.
+        """
+        touched: Dict[tuple, None] = {}
+        for record in ops:
+            path = record["path"]
+            section = path[0]
+            key = path[1] if section in KEYED_SECTIONS and len(path) > 1 else None
+            touched[(section, key)] = None
+
+        changes = []
+        for section, key in touched:
+            if key is None:
+                changes.append((section, None, data.get(section), section in data))
+            else:
+                values = data.get(section) or {}
+                changes.append((section, key, values.get(key), key in values))
+        return changes
+
+    def apply(self, changes: List[tuple], reset: Iterable[str] = ()) -> None:
+        """
+        Grava as alterações produzidas por plan() em uma única transação.
+        As tabelas em reset são esvaziadas antes (substituição completa).
+        """
+        with self._lock:
+            c = self._conn
+            c.execute("BEGIN")
+            try:
+                for table in reset:
+                    c.execute(f"DELETE FROM {table}")
+                for section, key, value, present in changes:
+                    if section in KEYED_SECTIONS and key is not None:
+                        if present:
+                            self._upsert(section, key, value)
+                        else:
+                            self._delete(section, key)
+                    elif section in KEYED_SECTIONS or section == "moderators":
+                        self._replace_section(section, value if present else None)
+                    elif present:
+                        c.execute(
+                            "INSERT INTO config (key, value) VALUES (?, ?) "
+                            "ON CONFLICT(key) DO UPDATE SET value = excluded.value",
+                            (section, json.dumps(value, ensure_ascii=False))
+                        )
+                    else:
+                        c.execute("DELETE FROM config WHERE key = ?", (section,))
+                c.execute("COMMIT")
+            except Exception:
+                c.execute("ROLLBACK")
+                raise
+
+    def replace_all(self, data: Dict[str, Any]) -> None:
+        """
+        Substitui todo o conteúdo do banco pelo estado informado. Sem a seção
+        "participants" (segmento de participantes não carregado), os participantes
+        gravados são mantidos.
+        """
+        changes = [(section, None, value, True) for section, value in data.items()]
+        tables = CONFIG_TABLES + (PARTICIPANT_TABLES if "participants" in data else ())
+        self.apply(changes, reset=tables)
+
+    def _upsert(self, section: str, key: str, value: Dict[str, Any]) -> None:
+        c = self._conn
+        if section == "participants":
+            tickets = value.get("tickets") or {}
+            uid = int(key)
+            c.execute(
+                "INSERT OR REPLACE INTO participants "
+                "(user_id, first_name, last_name, name_key, tickets, base, tag, manual_tag, message_id, timestamp) "
+                "VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (
+                    uid,
+                    value.get("first_name", ""),
+                    value.get("last_name", ""),
+                    name_key(value.get("first_name", ""), value.get("last_name", "")),
+                    json.dumps(tickets, ensure_ascii=False),
+                    _int(tickets.get("base", 1), 1),
+                    _int(tickets.get("tag", 0)),
+                    _int(tickets.get("manual_tag", 0)),
+                    value.get("message_id"),
+                    value.get("timestamp")
+                )
+            )
+            c.execute("DELETE FROM participant_roles WHERE user_id = ?", (uid,))
+            c.executemany(
+                "INSERT OR IGNORE INTO participant_roles (user_id, role_id) VALUES (?, ?)",
+                [(uid, int(rid)) for rid in tickets.get("roles") or ()]
+            )
+        elif section == "bonus_roles":
+            c.execute(
+                "INSERT OR REPLACE INTO bonus_roles (role_id, quantity, abbreviation) VALUES (?, ?, ?)",
+                (int(key), _int(value.get("quantity", 0)), value.get("abbreviation", ""))
+            )
+        elif section == "blacklist":
+            c.execute(
+                "INSERT OR REPLACE INTO blacklist (user_id, reason, banned_by, timestamp) VALUES (?, ?, ?, ?)",
+                (int(key), value.get("reason"), value.get("banned_by"), value.get("timestamp"))
+            )
+
+    def _delete(self, section: str, key: str) -> None:
+        column = "role_id" if section == "bonus_roles" else "user_id"
+        self._conn.execute(f"DELETE FROM {section} WHERE {column} = ?", (int(key),))
+
+    def _replace_section(self, section: str, value: Any) -> None:
+        c = self._conn
+        if section == "moderators":
+            c.execute("DELETE FROM moderators")
+            c.executemany(
+                "INSERT OR IGNORE INTO moderators (user_id) VALUES (?)",
+                [(int(uid),) for uid in (value or [])]
+            )
+            return
+        if section == "participants":
+            c.execute("DELETE FROM participant_roles")
+        c.execute(f"DELETE FROM {section}")
+        for key, item in (value or {}).items():
+            self._upsert(section, key, item)
+
+def migrate_json(json_path: str, sqlite_path: str) -> Dict[str, int]:
+    """
+    Migra um database.json (formato atual ou legado, com o segmento de participantes
+    em database.participants.json ou dentro do próprio arquivo) para um arquivo SQLite.
+    Arquivos de versões anteriores do esquema são convertidos por read_json_files().
+
+    Returns:
+        Dict com a quantidade de registros migrados por tabela
+    """
+    data = read_json_files(json_path)
+    backend = SqliteBackend(sqlite_path)
+    try:
+        backend.replace_all(data)
+    finally:
+        backend.close()
+    return {
+        "participants": len(data.get("participants") or {}),
+        "bonus_roles": len(data.get("bonus_roles") or {}),
+        "blacklist": len(data.get("blacklist") or {}),
+        "moderators": len(data.get("moderators") or [])
+    }
+
+if __name__ == "__main__":
+    if len(sys.argv) != 3:
+        print("Uso: python database_sqlite.py <database.json> <database.db>")
+        sys.exit(1)
+    counts = migrate_json(sys.argv[1], sys.argv[2])
+    print("Migração concluída: " + ", ".join(f"{k}={v}" for k, v in counts.items()))
@@ -0,0 +1,25 @@
+import os
+import sys
+
+import pytest
+
+# os módulos do bot ficam na raiz do repositório
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+import database  # noqa: E402
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """database.py em um diretório vazio, sem partições em memória e no modo snapshot."""
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(database, "_partitions", database._Partitions())
+    database.configure_journal(False)
+    database.use_guild(None)
+    yield database
+    database.configure_journal(False)
+    database.flush_all()
+
+def restart(db):
+    """Simula um reinício do bot: grava o pendente e descarta o estado em memória."""
+    db.flush_all()
+    db._partitions = db._Partitions()
@@ -0,0 +1,178 @@
+import asyncio
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("discord")
+pytest.importorskip("flask")
+pytest.importorskip("dotenv")
+import bot  # noqa: E402
+
+def role(role_id, name="Cargo"):
+    return SimpleNamespace(id=role_id, name=name)
+
+class Member(SimpleNamespace):
+    def __init__(self, user_id, roles=(), nick=None):
+        super().__init__(id=user_id, nick=nick, global_name=None, name=f"usuario{user_id}", roles=list(roles))
+
+    def get_role(self, role_id):
+        return next((r for r in self.roles if r.id == role_id), None)
+
+class Guild:
+    def __init__(self, guild_id, members=(), fetchable=()):
+        self.id = guild_id
+        self.roles = []
+        self._members = {m.id: m for m in members}
+        self._fetchable = {m.id: m for m in fetchable}
+        self.queries = []
+
+    def get_member(self, user_id):
+        return self._members.get(user_id)
+
+    async def query_members(self, user_ids, limit, cache):
+        self.queries.append(list(user_ids))
+        return [self._fetchable[user_id] for user_id in user_ids if user_id in self._fetchable]
+
+class Message:
+    def __init__(self):
+        self.content = None
+
+    async def edit(self, content):
+        self.content = content
+
+class Interaction:
+    def __init__(self, guild):
+        self.guild = guild
+        self.user = "admin"
+        self.deferred = False
+        self.sent = []
+        self.progress = Message()
+        self.response = SimpleNamespace(defer=self._defer)
+        self.followup = SimpleNamespace(send=self._send)
+
+    async def _defer(self, ephemeral=False):
+        self.deferred = True
+
+    async def _send(self, content=None, ephemeral=False, wait=False, **kwargs):
+        self.sent.append(content)
+        return self.progress
+
+def command(name):
+    cmd = getattr(bot, name)
+    return getattr(cmd, "callback", cmd)
+
+def add(db, user_id, tickets=None):
+    assert db.add_participant(user_id, "Nome", f"Sobrenome {user_id}", tickets or {"base": 1})
+
+@pytest.fixture
+def refresher(db, monkeypatch):
+    guild = Guild(1)
+    monkeypatch.setattr(bot.bot, "get_guild", lambda guild_id: guild if guild_id == 1 else None)
+    writes = []
+    aupdate_tickets = db.aupdate_tickets
+
+    async def counting_update(user_id, tickets):
+        writes.append((db.current_raffle(), user_id))
+        return await aupdate_tickets(user_id, tickets)
+    monkeypatch.setattr(db, "aupdate_tickets", counting_update)
+    db.use_guild(1)
+    db.add_bonus_role(10, 2, "V")
+    return SimpleNamespace(refresher=bot.TicketRefresher(0.01), guild=guild, writes=writes)
+
+def test_burst_of_role_changes_writes_once(db, refresher):
+    add(db, 7)
+    refresher.guild._members[7] = Member(7, [role(10)])
+
+    async def burst():
+        for _ in range(5):
+            refresher.refresher.schedule(1, 7)
+        await asyncio.sleep(0.05)
+    asyncio.run(burst())
+
+    assert refresher.writes == [(None, 7)]
+    assert refresher.refresher.stats["coalesced"] == 4
+    assert db.get_participant(7).tickets == {"base": 1, "roles": [10]}
+
+def test_unchanged_tickets_are_not_written(db, refresher):
+    add(db, 7, {"base": 1, "roles": [10]})
+    refresher.guild._members[7] = Member(7, [role(10)])
+    asyncio.run(refresher.refresher._refresh(1, 7))
+    assert refresher.writes == []
+    assert refresher.refresher.stats["skipped"] == 1
+
+def test_unloaded_raffle_is_skipped(db, refresher):
+    from conftest import restart
+    add(db, 7)
+    refresher.guild._members[7] = Member(7, [role(10)])
+    restart(db)
+    db.use_guild(1)
+    asyncio.run(refresher.refresher._refresh(1, 7))
+    assert refresher.writes == []
+    assert refresher.refresher.stats["unloaded"] == 1
+    assert db.get_participant(7).tickets == {"base": 1}
+
+def test_user_update_fans_out_to_mutual_guilds_and_raffles(db, refresher, monkeypatch):
+    monkeypatch.setattr(bot, "ticket_refresher", refresher.refresher)
+    raffle = db.create_raffle("Natal")
+    add(db, 7)
+    db.use_raffle(raffle)
+    # cada sorteio tem os próprios cargos bônus
+    db.add_bonus_role(10, 1, "V")
+    add(db, 7)
+    db.use_raffle(None)
+    other = Guild(2)
+    refresher.guild._members[7] = Member(7, [role(10)])
+    before = SimpleNamespace(global_name="a", name="a")
+    after = SimpleNamespace(id=7, global_name="b", name="a", mutual_guilds=[refresher.guild, other])
+
+    async def update():
+        await bot.on_user_update(before, after)
+        await asyncio.sleep(0.05)
+    asyncio.run(update())
+
+    assert set(refresher.writes) == {(None, 7), (raffle, 7)}
+    # o outro servidor também é agendado, mas o membro não está no cache dele
+    assert refresher.refresher.stats["skipped"] == 1
+
+def test_role_change_recalculates_only_holders(db):
+    db.use_guild(1)
+    for user_id in (1, 2, 3):
+        add(db, user_id)
+    vip = role(10)
+    guild = Guild(1, [Member(1, [vip]), Member(2), Member(3, [vip])])
+    db.add_bonus_role(10, 2, "V")
+
+    touched, changed = asyncio.run(bot.recalculate_tickets(guild, bot.role_holders(vip)))
+    assert (touched, changed) == (2, 2)
+    assert db.get_participant(1).tickets == {"base": 1, "roles": [10]}
+    assert db.get_participant(2).tickets == {"base": 1}
+
+def test_atualizar_fetches_in_chunks_and_keeps_manual_tag(db):
+    db.use_guild(1)
+    for user_id in range(1, 251):
+        add(db, user_id)
+    db.add_bonus_role(10, 2, "V")
+    vip = role(10)
+    guild = Guild(1, fetchable=[Member(user_id, [vip]) for user_id in range(1, 250)])
+    query_members = guild.query_members
+
+    async def query_and_change(user_ids, limit, cache):
+        if not guild.queries:
+            # mudanças durante o recálculo: a TAG manual e a saída do sorteio valem na gravação
+            db.set_manual_tag(1, 3)
+            db.remove_participant(2)
+        return await query_members(user_ids, limit, cache)
+    guild.query_members = query_and_change
+
+    interaction = Interaction(guild)
+    asyncio.run(command("atualizar")(interaction))
+
+    assert interaction.deferred
+    assert [len(chunk) for chunk in guild.queries] == [100, 100, 50]
+    assert db.get_participant(1).tickets == {"base": 1, "roles": [10], "manual_tag": 3}
+    assert db.get_participant(3).tickets == {"base": 1, "roles": [10]}
+    # 250 = 248 alterados + 1 que saiu do servidor + 1 que saiu do sorteio
+    assert "**Alterados**: 248" in interaction.progress.content
+    assert "**Saíram do servidor**: 1" in interaction.progress.content
+    assert "**Saíram do sorteio durante o recálculo**: 1" in interaction.progress.content
+    assert "**Sem alteração**: 0" in interaction.progress.content
@@ -0,0 +1,223 @@
+import json
+import os
+import shutil
+
+import pytest
+
+from conftest import restart
+
+DATA_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "data")
+PARTICIPANTS_FILE = "database.participants.json"
+
+def add(db, user_id, first_name="Nome", last_name="Sobrenome", tickets=None):
+    assert db.add_participant(user_id, first_name, f"{last_name} {user_id}", tickets or {"base": 1})
+
+# --- diário (journal) -------------------------------------------------------
+
+def test_journal_replay_after_restart(db):
+    db.configure_journal(True, compact_every=1000)
+    for user_id in (1, 2, 3):
+        add(db, user_id)
+    db.update_tickets(2, {"base": 1, "tag": 2})
+    assert os.path.getsize(PARTICIPANTS_FILE + db.JOURNAL_SUFFIX) > 0
+
+    restart(db)
+    participants = db.get_all_participants()
+    assert sorted(participants) == [1, 2, 3]
+    assert participants[2].tag == 2
+
+def test_journal_torn_line_is_truncated(db):
+    db.configure_journal(True, compact_every=1000)
+    for user_id in (1, 2):
+        add(db, user_id)
+    db.flush_all()
+    journal = PARTICIPANTS_FILE + db.JOURNAL_SUFFIX
+    valid_size = os.path.getsize(journal)
+    # queda no meio da escrita de um registro
+    with open(journal, "ab") as f:
+        f.write(b'{"seq": 99, "op": "set", "path": ["participants", "3"], "val')
+
+    restart(db)
+    assert sorted(db.get_all_participants()) == [1, 2]
+    assert os.path.getsize(journal) == valid_size
+
+    # os próximos registros não ficam depois do lixo
+    add(db, 4)
+    restart(db)
+    assert sorted(db.get_all_participants()) == [1, 2, 4]
+
+def test_corrupt_snapshot_recovers_from_backup(db):
+    add(db, 1)
+    add(db, 2)
+    assert os.path.exists(PARTICIPANTS_FILE + db.BACKUP_SUFFIX)
+    with open(PARTICIPANTS_FILE, "wb") as f:
+        f.write(b'{"participants": {"1": ')
+
+    restart(db)
+    # o .bak é o snapshot anterior à última gravação
+    assert sorted(db.get_all_participants()) == [1]
+    assert any(name.startswith(PARTICIPANTS_FILE + ".corrupt-") for name in os.listdir("."))
+
+# --- esquema ----------------------------------------------------------------
+
+def test_migrates_baseline_database(db):
+    shutil.copy(os.path.join(DATA_DIR, "baseline_database.json"), db.DATABASE_FILE)
+
+    participants = db.get_all_participants()
+    assert sorted(participants) == [1037145864516407306, 1414715180322914414]
+    rafael = participants[1037145864516407306]
+    assert rafael.message_id == 1436126289693114389
+    assert rafael.roles == (1431281152571998330, 1430563402086092851, 1430563210792140923)
+    assert db.get_button_message_id() == [1436121182217830510]
+    assert db.get_tag() == {"enabled": True, "tags": [{"text": "VTH", "quantity": 1}]}
+    assert db.get_role_lookup()[1430563402086092851] == (1, "Tester")
+
+    restart(db)
+    with open(db.DATABASE_FILE) as f:
+        assert json.load(f)["schema_version"] == db.SCHEMA_VERSION
+    with open(PARTICIPANTS_FILE) as f:
+        assert json.load(f)["schema_version"] == db.SCHEMA_VERSION
+    assert sorted(db.get_all_participants()) == sorted(participants)
+    assert db.get_tag()["tags"] == [{"text": "VTH", "quantity": 1}]
+
+def test_migrates_string_ids(db):
+    data = db._default_data()
+    del data["schema_version"]
+    data["moderators"] = ["5", 5, "x"]
+    data["button_message_id"] = "10"
+    data["tag"] = {"enabled": False, "text": None, "quantity": 1}
+    data["participants"] = {"7": {"first_name": "A", "last_name": "B",
+                                  "tickets": {"base": "1", "roles": ["3"]}, "msg_id": "11"}}
+    assert db._migrate_state(data)
+    assert data["moderators"] == [5]
+    assert data["button_message_id"] == [10]
+    assert data["tag"] == {"enabled": False, "tags": []}
+    participant = data["participants"]["7"]
+    assert participant["message_id"] == 11
+    assert participant["tickets"] == {"base": 1, "roles": [3]}
+    assert not db._migrate_state(data)
+
+def test_message_ids_are_stored_as_int(db):
+    db.add_button_message_id(123)
+    db.add_button_message_id("123")
+    assert db.get_button_message_id() == [123]
+    db.add_participant(1, "Nome", "Sobrenome", {"base": 1}, "456")
+    assert db.get_participant(1).message_id == 456
+
+# --- transações -------------------------------------------------------------
+
+def test_transaction_rollback(db):
+    add(db, 1, tickets={"base": 1, "tag": 1})
+    stats = db.get_statistics()
+
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.update_tickets(1, {"base": 1, "tag": 5})
+            add(db, 2)
+            db.set_tag(True, "CLAN", 2)
+            raise RuntimeError("falha no meio")
+
+    assert sorted(db.get_all_participants()) == [1]
+    assert db.get_participant(1).tag == 1
+    assert db.get_tag()["tags"] == []
+    assert db.get_statistics() == stats
+    assert not db.is_name_taken("Nome", "Sobrenome 2")
+
+    restart(db)
+    assert sorted(db.get_all_participants()) == [1]
+    assert db.get_participant(1).tag == 1
+
+# --- histórico --------------------------------------------------------------
+
+def test_clear_participants_archives_them(db):
+    for user_id in (1, 2):
+        add(db, user_id)
+    db.set_manual_tag(2, 3)
+
+    assert db.clear_participants() == 2
+    assert db.get_all_participants() == {}
+    archives = db.list_archives()
+    assert len(archives) == 1
+    assert archives[0]["participants"] == 2
+    archived = {p.user_id: p for p in db.iter_archived_participants(archives[0]["path"])}
+    assert sorted(archived) == [1, 2]
+    assert archived[2].manual_tag == 3
+
+# --- snapshots --------------------------------------------------------------
+
+def test_snapshot_is_stable_across_writes(db):
+    for user_id in (1, 2, 3):
+        add(db, user_id)
+    snap = db.snapshot()
+    before = dict(snap.participants)
+
+    add(db, 4)
+    db.remove_participant(1)
+    db.update_tickets(2, {"base": 1, "tag": 3})
+
+    assert dict(snap.participants) == before
+    assert snap.statistics["total_participants"] == 3
+    assert sorted(db.get_all_participants()) == [2, 3, 4]
+
+def test_snapshot_participants_outlive_the_snapshot(db):
+    for user_id in (1, 2, 3):
+        add(db, user_id)
+    # o Snapshot é descartado na hora; a view continua isolada das gravações
+    participants = db.snapshot().participants
+    seen = []
+    for user_id, participant in participants.items():
+        add(db, 100 + user_id)
+        seen.append(user_id)
+    assert seen == [1, 2, 3]
+    assert len(participants) == 3
+    assert len(db.get_all_participants()) == 6
+
+# --- permissões e filtro do botão -------------------------------------------
+
+def test_access_checks_accept_string_ids(db):
+    db.use_guild(1)
+    db.add_moderator("5")
+    db.add_moderator(5)
+    db.add_moderator_role(7)
+    db.add_to_blacklist(9, "motivo", 1)
+
+    assert db.get_moderators() == [5]
+    assert db.is_moderator("5")
+    assert db.is_moderator(6, ["7"])
+    assert not db.is_moderator(6, [8])
+    assert db.is_blacklisted("9")
+    assert db.get_blacklist_entry("9")["reason"] == "motivo"
+
+def test_access_sets_follow_rollback(db):
+    db.use_guild(1)
+    db.add_moderator(5)
+    assert db.is_moderator(5)
+    with pytest.raises(RuntimeError):
+        with db.transaction():
+            db.remove_moderator(5)
+            db.add_moderator_role(7)
+            assert not db.is_moderator(5) and db.is_moderator(6, [7])
+            raise RuntimeError("falha no meio")
+    assert db.is_moderator(5)
+    assert not db.is_moderator(6, [7])
+    db.remove_moderator("5")
+    assert not db.is_moderator(5)
+    assert db.get_moderators() == []
+
+def test_click_filter_has_no_false_negatives(db):
+    db.use_guild(1)
+    for user_id in range(1, 200):
+        add(db, user_id)
+    db.add_to_blacklist(500, "motivo", 1)
+
+    assert all(db.screen_click(user_id) for user_id in range(1, 200))
+    assert db.screen_click(500)
+    add(db, 600)
+    assert db.screen_click(600)
+
+def test_config_version_changes_on_config_writes(db):
+    version = db.get_config_version()
+    add(db, 1)
+    assert db.get_config_version() == version
+    db.set_tag(True, "CLAN", 2)
+    assert db.get_config_version() != version
@@ -0,0 +1,62 @@
+from types import SimpleNamespace
+
+import pytest
+
+pytest.importorskip("discord")
+import utils  # noqa: E402
+
+def role(role_id, name):
+    return SimpleNamespace(id=role_id, name=name, members=[])
+
+def member(user_id=1, nick=None, global_name=None, name="usuario", roles=()):
+    return SimpleNamespace(id=user_id, nick=nick, global_name=global_name, name=name, roles=list(roles))
+
+TAGS = [
+    {"text": "[CLAN]", "quantity": 2},
+    {"text": "CLAN BR", "quantity": 3},
+    {"text": "★★", "quantity": 1},
+]
+
+def test_tag_matcher_finds_every_pattern():
+    matcher = utils.TagMatcher([("he", 0), ("she", 1), ("hers", 2), ("his", 3)])
+    assert matcher.find("ushers") == {0, 1, 2}
+    assert matcher.find("nada") == frozenset()
+    assert not matcher.may_contain("nada")
+
+def test_calculate_reports_matched_tags():
+    rules = utils.TicketRules({"10": {"quantity": 1, "abbreviation": "V"}}, True, TAGS)
+    tickets = rules.calculate(member(nick="C★LAN br ★★", roles=[role(10, "VIP"), role(11, "Outro")]), 4)
+    assert tickets == {"base": 1, "roles": [10], "tag": 6,
+                       "tags": ["[CLAN]", "CLAN BR", "★★"], "manual_tag": 4}
+
+def test_tag_in_role_name_and_disabled_tags():
+    rules = utils.TicketRules({}, True, TAGS)
+    assert rules.match_tags(member(roles=[role(1, "Membros [clan]")])) == ["[CLAN]"]
+    assert rules.match_name("Usuário [CLAN]") == ["[CLAN]"]
+    assert rules.match_name("usuario") == []
+    assert utils.TicketRules({}, False, TAGS).calculate(member(nick="[CLAN]")) == {"base": 1}
+
+def test_matches_previous_single_tag_calculation():
+    rules = utils.TicketRules({}, True, [{"text": "[CLAN]", "quantity": 2}])
+    for nick, expected in (("[CLAN] Nome", True), ("C★LAN nome", True), ("CL AN", False), (None, False)):
+        assert ("tag" in rules.calculate(member(nick=nick))) is expected
+
+def test_ticket_rules_are_cached_per_config_version():
+    config = {"enabled": True, "tags": TAGS}
+    rules = utils.get_ticket_rules(((1, None), 1), {}, config)
+    assert utils.get_ticket_rules(((1, None), 1), {}, config) is rules
+    assert utils.get_ticket_rules(((1, None), 2), {}, config) is not rules
+
+def test_tag_candidates_reuse_the_names_index():
+    rules = utils.TicketRules({}, True, TAGS)
+    clan_role = role(5, "CLAN BR")
+    members = [member(1, nick="[clan] a"), member(2, nick="outro"), member(3, roles=[clan_role])]
+    index = {}
+    assert rules.tag_candidates(members, [clan_role], index) == {1, 3}
+    assert set(index) == {1, 2, 3}
+    members[1].nick = "clan br"
+    assert rules.tag_candidates(members, [clan_role], index) == {1, 2, 3}
+
+def test_same_tickets_ignores_reported_tags():
+    assert utils.same_tickets({"base": 1, "tag": 2}, {"base": 1, "tag": 2, "tags": ["[CLAN]"]})
+    assert not utils.same_tickets({"base": 1}, {"base": 1, "tag": 2, "tags": ["[CLAN]"]})
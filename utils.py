@@ -1,115 +1,322 @@
+import collections
+import operator
 import re
 import discord
-from typing import Dict, Any, List, Optional
+from typing import Dict, Any, Iterable, List, Optional, Tuple
+
+# caracteres removidos por _clean_text (emojis, pontuação...)
+_NON_WORD = re.compile(r'[^\w\s]')
+_role_id = operator.attrgetter("id")
+_role_name = operator.attrgetter("name")
+_NO_TAGS = frozenset()
 
 def _clean_text(s: Optional[str]) -> str:
     if not s:
         return ""
     # remove emojis/caracteres especiais mantendo letras/números/espacos
-    return re.sub(r'[^\w\s]', '', s).strip().casefold()
+    return _NON_WORD.sub('', s).strip().casefold()
+
+class TagMatcher:
+    """
+    Autômato de Aho-Corasick com os textos das TAGs: uma passada pelo texto encontra
+    todas as TAGs contidas nele, qualquer que seja a quantidade de TAGs cadastradas.
+    
+    Cada padrão tem um rótulo (ex.: o índice da TAG) e find() devolve os rótulos dos
+    padrões encontrados. As transições já incluem os links de falha (autômato
+    determinístico), então cada caractere do texto custa uma consulta a um dict.
+    """
+    __slots__ = ("_delta", "_out", "_any")
+    
+    def __init__(self, patterns: Iterable[Tuple[str, Any]]):
+        patterns = [(text, label) for text, label in patterns if text]
+        goto: List[Dict[str, int]] = [{}]
+        out: List[set] = [set()]
+        for text, label in patterns:
+            state = 0
+            for ch in text:
+                nxt = goto[state].get(ch)
+                if nxt is None:
+                    nxt = goto[state][ch] = len(goto)
+                    goto.append({})
+                    out.append(set())
+                state = nxt
+            out[state].add(label)
+        # links de falha em largura: o estado de falha de cada nó tem profundidade
+        # menor, então já está completo quando o nó é processado
+        delta: List[Dict[str, int]] = [dict(goto[0])] + [None] * (len(goto) - 1)
+        fail = [0] * len(goto)
+        queue = collections.deque(goto[0].values())
+        while queue:
+            state = queue.popleft()
+            delta[state] = {**delta[fail[state]], **goto[state]}
+            out[state] |= out[fail[state]]
+            for ch, nxt in goto[state].items():
+                fail[nxt] = delta[fail[state]].get(ch, 0)
+                queue.append(nxt)
+        self._delta = delta
+        self._out = [frozenset(labels) for labels in out]
+        # filtro em C: a maioria dos textos não contém nenhuma TAG e não precisa
+        # passar pelo autômato (que percorre o texto em Python)
+        self._any = re.compile("|".join(
+            re.escape(text) for text in sorted({text for text, _ in patterns}, key=len, reverse=True)
+        )).search if patterns else None
+    
+    def may_contain(self, text: str) -> bool:
+        """False se text com certeza não contém nenhum padrão (só o filtro em C)."""
+        return self._any is not None and self._any(text) is not None
+    
+    def find(self, text: str) -> frozenset:
+        """Rótulos dos padrões contidos em text."""
+        if self._any is None or not self._any(text):
+            return frozenset()
+        delta, out = self._delta, self._out
+        found: set = set()
+        state = 0
+        for ch in text:
+            state = delta[state].get(ch, 0)
+            if out[state]:
+                found |= out[state]
+        return frozenset(found)
+
+class TicketRules:
+    """
+    Regras de fichas compiladas a partir da configuração do sorteio (cargos bônus e TAGs).
+    
+    Montadas uma vez por versão da configuração (ver get_ticket_rules()) em vez de a
+    cada membro: os ids dos cargos bônus viram um frozenset de int e as TAGs viram
+    autômatos de Aho-Corasick (TagMatcher), então o cálculo de um membro não limpa
+    cada TAG nem percorre a lista de TAGs.
+    """
+    __slots__ = ("role_ids", "tags", "_is_bonus", "_prefilter", "_names", "_symbols", "_raw",
+                 "_role_names", "_tag_roles")
+    
+    def __init__(self, bonus_roles: Dict[str, Any], tag_enabled: bool, tags: List[Dict[str, Any]]):
+        self.role_ids = frozenset(int(role_id) for role_id in bonus_roles)
+        self._is_bonus = self.role_ids.__contains__
+        # (texto, fichas) de cada TAG; os autômatos devolvem os índices desta lista
+        self.tags: List[Tuple[str, int]] = []
+        if tag_enabled:
+            self.tags = [(entry["text"].strip(), int(entry.get("quantity") or 1))
+                         for entry in tags if (entry.get("text") or "").strip()]
+        raw = [(text.casefold(), i) for i, (text, _) in enumerate(self.tags)]
+        clean = [(_clean_text(text), i) for i, (text, _) in enumerate(self.tags)]
+        # nomes: a versão limpa da TAG no nome limpo (um nome com o texto exato da TAG
+        # também contém a versão limpa); TAGs só com símbolos usam o texto exato
+        self._names = TagMatcher(clean)
+        symbols = [(text, i) for (text, i), (cleaned, _) in zip(raw, clean) if not cleaned]
+        self._symbols = TagMatcher(symbols) if symbols else None
+        # filtro em C dos nomes ainda sem limpar: entre os caracteres da versão limpa
+        # pode haver emojis/pontuação, o que equivale a procurá-la no nome limpo; só
+        # quem passa é limpo e vai aos autômatos
+        variants = [r"[^\w\s]*".join(map(re.escape, cleaned)) for cleaned, _ in clean if cleaned]
+        variants += [re.escape(text) for text, _ in symbols]
+        self._prefilter = re.compile("|".join(variants)).search if variants else None
+        # cargos: texto exato da TAG, sem diferenciar maiúsculas
+        self._raw = TagMatcher(raw)
+        # nome de cargo -> índices das TAGs (os cargos do servidor se repetem entre membros)
+        self._role_names: Dict[str, frozenset] = {}
+        # nomes de cargo já vistos que contêm alguma TAG
+        self._tag_roles: set = set()
+    
+    def match_tags(self, member: discord.abc.User) -> List[str]:
+        """
+        Textos das TAGs encontradas nos nomes (nick/global/name) ou nos cargos
+        (role.name) do membro, na ordem da configuração.
+        """
+        if not self.tags:
+            return []
+        return [self.tags[i][0] for i in sorted(self._match(member))]
+    
+    def match_name(self, name: Optional[str]) -> List[str]:
+        """Textos das TAGs encontradas em um nome (ex.: o apelido), na ordem da configuração."""
+        if not self.tags or not name:
+            return []
+        return [self.tags[i][0] for i in sorted(self._match_names(*_normalize_names(name)))]
+    
+    def has_tag(self, member: discord.abc.User) -> bool:
+        """Detecta alguma TAG nos nomes (nick/global/name) ou nos cargos (role.name)."""
+        return bool(self.tags) and bool(self._match(member))
+    
+    def _match_names(self, names: str, cleaned: str) -> frozenset:
+        # ver _normalize_names()
+        found = self._names.find(cleaned)
+        if self._symbols is not None:
+            found |= self._symbols.find(names)
+        return found
+    
+    def _role_tags(self, name: Optional[str]) -> frozenset:
+        matched = self._role_names.get(name)
+        if matched is None:
+            matched = self._role_names[name] = self._raw.find((name or "").strip().casefold())
+            if matched:
+                self._tag_roles.add(name)
+        return matched
+    
+    def _match(self, member: discord.abc.User, roles: Optional[list] = None) -> frozenset:
+        # 1) nomes: uma busca em C no texto unido; só quem passa pelo filtro é limpo
+        names = _joined_names(member).casefold()
+        found = _NO_TAGS
+        if self._prefilter(names):
+            found = self._match_names(names, _NON_WORD.sub("", names))
+        # 2) cargos: com todos os nomes já vistos, a conferência fica em C
+        if roles is None:
+            roles = getattr(member, "roles", None) or ()
+        if roles:
+            role_names = self._role_names
+            names = [*map(_role_name, roles)]
+            if not all(map(role_names.__contains__, names)):
+                for name in names:
+                    self._role_tags(name)
+            tag_roles = self._tag_roles
+            if not tag_roles.isdisjoint(names):
+                for name in names:
+                    if name in tag_roles:
+                        found = found | role_names[name]
+        return found
+    
+    def tag_candidates(self, members: Iterable[discord.Member], roles: Iterable[discord.Role] = (),
+                       names_index: Optional[Dict[int, tuple]] = None) -> set:
+        """
+        IDs dos membros que podem ter alguma TAG: nomes normalizados aprovados pelo
+        filtro em C dos autômatos, ou membros com um dos roles cujo nome contém uma TAG.
+        Não roda o autômato em Python: quem estiver na resposta ainda precisa de calculate().
+        - roles: cargos do servidor (guild.roles); só os cargos dos membros são conferidos
+        - names_index: db.get_member_names(); os nomes normalizados ficam nele e só
+          quem mudou de nome desde a última consulta é normalizado de novo
+        """
+        candidates = set()
+        if not self.tags:
+            return candidates
+        if names_index is None:
+            names_index = {}
+        tag_roles = frozenset(role.id for role in roles if self._role_tags(role.name))
+        for member in members:
+            raw = _joined_names(member)
+            cached = names_index.get(member.id)
+            if cached is None or cached[0] != raw:
+                cached = names_index[member.id] = (raw, *_normalize_names(raw))
+            _, names, cleaned = cached
+            if (self._names.may_contain(cleaned)
+                    or (self._symbols is not None and self._symbols.may_contain(names))
+                    or (tag_roles and not tag_roles.isdisjoint(map(_role_id, member.roles)))):
+                candidates.add(member.id)
+        return candidates
+    
+    def calculate(self, member: discord.abc.User, manual_tag: Optional[int] = None) -> Dict[str, Any]:
+        """
+        Calcula o dicionário de 'tickets' para um membro (ver calculate_tickets()).
+        """
+        tickets: Dict[str, Any] = {"base": 1}
+        # discord.User não tem roles
+        roles = getattr(member, "roles", None) or ()
+        
+        # roles -> apenas os ids dos cargos bônus, filtrados em uma passada em C
+        if roles and self.role_ids:
+            bonus = [*filter(self._is_bonus, map(_role_id, roles))]
+            if bonus:
+                tickets["roles"] = bonus
+        
+        # sem TAGs não há nomes nem cargos a procurar
+        if self.tags:
+            matched = self._match(member, roles)
+            if matched:
+                tickets["tag"] = sum(self.tags[i][1] for i in matched)
+                tickets["tags"] = [self.tags[i][0] for i in sorted(matched)]
+        
+        # Mescla manual_tag se fornecido (útil ao recalcular mantendo o valor manual do DB)
+        if manual_tag:
+            tickets["manual_tag"] = manual_tag
+        return tickets
+
+def _joined_names(member: discord.abc.User) -> str:
+    # display_name é sempre um deles; a quebra de linha é espaço, então uma TAG não
+    # casa atravessando dois nomes
+    return "\n".join(filter(None, (getattr(member, "nick", None),
+                                    getattr(member, "global_name", None),
+                                    getattr(member, "name", None))))
+
+def _normalize_names(raw: str) -> Tuple[str, str]:
+    """(nomes em casefold, versão limpa sem emojis/caracteres especiais)."""
+    names = raw.casefold()
+    return names, _NON_WORD.sub("", names)
+
+# regras compiladas por partição: (versão da configuração, regras)
+_rules_cache: Dict[Any, tuple] = {}
+
+def get_ticket_rules(version: tuple, bonus_roles: Dict[str, Any], tag_config: Dict[str, Any]) -> TicketRules:
+    """
+    Regras compiladas da configuração, reaproveitadas enquanto ela não mudar.
+    - version: db.get_config_version() lido junto com bonus_roles e tag_config
+    """
+    partition, number = version
+    cached = _rules_cache.get(partition)
+    if cached is not None and cached[0] == number:
+        return cached[1]
+    rules = TicketRules(bonus_roles, tag_config["enabled"], tag_config["tags"])
+    if len(_rules_cache) >= 256:
+        _rules_cache.clear()
+    _rules_cache[partition] = (number, rules)
+    return rules
 
 def calculate_tickets(
     member: discord.abc.User,
     bonus_roles: Dict[str, Any],
     tag_enabled: bool,
-    tag_text: Optional[str],
-    tag_quantity: int,
+    tags: List[Dict[str, Any]],
     manual_tag: Optional[int] = None
 ) -> Dict[str, Any]:
     """
     Calcula o dicionário de 'tickets' para um membro.
     - bonus_roles: dict do DB com keys = role_id (str) -> {quantity, abbreviation}
-    - Detecta TAGs tanto em nomes (nick/display/global/name) quanto em roles (role.name).
+    - tags: lista de TAGs do DB ({text, quantity})
+    - tickets['roles'] guarda só os ids (int) dos cargos bônus do membro; quantidade e
+      abreviação são resolvidas na hora de somar/listar (ver db.get_role_lookup()).
+    - Detecta TAGs tanto em nomes (nick/display/global/name, também sem emojis/caracteres
+      especiais) quanto em roles (role.name). tickets['tag'] soma as fichas das TAGs
+      encontradas e tickets['tags'] lista os textos delas (não é gravado no DB).
     - Se manual_tag for fornecido, ele será incluído em tickets['manual_tag'] (útil ao recalcular).
+    
+    Compila as regras a cada chamada; para vários membros use get_ticket_rules().
+    """
+    return TicketRules(bonus_roles, tag_enabled, tags).calculate(member, manual_tag)
+
+def same_tickets(stored: Dict[str, Any], calculated: Dict[str, Any]) -> bool:
+    """
+    True se as fichas calculadas (TicketRules.calculate()) são as já gravadas;
+    tickets['tags'] só informa as TAGs encontradas e não é gravado.
+    """
+    return {k: v for k, v in calculated.items() if k != "tags"} == stored
+
+def _role_entries(tickets: Optional[Dict[str, Any]], role_lookup: Dict[int, tuple]) -> List[tuple]:
+    """
+    (role_id, quantity, abbreviation) dos cargos em tickets['roles'] que ainda são bônus.
+    """
+    entries = []
+    for rid in (tickets or {}).get("roles") or ():
+        info = role_lookup.get(rid)
+        if info:
+            entries.append((rid, info[0], info[1]))
+    return entries
+
+def get_total_tickets(tickets: Optional[Dict[str, Any]], role_lookup: Dict[int, tuple]) -> int:
+    """
+    Total de fichas de um participante.
+    - role_lookup: role_id (int) -> (quantity, abbreviation), de db.get_role_lookup()
     """
-    tickets: Dict[str, Any] = {}
-    tickets["base"] = 1
-
-    # roles -> armazena por id string com quantity e abbreviation
-    roles_dict: Dict[str, Dict[str, Any]] = {}
-    try:
-        member_roles = getattr(member, "roles", []) or []
-        for r in member_roles:
-            rid = str(r.id)
-            if str(r.id) in bonus_roles or rid in bonus_roles:
-                entry = bonus_roles.get(rid) or bonus_roles.get(str(r.id))
-                if entry:
-                    roles_dict[rid] = {
-                        "quantity": int(entry.get("quantity", 0)),
-                        "abbreviation": entry.get("abbreviation", "")
-                    }
-    except Exception:
-        # membro pode ser discord.User (sem roles) — ignora roles
-        member_roles = []
-
-    if roles_dict:
-        tickets["roles"] = roles_dict
-
-    # Detecção da TAG automática em vários campos do membro
-    found = False
-    if tag_enabled and tag_text:
-        tag_search = tag_text.strip()
-        tag_clean = _clean_text(tag_search)
-
-        # 1) checa nomes (display_name, nick, global_name, name)
-        checks = []
-        if hasattr(member, "display_name"):
-            checks.append(getattr(member, "display_name", "") or "")
-        if hasattr(member, "nick"):
-            checks.append(getattr(member, "nick", "") or "")
-        if hasattr(member, "global_name"):
-            checks.append(getattr(member, "global_name", "") or "")
-        checks.append(getattr(member, "name", "") or "")
-
-        for field in checks:
-            if not field:
-                continue
-            f_raw = field.strip().casefold()
-            f_clean = _clean_text(field)
-            if tag_search.casefold() in f_raw or (tag_clean and tag_clean in f_clean):
-                found = True
-                break
-
-        # 2) se não achou nos nomes, checa roles (role.name)
-        if not found:
-            try:
-                for r in member_roles:
-                    rn = (r.name or "").strip()
-                    if not rn:
-                        continue
-                    # compara exatidão ou substring, case-insensitive
-                    if tag_search.casefold() == rn.casefold() or tag_search.casefold() in rn.casefold():
-                        found = True
-                        break
-            except Exception:
-                pass
-
-        if found:
-            tickets["tag"] = int(tag_quantity or 1)
-
-    # Mescla manual_tag se fornecido (útil ao recalcular mantendo o valor manual do DB)
-    if manual_tag is not None and int(manual_tag) > 0:
-        tickets["manual_tag"] = int(manual_tag)
-
-    return tickets
-
-def get_total_tickets(tickets: Optional[Dict[str, Any]]) -> int:
     if not tickets:
         return 1
-    total = int(tickets.get("base", 1))
-    # roles
-    for role_info in tickets.get("roles", {}).values():
-        try:
-            total += int(role_info.get("quantity", 0))
-        except Exception:
-            pass
+    total = tickets.get("base", 1)
+    # roles (quantidade atual do cargo bônus)
+    for _, quantity, _ in _role_entries(tickets, role_lookup):
+        total += quantity
     # tag automatic
-    total += int(tickets.get("tag", 0))
+    total += tickets.get("tag", 0)
     # tag manual (se existir)
-    total += int(tickets.get("manual_tag", 0))
+    total += tickets.get("manual_tag", 0)
     return max(1, total)
 
-def format_tickets_list(tickets: Optional[Dict[str, Any]], guild: Optional[discord.Guild]) -> List[str]:
+def format_tickets_list(tickets: Optional[Dict[str, Any]], guild: Optional[discord.Guild],
+                        role_lookup: Dict[int, tuple]) -> List[str]:
     lines: List[str] = []
     if not tickets:
         lines.append("• Ficha base: 1")
@@ -118,18 +325,9 @@ def format_tickets_list(tickets: Optional[Dict[str, Any]], guild: Optional[disco
     lines.append("• Ficha base: 1")
 
     # cargos (mantém abreviação se presente)
-    roles = tickets.get("roles", {})
-    for rid, info in roles.items():
-        qty = info.get("quantity", 0)
-        abbr = info.get("abbreviation", "")
-        try:
-            if guild:
-                role_obj = guild.get_role(int(rid))
-                role_name = role_obj.name if role_obj else f"Cargo ({rid})"
-            else:
-                role_name = f"Cargo ({rid})"
-        except Exception:
-            role_name = f"Cargo ({rid})"
+    for rid, qty, abbr in _role_entries(tickets, role_lookup):
+        role_obj = guild.get_role(rid) if guild else None
+        role_name = role_obj.name if role_obj else f"Cargo ({rid})"
         lines.append(f"• {qty} ficha(s) por cargo: {role_name} {f'({abbr})' if abbr else ''}".strip())
 
     # TAG automática
@@ -144,7 +342,8 @@ def format_tickets_list(tickets: Optional[Dict[str, Any]], guild: Optional[disco
 
     return lines
 
-def format_detailed_entry(first_name: str, last_name: str, tickets: Dict[str, Any], guild: Optional[discord.Guild] = None) -> List[str]:
+def format_detailed_entry(first_name: str, last_name: str, tickets: Dict[str, Any], guild: Optional[discord.Guild] = None,
+                          role_lookup: Optional[Dict[int, tuple]] = None) -> List[str]:
     """
     Formata uma entrada detalhada usada em /lista com_fichas e /exportar com_fichas.
     Gera:
@@ -160,27 +359,20 @@ def format_detailed_entry(first_name: str, last_name: str, tickets: Dict[str, An
     lines.append(name)
 
     # cargos: uma linha por cargo (usa abreviação se existir, senão nome do cargo quando guild for fornecido)
-    roles = tickets.get("roles", {}) if tickets else {}
-    for rid, info in roles.items():
-        abbr = (info.get("abbreviation") or "").strip()
+    for rid, _, abbr in _role_entries(tickets, role_lookup or {}):
+        abbr = abbr.strip()
         suffix = abbr if abbr else None
         if not suffix:
-            if guild:
-                try:
-                    role_obj = guild.get_role(int(rid))
-                    suffix = role_obj.name if role_obj else f"Cargo_{rid}"
-                except Exception:
-                    suffix = f"Cargo_{rid}"
-            else:
-                suffix = f"Cargo_{rid}"
+            role_obj = guild.get_role(rid) if guild else None
+            suffix = role_obj.name if role_obj else f"Cargo_{rid}"
         lines.append(f"{name} {suffix}")
 
     # TAG automática (aparece como uma linha separada)
-    if tickets and int(tickets.get("tag", 0)) > 0:
+    if tickets and tickets.get("tag", 0) > 0:
         lines.append(f"{name} TAG")
 
     # TAG manual (também aparece como linha separada)
-    if tickets and int(tickets.get("manual_tag", 0)) > 0:
+    if tickets and tickets.get("manual_tag", 0) > 0:
         # se já existe TAG automática e você não quer duplicar, remova a checagem abaixo
         # aqui adicionamos sempre que manual_tag estiver presente
         lines.append(f"{name} TAG")